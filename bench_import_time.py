@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import the engine.
+
+Runs `python -X importtime -c "import <module>"` several times in new processes and reports
+the median total, the slowest modules of the last run and any heavy optional dependency
+that got imported although no pipeline step needs it yet.
+
+    python bench_import_time.py                       # core.prompt_engine and main
+    python bench_import_time.py core --runs 10
+    python bench_import_time.py --budget-ms 400       # exit 1 if a median is over budget
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# Optional dependencies that must only load when a pipeline uses them
+HEAVY_MODULES = (
+    'faiss', 'sentence_transformers', 'torch', 'transformers', 'chromadb', 'llama_index',
+    'sqlalchemy', 'openpyxl', 'pandas', 'numpy', 'pdfplumber', 'ollama',
+)
+
+_PROBE = (
+    "import json, sys\n"
+    "import {module}\n"
+    "print(json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)))\n"
+)
+
+
+def measure(module, runs=5):
+    """Median import time in ms of `module` in fresh interpreters, plus per-module timings of the last run"""
+    totals = []
+    timings = {}
+    heavy = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        heavy = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings = {}
+        for line in proc.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            timings[name.strip()] = int(cumulative) / 1000
+        totals.append(timings.get(module, 0.0))
+    return {
+        'module': module,
+        'median_ms': round(statistics.median(totals), 1),
+        'runs_ms': [round(t, 1) for t in totals],
+        'slowest': sorted(((ms, name) for name, ms in timings.items()), reverse=True)[:10],
+        'heavy_modules': heavy,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the engine")
+    parser.add_argument('modules', nargs='*', default=['core.prompt_engine', 'main'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, help='Fail if any median import time exceeds this')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        result = measure(module, args.runs)
+        print(f"{module}: median {result['median_ms']:.1f} ms over {args.runs} runs {result['runs_ms']}")
+        for ms, name in result['slowest']:
+            print(f"  {ms:8.1f} ms  {name}")
+        if result['heavy_modules']:
+            print(f"  heavy dependencies imported: {', '.join(result['heavy_modules'])}")
+            failed = True
+        if args.budget_ms and result['median_ms'] > args.budget_ms:
+            print(f"  over budget ({args.budget_ms:.0f} ms)")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
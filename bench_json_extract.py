@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+JSON salvage benchmark: time to recover the payload of large malformed LLM responses.
+
+Builds responses of N records wrapped the way models produce them (prose, ``` fence,
+trailing commas, cut off mid-record; only fenced with --well-formed) and times
+core.json_scanner.extract_json against the approaches it replaced: the nested-brace regex
+of LLMProcessor._extract_json_from_response and the prefix trimming of fix.py (quadratic,
+so only run on small inputs). --scaling times extract_json on text full of broken candidates
+at two sizes instead: the time ratio stays near the size ratio when the scan is linear.
+
+    python bench_json_extract.py                          # 100, 1000 and 10000 records
+    python bench_json_extract.py --records 50000 --runs 1
+    python bench_json_extract.py --well-formed
+    python bench_json_extract.py --scaling
+"""
+
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+
+from core.json_scanner import extract_json
+
+# Inputs larger than this are skipped for the quadratic prefix trimming
+PREFIX_MAX_CHARS = 20000
+
+
+def llm_response(records, well_formed=False):
+    """An LLM-style answer holding `records` requirements: fenced and, unless well_formed,
+    with trailing commas and cut off inside the last record"""
+    comma = "" if well_formed else ","
+    items = []
+    for i in range(records):
+        items.append(
+            '    {"clause": "1.%d METERS", "features": ["Voltage ±0.5%%", "Current {per phase}"%s], '
+            '"text": "Line %d\\nwith \\"quotes\\" and [brackets]"}' % (i, comma, i)
+        )
+    body = ",\n".join(items)
+    text = 'Here are the requirements:\n```json\n{"requirements": [\n' + body + '\n]}\n```\nLet me know!'
+    if well_formed:
+        return text
+    # Cut inside the last record, as when num_predict runs out
+    return text[:len(text) - len(items[-1]) // 2 - 30]
+
+
+# Inputs that used to take quadratic time: candidates closed by the wrong bracket, and
+# arrays opened but never closed
+BROKEN = {
+    'mismatched': '{"a": [1, 2, 3}, ',
+    'unclosed': '[ "x", ',
+}
+
+
+def legacy_regex(text):
+    pattern = re.compile(r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}', re.DOTALL)
+    matches = pattern.findall(text)
+    matches.sort(key=len, reverse=True)
+    for match in matches:
+        try:
+            return json.loads(match)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def legacy_prefix(text):
+    raw = re.sub(r"^```json\s*|```$", "", text.strip(), flags=re.MULTILINE)
+    raw = re.sub(r",\s*([\]}])", r"\1", raw)
+    for end in range(len(raw), 0, -1):
+        try:
+            return json.loads(raw[:end].rstrip())
+        except Exception:
+            continue
+    return None
+
+
+def _records(value):
+    if isinstance(value, dict) and isinstance(value.get('requirements'), list):
+        return len(value['requirements'])
+    return 0
+
+
+def measure(records, runs=3, well_formed=False):
+    """Median ms and recovered record count of each approach on one response"""
+    text = llm_response(records, well_formed)
+    approaches = {'extract_json': extract_json, 'legacy_regex': legacy_regex}
+    if len(text) <= PREFIX_MAX_CHARS:
+        approaches['legacy_prefix'] = legacy_prefix
+    results = {}
+    for name, func in approaches.items():
+        times = []
+        value = None
+        for _ in range(runs):
+            started = time.perf_counter()
+            value = func(text)
+            times.append((time.perf_counter() - started) * 1000)
+        results[name] = {'median_ms': round(statistics.median(times), 2), 'records': _records(value)}
+    return {'records': records, 'chars': len(text), 'results': results}
+
+
+def scaling(repeats=2000, factor=4, runs=3):
+    """Best ms of extract_json on each BROKEN pattern repeated `repeats` and factor * repeats
+    times, and their ratio (about `factor` when the scan is linear, factor**2 when quadratic)"""
+    results = {}
+    for name, pattern in BROKEN.items():
+        times = []
+        for size in (repeats, repeats * factor):
+            text = pattern * size
+            best = None
+            for _ in range(runs):
+                started = time.perf_counter()
+                extract_json(text)
+                elapsed = (time.perf_counter() - started) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            times.append(best)
+        results[name] = {'small_ms': round(times[0], 2), 'large_ms': round(times[1], 2),
+                         'ratio': round(times[1] / max(times[0], 1e-6), 2)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark JSON recovery from malformed LLM output")
+    parser.add_argument('--records', type=int, nargs='*', default=[100, 1000, 10000])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--well-formed', action='store_true', help='Fenced but otherwise valid JSON')
+    parser.add_argument('--scaling', action='store_true', help='Time ratio on broken input of two sizes')
+    args = parser.parse_args(argv)
+
+    if args.scaling:
+        for name, stats in scaling(runs=args.runs).items():
+            print(f"  {name:12s} {stats['small_ms']:10.2f} ms -> {stats['large_ms']:10.2f} ms  "
+                  f"ratio {stats['ratio']:.2f} (input x4)")
+        return 0
+
+    for records in args.records:
+        result = measure(records, args.runs, args.well_formed)
+        print(f"{records} records ({result['chars']} chars):")
+        for name, stats in result['results'].items():
+            print(f"  {name:14s} {stats['median_ms']:10.2f} ms  recovered {stats['records']} records")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,19 +3,31 @@
 Core modules for the YAML Prompt Engine with Auto-Discovery
 """
 
-from .prompt_engine import PromptEngine
-from .database_autodiscovery import DatabaseAutoDiscovery, SmartDatabaseWrapper
-from .function_registry import DatabaseFunctionRegistry
-from .template_analyzer import TemplateAnalyzer
-from .file_processor import FileProcessor
-from .llm_processor import LLMProcessor
+import importlib
 
-__all__ = [
-    'PromptEngine',
-    'DatabaseAutoDiscovery', 
-    'SmartDatabaseWrapper',
-    'DatabaseFunctionRegistry',
-    'TemplateAnalyzer',
-    'FileProcessor',
-    'LLMProcessor',
-]
\ No newline at end of file
+# Public name -> submodule. Submodules are imported on first attribute access, so
+# `import core` (or importing one light submodule) does not load the whole engine.
+_LAZY_EXPORTS = {
+    'PromptEngine': 'prompt_engine',
+    'DatabaseAutoDiscovery': 'database_autodiscovery',
+    'SmartDatabaseWrapper': 'database_autodiscovery',
+    'DatabaseFunctionRegistry': 'function_registry',
+    'TemplateAnalyzer': 'template_analyzer',
+    'FileProcessor': 'file_processor',
+    'LLMProcessor': 'llm_processor',
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
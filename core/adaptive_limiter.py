@@ -0,0 +1,138 @@
+# core/adaptive_limiter.py
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Optional, Tuple
+
+
+class AdaptiveLimiter:
+    """AIMD limit on concurrent LLM requests that settles where the server's throughput peaks.
+
+    After every window of completed requests the limiter compares throughput (completion
+    tokens/s, or requests/s when the server reports no token counts) with the previous window:
+      - throughput improved                     -> limit + 1 (additive increase)
+      - mean latency above tolerance x the best -> limit x backoff (multiplicative decrease)
+        seen so far, or throughput fell
+      - a request timed out, or the server      -> limit x backoff at once (at most once per
+        failed (5xx, 429, dropped connection)      window of completed requests)
+    Runs on one event loop; the limit is shared by every step using the same LLMProcessor.
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 16,
+                 window: int = 4, backoff: float = 0.7, latency_tolerance: float = 2.0,
+                 gain_threshold: float = 0.05):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.window = max(1, window)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.gain_threshold = gain_threshold
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.best_latency: Optional[float] = None
+        self.last_throughput: Optional[float] = None
+        self._samples: List[Tuple[float, Optional[int]]] = []
+        # Completions to see before another failure backs off: the requests in flight when one
+        # fails usually fail together, and that is one overload, not several
+        self._failure_cooldown = 0
+        self._window_started: Optional[float] = None
+        self._waiters: List[asyncio.Future] = []
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Woken, then cancelled before taking the slot: pass the wakeup on
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        if self._window_started is None:
+            self._window_started = time.perf_counter()
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        for waiter in list(self._waiters):
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def record(self, seconds: float, completion_tokens: Optional[int] = None, ok: bool = True):
+        """Feed back one finished request: its latency, completion tokens, and whether it succeeded"""
+        if self._failure_cooldown:
+            self._failure_cooldown -= 1
+            if not ok:
+                return
+        elif not ok:
+            self._failure_cooldown = max(self.window, int(self.limit))
+            self._decrease("request failed or timed out")
+            return
+        self._samples.append((seconds, completion_tokens))
+        if len(self._samples) >= max(self.window, int(self.limit)):
+            self._evaluate()
+
+    def _evaluate(self):
+        elapsed = max(time.perf_counter() - (self._window_started or time.perf_counter()), 1e-6)
+        if all(tokens for _, tokens in self._samples):
+            throughput = sum(tokens for _, tokens in self._samples) / elapsed
+        else:
+            throughput = len(self._samples) / elapsed
+        mean_latency = sum(seconds for seconds, _ in self._samples) / len(self._samples)
+        self.best_latency = mean_latency if self.best_latency is None else min(self.best_latency, mean_latency)
+        previous = self.last_throughput
+        self.last_throughput = throughput
+        self._samples = []
+        self._window_started = time.perf_counter()
+
+        if mean_latency > self.best_latency * self.latency_tolerance:
+            self._decrease(f"latency {mean_latency:.2f}s vs best {self.best_latency:.2f}s")
+        elif previous is not None and throughput < previous * (1 - 2 * self.gain_threshold):
+            self._decrease(f"throughput fell to {throughput:.1f}/s from {previous:.1f}/s")
+        elif previous is None or throughput > previous * (1 + self.gain_threshold):
+            if self.limit < self.max_limit:
+                self.limit += 1
+                self.increases += 1
+                self._wake()
+
+    def _decrease(self, reason: str):
+        new_limit = max(float(self.min_limit), float(int(self.limit * self.backoff)))
+        if new_limit < self.limit:
+            print(f"[LLM] Concurrency {int(self.limit)} -> {int(new_limit)}: {reason}")
+            self.limit = new_limit
+            self.decreases += 1
+        # Start over: the next window is measured at the new limit
+        self._samples = []
+        self._window_started = time.perf_counter() if self.in_flight else None
+        self.last_throughput = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'increases': self.increases,
+            'decreases': self.decreases,
+            'throughput': round(self.last_throughput, 2) if self.last_throughput is not None else None,
+            'best_latency': round(self.best_latency, 3) if self.best_latency is not None else None,
+        }
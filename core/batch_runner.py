@@ -0,0 +1,125 @@
+# core/batch_runner.py
+import json
+import time
+import asyncio
+import glob
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import yaml
+
+from .prompt_engine import PromptEngine
+from . import model_registry
+
+
+class BatchRunner:
+    """Run one pipeline over many input documents on a single warm PromptEngine"""
+
+    def __init__(self, engine: PromptEngine, prompt_config_path: str, input_name: Optional[str] = None,
+                 max_parallel: int = 2, inputs: Optional[Dict[str, Any]] = None,
+                 deadline: Optional[float] = None):
+        self.engine = engine
+        self.prompt_config_path = str(prompt_config_path)
+        self.input_name = input_name or self.find_file_input(self.prompt_config_path)
+        self.max_parallel = max(1, int(max_parallel))
+        # Inputs shared by every document (e.g. llm_model)
+        self.inputs = inputs or {}
+        # Per-document run deadline in seconds (None: the pipeline's or RUN_DEADLINE)
+        self.deadline = deadline
+
+    @staticmethod
+    def find_file_input(prompt_config_path: str) -> str:
+        """Name of the first `type: file` input of a pipeline, which receives each document"""
+        with open(prompt_config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+        for input_spec in config.get('inputs', []) or []:
+            if input_spec.get('type') == 'file':
+                return input_spec['name']
+        raise ValueError(f"{prompt_config_path} has no file input; pass input_name explicitly")
+
+    @staticmethod
+    def resolve_documents(pattern: str) -> List[Path]:
+        """Files in a directory (non-recursive) or matching a glob pattern, sorted by path"""
+        path = Path(pattern)
+        if path.is_dir():
+            files = [p for p in path.iterdir() if p.is_file()]
+        else:
+            files = [Path(p) for p in glob.glob(pattern, recursive=True) if Path(p).is_file()]
+        return sorted(files)
+
+    async def run(self, documents: List[Path], batch_dir: Optional[Path] = None) -> Dict[str, Any]:
+        """Run every document, at most max_parallel at a time, and write the batch summary"""
+        stamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        if batch_dir is None:
+            batch_dir = self.engine.outputs_dir / "batches" / f"{Path(self.prompt_config_path).stem}_{stamp}"
+        batch_dir = Path(batch_dir)
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        slots = asyncio.Semaphore(self.max_parallel)
+        started = time.perf_counter()
+
+        async def run_document(index: int, document: Path) -> Dict[str, Any]:
+            async with slots:
+                # Each document gets its own output folder so same-second timestamps cannot collide
+                output_dir = batch_dir / f"{index:03d}_{document.stem}"
+                doc_start = time.perf_counter()
+                print(f"[BATCH] Starting {document.name}")
+                try:
+                    result = await self.engine.run_prompt(
+                        self.prompt_config_path, output_dir=str(output_dir), deadline=self.deadline,
+                        **{**self.inputs, self.input_name: str(document)}
+                    )
+                except Exception as e:
+                    result = {'success': False, 'error': str(e)}
+                doc_end = time.perf_counter()
+            metrics = result.get('metrics') or {}
+            entry = {
+                'document': str(document),
+                'success': bool(result.get('success')),
+                'error': result.get('error'),
+                'run_id': result.get('run_id'),
+                'output_files': result.get('output_files', []),
+                'start': round(doc_start - started, 3),
+                'duration': round(doc_end - doc_start, 3),
+                'pipeline_wall_time': metrics.get('wall_time'),
+                'critical_path': metrics.get('critical_path'),
+                'step_durations': {name: step.get('duration') for name, step in (metrics.get('steps') or {}).items()},
+            }
+            status = "ok" if entry['success'] else f"failed: {entry['error']}"
+            print(f"[BATCH] Finished {document.name} in {entry['duration']:.1f}s ({status})")
+            return entry
+
+        entries = await asyncio.gather(*(run_document(i, doc) for i, doc in enumerate(documents)))
+        summary = {
+            'prompt_config_path': self.prompt_config_path,
+            'input_name': self.input_name,
+            'max_parallel': self.max_parallel,
+            'documents': list(entries),
+            'succeeded': sum(1 for e in entries if e['success']),
+            'failed': sum(1 for e in entries if not e['success']),
+            'wall_time': round(time.perf_counter() - started, 3),
+            'model_load_times': model_registry.stats(),
+            'summary_dir': str(batch_dir),
+        }
+        self.write_summary(summary, batch_dir)
+        return summary
+
+    @staticmethod
+    def write_summary(summary: Dict[str, Any], batch_dir: Path):
+        """Write summary.json and a human-readable summary.txt"""
+        with open(batch_dir / "summary.json", 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, default=str)
+        lines = [
+            f"Pipeline: {summary['prompt_config_path']}",
+            f"Documents: {len(summary['documents'])} ({summary['succeeded']} succeeded, {summary['failed']} failed)",
+            f"Parallel documents: {summary['max_parallel']}",
+            f"Wall time: {summary['wall_time']:.1f}s",
+            "",
+            f"{'Document':40} {'Status':8} {'Seconds':>8}  Outputs / error",
+        ]
+        for entry in summary['documents']:
+            detail = ", ".join(Path(p).name for p in entry['output_files']) if entry['success'] else entry['error']
+            lines.append(f"{Path(entry['document']).name[:40]:40} {'ok' if entry['success'] else 'FAILED':8} "
+                         f"{entry['duration']:8.1f}  {detail}")
+        with open(batch_dir / "summary.txt", 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
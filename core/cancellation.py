@@ -0,0 +1,138 @@
+# core/cancellation.py
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, List, Optional, Tuple
+
+# Cancel token of the run executing in this task (None outside runs)
+_active_token: contextvars.ContextVar = contextvars.ContextVar('active_cancel_token', default=None)
+
+
+class RunCancelled(Exception):
+    """A run was cancelled or passed its deadline; `partial` holds whatever the interrupted step finished"""
+
+    def __init__(self, reason: str, partial: Any = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial = partial
+
+
+class CancelToken:
+    """Cooperative cancellation and an optional deadline for one pipeline run.
+
+    cancel() may be called from any thread (e.g. an HTTP handler of the job service).
+    Awaits wrapped in guard() return as soon as the token is cancelled or the deadline
+    passes; the loop between steps and foreach items checks `cancelled` before starting work.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.reason: Optional[str] = None
+        self.deadline: Optional[float] = None
+        self.deadline_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+        self._events: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        if deadline:
+            self.start_deadline(deadline)
+
+    def start_deadline(self, seconds: float):
+        """Cancel the run `seconds` from now"""
+        self.deadline_seconds = seconds
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            events = list(self._events)
+        print(f"[CANCEL] {reason}")
+        for loop, event in events:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self._expire()
+        return self.reason is not None
+
+    def _expire(self):
+        self.cancel(f"deadline of {self.deadline_seconds:g}s exceeded")
+
+    def check(self):
+        """Raise RunCancelled if the run was cancelled or is past its deadline"""
+        if self.cancelled:
+            raise RunCancelled(self.reason)
+
+    def _event(self) -> asyncio.Event:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for event_loop, event in self._events:
+                if event_loop is loop:
+                    return event
+            event = asyncio.Event()
+            if self.reason is not None:
+                event.set()
+            self._events.append((loop, event))
+            return event
+
+    async def guard(self, awaitable: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Await `awaitable`, abandoning it (cancelling its task) on cancellation, deadline or timeout.
+
+        Raises RunCancelled on cancellation or deadline, asyncio.TimeoutError after `timeout` seconds.
+        """
+        self.check()
+        task = asyncio.ensure_future(awaitable)
+        waiter = asyncio.ensure_future(self._event().wait())
+        remaining = self.remaining()
+        limits = [limit for limit in (timeout, remaining) if limit is not None]
+        abandoned = True
+        try:
+            await asyncio.wait({task, waiter}, timeout=min(limits) if limits else None,
+                               return_when=asyncio.FIRST_COMPLETED)
+            abandoned = not task.done()
+        finally:
+            waiter.cancel()
+            if abandoned:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if not abandoned:
+            return task.result()
+        if remaining is not None and (timeout is None or remaining <= timeout) and self.reason is None:
+            # The loop timer may fire a hair before the deadline; the deadline was the limit that expired
+            self._expire()
+        self.check()
+        raise asyncio.TimeoutError(f"timed out after {timeout}s")
+
+    @contextmanager
+    def activate(self):
+        """Make this the token of the run executing in this task and the tasks it spawns"""
+        token = _active_token.set(self)
+        try:
+            yield self
+        finally:
+            _active_token.reset(token)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _active_token.get()
+
+
+def is_cancelled() -> bool:
+    token = _active_token.get()
+    return token is not None and token.cancelled
+
+
+async def guarded(awaitable: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Await with the active run's cancellation and deadline, plus an optional per-call timeout"""
+    token = _active_token.get()
+    if token is None:
+        return await asyncio.wait_for(awaitable, timeout)
+    return await token.guard(awaitable, timeout)
@@ -1,4 +1,3 @@
-import chromadb
 from typing import Dict, List, Any
 import json
 import re
@@ -47,6 +46,7 @@ class ChromaProcessor:
             print(f"[ERROR] query_chromadb failed for '{query}': {e}")
             return []
     def __init__(self, chroma_config: Dict[str, str], embedding_model_path: str = r'C:\Users\cyqt2\Database\overhaul\jina_reranker\minilm-embedding'):
+        import chromadb
         self.collections = {}
         self.clients = {}
         self.embedding_model_path = embedding_model_path
@@ -6,6 +6,11 @@ Edit this file to change model/database/output locations for local/server use.
 import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+# Load environment variables from .env before any setting below reads them
+load_dotenv()
+
 # Base directory (relative to this file)
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -57,4 +62,128 @@ EXAMPLE_PDF_PATH = os.environ.get(
     str(BASE_DIR / "overhaul" / "examples" / "redacted_output.pdf")
 )
 
+
+# Pipeline execution
+# Upper bound on foreach items processed concurrently across the whole engine;
+# a step's `concurrency:` setting is clamped to this value
+FOREACH_MAX_CONCURRENCY = int(os.environ.get("FOREACH_MAX_CONCURRENCY", "8"))
+
+# Step result cache (replays unchanged upstream steps on re-runs)
+STEP_CACHE_ENABLED = os.environ.get("STEP_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+STEP_CACHE_PATH = os.environ.get(
+    "STEP_CACHE_PATH",
+    str(BASE_DIR / "cache" / "step_cache.sqlite")
+)
+STEP_CACHE_MAX_BYTES = int(os.environ.get("STEP_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Checkpoint every finished step and foreach item under outputs/runs/<run_id>/ so runs can be resumed
+CHECKPOINT_RUNS = os.environ.get("CHECKPOINT_RUNS", "1").lower() in ("1", "true", "yes")
+
+# Worker processes for python/run steps declared with `executor: process`
+PYTHON_STEP_WORKERS = int(os.environ.get("PYTHON_STEP_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Documents processed at the same time by `main.py --batch`
+BATCH_MAX_PARALLEL = int(os.environ.get("BATCH_MAX_PARALLEL", "2"))
+
+# Resident job service (`main.py --serve`)
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(os.environ.get("SERVICE_WORKERS", "2"))
+# Finished jobs kept in memory for status queries (their output files stay on disk)
+SERVICE_MAX_JOBS = int(os.environ.get("SERVICE_MAX_JOBS", "1000"))
+
+# Write a Chrome trace (<run>_trace.json) and span summary (<run>_trace_summary.txt) next to each run's outputs
+TRACE_RUNS = os.environ.get("TRACE_RUNS", "1").lower() in ("1", "true", "yes")
+
+# Dry-run planner: past per-model throughput and per-step costs (fed by traced runs),
+# and the assumptions used before a model has any history
+PERF_HISTORY_PATH = os.environ.get("PERF_HISTORY_PATH", str(BASE_DIR / "cache" / "perf_history.json"))
+PLANNER_PROMPT_TPS = float(os.environ.get("PLANNER_PROMPT_TPS", "400"))
+PLANNER_DECODE_TPS = float(os.environ.get("PLANNER_DECODE_TPS", "20"))
+PLANNER_DEFAULT_COMPLETION_TOKENS = int(os.environ.get("PLANNER_DEFAULT_COMPLETION_TOKENS", "300"))
+
+# Whole-run deadline in seconds (0: none); a pipeline's `deadline:` key or run_prompt(deadline=...) override it.
+# Past the deadline in-flight LLM calls are abandoned, pending work is skipped and partial outputs are written.
+RUN_DEADLINE = float(os.environ.get("RUN_DEADLINE", "0"))
+
+# Ollama server and the pooled HTTP client each LLMProcessor keeps. Per-call timeouts come from
+# the step's `timeout:`; the read timeout only bounds a single silent response.
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "10"))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "600"))
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "16"))
+# Seconds an idle pooled connection is kept open for the next request
+OLLAMA_KEEPALIVE_EXPIRY = float(os.environ.get("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+
+# Adaptive (AIMD) limit on concurrent requests per LLM model: starts at the initial value, grows while
+# throughput improves and backs off on timeouts or latency spikes. Set foreach `concurrency:` at or
+# above the maximum to let the limiter find the server's best level.
+LLM_ADAPTIVE_CONCURRENCY = os.environ.get("LLM_ADAPTIVE_CONCURRENCY", "1").lower() in ("1", "true", "yes")
+LLM_INITIAL_CONCURRENCY = int(os.environ.get("LLM_INITIAL_CONCURRENCY", "4"))
+LLM_MIN_CONCURRENCY = int(os.environ.get("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+
+# LLM response cache (opt-in): identical prompts to the same model and options are answered from
+# a local SQLite file. Entries expire after LLM_CACHE_TTL seconds (0: never); steps with
+# `cache: false` always call the model.
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", str(BASE_DIR / "cache" / "llm_cache.sqlite"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Stream LLM responses and close the request as soon as a complete JSON object or array has
+# arrived, instead of waiting for the model to finish (steps set `stream:` to override).
+LLM_STREAM = os.environ.get("LLM_STREAM", "0").lower() in ("1", "true", "yes")
+
+# The llm_breakdown_features step condenses this many distinct features per LLM call (a step's
+# `batch_size:` overrides it). Features the model skipped or answered badly are retried, in
+# smaller batches, up to BREAKDOWN_MAX_RETRIES more times.
+BREAKDOWN_BATCH_SIZE = int(os.environ.get("BREAKDOWN_BATCH_SIZE", "10"))
+BREAKDOWN_MAX_RETRIES = int(os.environ.get("BREAKDOWN_MAX_RETRIES", "2"))
+
+# Context window per LLM request: prompt tokens plus the expected output (a step's `max_tokens:`,
+# default LLM_MAX_TOKENS), rounded up to one of LLM_CONTEXT_BUCKETS. Ollama reloads the model for
+# every new size, so keep the buckets few. Prompts are counted with LLM_TOKENIZER (a tokenizer.json
+# path or HuggingFace name; `pip install tokenizers`) when set, else estimated. Prompts that cannot fit the
+# largest bucket fail without calling the model; foreach steps with `overflow: split` split the item.
+LLM_TOKENIZER = os.environ.get("LLM_TOKENIZER", "")
+LLM_CONTEXT_BUCKETS = [int(size) for size in os.environ.get("LLM_CONTEXT_BUCKETS", "2048,8192,32768").split(",")
+                       if size.strip()]
+LLM_MAX_TOKENS = int(os.environ.get("LLM_MAX_TOKENS", "4096"))
+
+# Several Ollama daemons serving the same models (comma-separated URLs). When set, requests go to
+# the endpoint with the fewest in flight, preferring those with the model already loaded; an
+# endpoint failing LLM_ROUTER_FAILURE_THRESHOLD times in a row is skipped for LLM_ROUTER_COOLDOWN
+# seconds. Endpoints are health-checked every LLM_ROUTER_HEALTH_INTERVAL seconds (0: never).
+OLLAMA_ENDPOINTS = [url.strip() for url in os.environ.get("OLLAMA_ENDPOINTS", "").split(",") if url.strip()]
+LLM_ROUTER_FAILURE_THRESHOLD = int(os.environ.get("LLM_ROUTER_FAILURE_THRESHOLD", "3"))
+LLM_ROUTER_COOLDOWN = float(os.environ.get("LLM_ROUTER_COOLDOWN", "30"))
+LLM_ROUTER_HEALTH_INTERVAL = float(os.environ.get("LLM_ROUTER_HEALTH_INTERVAL", "15"))
+
+# Retries of failed LLM calls (a step's `retry:` overrides): up to LLM_RETRY_ATTEMPTS attempts in total
+# for the error classes in LLM_RETRY_ON (timeout, connection, server, client, invalid_json), waiting
+# LLM_RETRY_BACKOFF seconds doubled per attempt (at most LLM_RETRY_MAX_BACKOFF), minus up to
+# LLM_RETRY_JITTER of it at random. With LLM_HEDGE (or a step's `hedge:`) a call still running past the
+# LLM_HEDGE_QUANTILE of the step's observed latencies is duplicated and the first answer wins; hedging
+# starts once LLM_HEDGE_MIN_SAMPLES calls of the step have completed.
+LLM_RETRY_ATTEMPTS = int(os.environ.get("LLM_RETRY_ATTEMPTS", "2"))
+LLM_RETRY_BACKOFF = float(os.environ.get("LLM_RETRY_BACKOFF", "1"))
+LLM_RETRY_MAX_BACKOFF = float(os.environ.get("LLM_RETRY_MAX_BACKOFF", "30"))
+LLM_RETRY_JITTER = float(os.environ.get("LLM_RETRY_JITTER", "0.5"))
+LLM_RETRY_ON = [name.strip() for name in os.environ.get("LLM_RETRY_ON", "connection,server").split(",")
+                if name.strip()]
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0").lower() in ("1", "true", "yes")
+LLM_HEDGE_QUANTILE = float(os.environ.get("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "10"))
+
+# Models a pipeline calls (its LLM steps' `model:` keys and the run's model) are loaded in parallel
+# when the run starts (a pipeline's `preload_models: false` turns it off). Ollama keeps each one
+# loaded for LLM_KEEP_ALIVE while the run still has steps for it; after its last step the keep-alive
+# drops to LLM_KEEP_ALIVE_IDLE (empty: the server default), or the model is unloaded at once when
+# other models are still to run. Pipelines set `model_affinity: false` to schedule steps without
+# grouping them by model.
+LLM_PRELOAD_MODELS = os.environ.get("LLM_PRELOAD_MODELS", "1").lower() in ("1", "true", "yes")
+LLM_KEEP_ALIVE = os.environ.get("LLM_KEEP_ALIVE", "30m")
+LLM_KEEP_ALIVE_IDLE = os.environ.get("LLM_KEEP_ALIVE_IDLE", "")
+
 # Add more config variables as needed
@@ -1,8 +1,6 @@
 import json
-import pandas as pd
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils.dataframe import dataframe_to_rows
 from pathlib import Path
 
 class ExcelGenerator:
@@ -0,0 +1,60 @@
+# core/item_stream.py
+import asyncio
+from typing import Any, AsyncIterator, List, Optional, Set, Tuple
+
+
+class ItemStream:
+    """Per-item results of a foreach step, published as they finish.
+
+    Steps declaring `stream_from: <step>` iterate the stream instead of waiting for the
+    whole upstream list. Every event is kept, so a consumer that starts late (or a
+    sequential run) still sees all items, and several consumers can share one stream.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._events: List[Tuple[int, Any, Any]] = []
+        self._published: Set[int] = set()
+        self._closed = False
+        self._changed = asyncio.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _notify(self):
+        # Waiters hold the old event; swapping it avoids one consumer clearing another's wake-up
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, index: int, source: Any, result: Any):
+        """Publish the result of upstream item `index` (computed from `source`)"""
+        if self._closed or index in self._published:
+            return
+        self._published.add(index)
+        self._events.append((index, source, result))
+        self._notify()
+
+    def close(self, results: Optional[List[Any]] = None, sources: Optional[List[Any]] = None):
+        """End the stream, first publishing any items of `results` that were not streamed
+        (e.g. when the upstream step was replayed from the step cache or a checkpoint)"""
+        if self._closed:
+            return
+        if isinstance(results, list):
+            for index, result in enumerate(results):
+                source = sources[index] if sources and index < len(sources) else None
+                self.publish(index, source, result)
+        self._closed = True
+        self._notify()
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[int, Any, Any]]:
+        """Yield (index, source item, result) in completion order until the stream is closed"""
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self._events):
+                yield self._events[position]
+                position += 1
+            if self._closed:
+                return
+            await changed.wait()
@@ -0,0 +1,262 @@
+# core/json_scanner.py
+import re
+import json
+from typing import Any, Iterator, List, Optional, Tuple
+
+_CLOSERS = {'{': '}', '[': ']'}
+_OPENER = re.compile(r'[{\[]')
+_STRUCTURAL = re.compile(r'[{}\[\]",:]')
+_STRING_STOP = re.compile(r'["\\\\]')
+# What may follow an opening bracket in JSON; anything else is prose like "{section 2}"
+_FIRST = {'{': re.compile(r'\s*["}]'), '[': re.compile(r'\s*(?:["{\[\]tfn-]|\d)')}
+
+
+# strict=False: models put raw newlines and tabs inside strings
+_DECODER = json.JSONDecoder(strict=False)
+
+
+def _loads(text: str) -> Any:
+    return _DECODER.decode(text)
+
+
+class JSONStreamScanner:
+    """Finds the first complete top-level JSON object or array in text that arrives in pieces.
+
+    Text around the JSON (prose, ``` fences) is skipped, and a bracket only starts a candidate
+    when what follows it can start JSON (the same filter as iter_json). With expect='object'
+    (or 'array') only objects (or arrays) count, so "see [1] below" before an object answer is
+    passed over. Brackets inside strings do not count, and each character is looked at once,
+    however the text is split. A candidate that closes but does not parse is dropped and
+    scanning goes on after it.
+    """
+
+    EXPECT = ('object', 'array')
+
+    def __init__(self, expect: Optional[str] = None):
+        if expect is not None and expect not in self.EXPECT:
+            raise ValueError(f"expect must be one of {self.EXPECT} or None, not {expect!r}")
+        self.expect = expect
+        self.text = ""
+        self.value: Any = None
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self._openers = {'object': '{', 'array': '['}.get(expect, '{[')
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        # Opening bracket of a candidate whose next non-space character has not arrived yet
+        self._first: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str) -> bool:
+        """Add the next piece of text; True once a complete JSON value has been seen"""
+        if self.complete:
+            return True
+        offset = len(self.text)
+        self.text += chunk
+        for i, ch in enumerate(chunk, offset):
+            if self._first is not None:
+                if ch.isspace():
+                    continue
+                opener, self._first = self._first, None
+                if not _FIRST[opener].match(ch):
+                    # Prose such as "{section 2}": this character is outside JSON again
+                    self._stack = []
+            if not self._stack:
+                if ch in self._openers:
+                    self.start = i
+                    self._stack.append(_CLOSERS[ch])
+                    self._first = ch
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._stack.append(_CLOSERS[ch])
+            elif ch in '}]':
+                if ch != self._stack.pop():
+                    self._stack = []
+                    continue
+                if not self._stack and self._accept(i + 1):
+                    return True
+        return False
+
+    def _accept(self, end: int) -> bool:
+        try:
+            self.value = _loads(self.text[self.start:end])
+        except (ValueError, RecursionError):
+            return False
+        self.end = end
+        return True
+
+
+def _decode(text: str, start: int, end: int, drops: List[int] = (), closers: str = "") -> Any:
+    """Parse text[start:end] without the characters at `drops` and followed by `closers`; None if it fails"""
+    if drops or closers:
+        pieces, pos = [], start
+        for drop in drops:
+            pieces.append(text[pos:drop])
+            pos = drop + 1
+        pieces.append(text[pos:end])
+        pieces.append(closers)
+        candidate = ''.join(pieces)
+    else:
+        candidate = text[start:end]
+    try:
+        return _loads(candidate)
+    except (ValueError, RecursionError):  # RecursionError: nested deeper than the decoder goes
+        return None
+
+
+def _scan_value(text: str, start: int) -> Tuple[Any, int, List[Tuple[int, int, Any]]]:
+    """Scan the object or array opening at `start` once: (value, end, parts).
+
+    Trailing commas are dropped; a value cut off by the end of the text is closed at the last
+    point where everything before it was complete. value is None if it cannot be used; then
+    `end` is just past the bracket that broke it (or the end of the text) and `parts` are the
+    values directly inside it that parse on their own. Nothing before `end` is scanned again.
+    """
+    stack: List[Tuple[str, int, int]] = []  # (closer, position, len(drops)) of each open bracket
+    drops: List[int] = []  # positions of trailing commas
+    children: List[Tuple[int, int, int, int]] = []  # values closed directly inside the outer one
+    in_string = is_key = expect_key = False
+    pending_comma = None
+    safe = None  # (position, len(stack), len(drops)) after the last complete element
+    pos, n = start, len(text)
+    while pos < n:
+        if in_string:
+            match = _STRING_STOP.search(text, pos)
+            if not match:
+                pos = n
+                break
+            j = match.start()
+            if text[j] == '\\':
+                pos = j + 2
+                continue
+            pos = j + 1
+            in_string = False
+            if not is_key:
+                safe = (pos, len(stack), len(drops))
+            continue
+        match = _STRUCTURAL.search(text, pos)
+        j = match.start() if match else n
+        if j > pos and not text[pos:j].isspace():
+            pending_comma = None
+        if not match:
+            pos = n
+            break
+        ch = text[j]
+        pos = j + 1
+        if ch == '"':
+            in_string = True
+            is_key = expect_key and stack[-1][0] == '}'
+            pending_comma = None
+        elif ch in '{[':
+            pending_comma = None
+            stack.append((_CLOSERS[ch], j, len(drops)))
+            expect_key = ch == '{'
+            safe = (pos, len(stack), len(drops))
+        elif ch in '}]':
+            closer, opened, first_drop = stack.pop()
+            if ch != closer:
+                return None, pos, _parts(text, children, drops)
+            if pending_comma is not None:
+                drops.append(pending_comma)
+                pending_comma = None
+            if not stack:
+                value = _decode(text, start, pos, drops)
+                return value, pos, [] if value is not None else _parts(text, children, drops)
+            if len(stack) == 1:
+                children.append((opened, pos, first_drop, len(drops)))
+            expect_key = False
+            safe = (pos, len(stack), len(drops))
+        elif ch == ',':
+            safe = (j, len(stack), len(drops))
+            pending_comma = j
+            expect_key = stack[-1][0] == '}'
+        else:  # ':'
+            expect_key = False
+    # Truncated: close what is open, keeping a final scalar if it is complete
+    if not in_string:
+        tail = drops + [pending_comma] if pending_comma is not None else drops
+        value = _decode(text, start, n, tail, ''.join(closer for closer, _, _ in reversed(stack)))
+        if value is not None:
+            return value, n, []
+    if safe is not None:
+        end, depth, kept = safe
+        value = _decode(text, start, end, drops[:kept], ''.join(closer for closer, _, _ in reversed(stack[:depth])))
+        if value is not None:
+            return value, n, []
+    return None, n, _parts(text, children, drops)
+
+
+def _parts(text: str, children: List[Tuple[int, int, int, int]], drops: List[int]) -> List[Tuple[int, int, Any]]:
+    parts = []
+    for start, end, first_drop, last_drop in children:
+        value = _decode(text, start, end, drops[first_drop:last_drop])
+        if value is not None:
+            parts.append((start, end, value))
+    return parts
+
+
+def iter_json(text: str) -> Iterator[Tuple[int, int, Any]]:
+    """(start, end, value) of each top-level JSON object or array in `text`, in order.
+
+    Prose and ``` fences around and between the values are skipped, and the text is scanned
+    once: after a broken candidate the search goes on past it, keeping the complete values
+    found directly inside it. Well-formed values are read by the C decoder until one fails;
+    its error costs time in proportion to the position, so after that each candidate is
+    scanned first and only decoded once its end is known.
+    """
+    pos, fast = 0, True
+    while True:
+        match = _OPENER.search(text, pos)
+        if not match:
+            return
+        start = match.start()
+        if not _FIRST[text[start]].match(text, start + 1):
+            pos = start + 1
+            continue
+        if fast:
+            try:
+                value, pos = _DECODER.raw_decode(text, start)
+                yield start, pos, value
+                continue
+            except (ValueError, RecursionError):
+                fast = False
+        value, pos, parts = _scan_value(text, start)
+        if value is not None:
+            yield start, pos, value
+        else:
+            yield from parts
+
+
+def extract_all_json(text: str) -> List[Any]:
+    """Every JSON object or array found in an LLM response, repaired where possible"""
+    return [value for _, _, value in iter_json(text)]
+
+
+def extract_json(text: str, default: Any = None) -> Any:
+    """The JSON object or array of an LLM response: the whole text if it is one, else the largest one in it"""
+    if not isinstance(text, str):
+        return default
+    try:
+        value = _loads(text)
+        if isinstance(value, (dict, list)):
+            return value
+    except (ValueError, RecursionError):
+        pass
+    best, best_len = default, -1
+    for start, end, value in iter_json(text):
+        if end - start > best_len:
+            best, best_len = value, end - start
+    return best
@@ -0,0 +1,29 @@
+# core/layered_context.py
+from collections import ChainMap
+from typing import Dict, Any
+
+
+class LayeredContext(ChainMap):
+    """Copy-on-write view over the pipeline context.
+
+    Reads fall through the layers (step locals, then the shared run context);
+    writes land in the first layer and are recorded, so creating a per-step or
+    per-item context is O(1) and merging back only touches keys that were written.
+    """
+
+    def __init__(self, *maps):
+        super().__init__(*maps)
+        self.written = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.written.add(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.written.discard(key)
+
+    def writes(self) -> Dict[str, Any]:
+        """Keys written through this view, with their current values"""
+        top = self.maps[0]
+        return {key: top[key] for key in self.written if key in top}
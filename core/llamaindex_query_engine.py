@@ -1,13 +1,14 @@
-from llama_index.core import SQLDatabase, Settings
-from llama_index.core.query_engine import NLSQLTableQueryEngine
-from llama_index.llms.ollama import Ollama
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from .database_context_provider import DatabaseContextProvider
 import asyncio
-from sqlalchemy import create_engine
 
 class LlamaIndexQueryEngine:
     def __init__(self, db_path, llm_model="qwen2.5-coder:7b-instruct", smart_wrapper=None):
+        # llama_index and sqlalchemy take seconds to import; only pipelines with llamaindex_ steps pay for them
+        from llama_index.core import SQLDatabase, Settings
+        from llama_index.core.query_engine import NLSQLTableQueryEngine
+        from llama_index.llms.ollama import Ollama
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        from sqlalchemy import create_engine
         self.db_path = db_path
         self.smart_wrapper = smart_wrapper
         
@@ -0,0 +1,95 @@
+# core/llm_cache.py
+import re
+import pickle
+import threading
+import contextvars
+from typing import Dict, List, Any, Optional
+
+from .step_cache import SQLiteLRUStore, stable_hash
+from .config import LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL
+
+# False while a step with `cache: false` runs: its LLM calls neither read nor fill the cache
+llm_cache_allowed: contextvars.ContextVar = contextvars.ContextVar('llm_cache_allowed', default=True)
+
+_shared: Dict[str, 'LLMResponseCache'] = {}
+_shared_lock = threading.Lock()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Prompt text with layout-only differences removed (trailing spaces, runs of blanks and blank lines)"""
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in prompt.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+class LLMResponseCache:
+    """Successful LLM responses in a local SQLite file, keyed on model, prompt, options and mode.
+
+    Entries expire after `ttl` seconds (0: never) and the least recently used ones are evicted
+    once the file grows past max_bytes.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 256 * 1024 * 1024, ttl: float = 0):
+        self.store = SQLiteLRUStore(db_path, max_bytes, table="llm_responses")
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, prompt: str, options: Dict[str, Any], breakdown: bool = False,
+            images: Optional[List[bytes]] = None) -> str:
+        return stable_hash({
+            'model': model,
+            'prompt': normalize_prompt(prompt),
+            'options': options,
+            'breakdown': breakdown,
+            'images': images or [],
+        })
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        blob = self.store.get(key, max_age=self.ttl)
+        result = None
+        if blob is not None:
+            try:
+                result = pickle.loads(blob)
+            except Exception as e:
+                print(f"[WARN] Dropping unreadable LLM cache entry {key[:12]}: {e}")
+                self.store.delete(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]) -> bool:
+        """Store a successful response; failures are never cached"""
+        if not result.get('success'):
+            return False
+        try:
+            blob = pickle.dumps(result)
+        except Exception as e:
+            print(f"[DEBUG] LLM response not cacheable: {e}")
+            return False
+        self.store.put(key, blob)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'entries': len(self.store),
+            'bytes': self.store.total_bytes(),
+        }
+
+
+def shared_response_cache(db_path: str = LLM_CACHE_PATH) -> LLMResponseCache:
+    """One cache per file for the whole process, shared by every LLMProcessor"""
+    with _shared_lock:
+        cache = _shared.get(db_path)
+        if cache is None:
+            cache = _shared[db_path] = LLMResponseCache(db_path, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL)
+            print(f"LLM response cache enabled: {db_path}")
+        return cache
@@ -0,0 +1,107 @@
+# core/llm_metrics.py
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+# LLM counters of the step running in this task (foreach item tasks inherit it)
+_active_stats: contextvars.ContextVar = contextvars.ContextVar('llm_call_stats', default=None)
+
+
+@contextmanager
+def track_llm_calls(stats: Dict[str, Any]):
+    """Count retries, hedged requests and per-model usage of LLM calls inside this block (and tasks
+    it spawns) in stats"""
+    token = _active_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+def record_llm_event(key: str, count: int = 1):
+    stats = _active_stats.get()
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + count
+
+
+def call_metrics(model: str, usage: Optional[Dict[str, Any]], request_seconds: float,
+                 slot_wait_seconds: float = 0.0) -> Dict[str, Any]:
+    """Metrics of one request from Ollama's counters (`usage`) and the client's own timings.
+
+    queue_seconds is the wait for a concurrency slot plus the part of the request the server did
+    not account for (waiting in its queue, network); it is only the slot wait when the server
+    reported no total_duration (e.g. a stream closed early).
+    """
+    usage = usage or {}
+    total = usage.get('total_seconds')
+    queue = slot_wait_seconds + (max(0.0, request_seconds - total) if total is not None else 0.0)
+    return {
+        'model': model,
+        'prompt_tokens': usage.get('prompt_tokens'),
+        'completion_tokens': usage.get('completion_tokens'),
+        'prompt_seconds': usage.get('prompt_seconds'),
+        'decode_seconds': usage.get('decode_seconds'),
+        'load_seconds': usage.get('load_seconds'),
+        'total_seconds': total,
+        'request_seconds': round(request_seconds, 4),
+        'queue_seconds': round(queue, 4),
+    }
+
+
+def record_llm_call(metrics: Dict[str, Any]):
+    """Add one request's metrics to the active step's usage of its model"""
+    stats = _active_stats.get()
+    if stats is not None:
+        stats.setdefault('llm_usage', {}).setdefault(metrics['model'], LLMUsage()).add(metrics)
+
+
+class LLMUsage:
+    """Totals of a model's requests; throughput only counts requests with server timings"""
+
+    _SUMS = ('prompt_tokens', 'completion_tokens', 'prompt_seconds', 'decode_seconds', 'load_seconds',
+             'request_seconds', 'queue_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.loads = 0
+        self.totals = {key: 0 for key in self._SUMS}
+        # Token counts of the requests whose prefill / decode durations are known
+        self.timed_prompt_tokens = 0
+        self.timed_completion_tokens = 0
+
+    def add(self, metrics: Dict[str, Any]):
+        self.calls += 1
+        for key in self._SUMS:
+            self.totals[key] += metrics.get(key) or 0
+        if metrics.get('prompt_seconds'):
+            self.timed_prompt_tokens += metrics.get('prompt_tokens') or 0
+        if metrics.get('decode_seconds'):
+            self.timed_completion_tokens += metrics.get('completion_tokens') or 0
+        # Ollama reports a few milliseconds of load_duration even when the model is already loaded
+        if (metrics.get('load_seconds') or 0) > 0.5:
+            self.loads += 1
+
+    def merge(self, other: 'LLMUsage'):
+        self.calls += other.calls
+        self.loads += other.loads
+        for key in self._SUMS:
+            self.totals[key] += other.totals[key]
+        self.timed_prompt_tokens += other.timed_prompt_tokens
+        self.timed_completion_tokens += other.timed_completion_tokens
+
+    def as_dict(self) -> Dict[str, Any]:
+        totals = self.totals
+        return {
+            'calls': self.calls,
+            'prompt_tokens': totals['prompt_tokens'],
+            'completion_tokens': totals['completion_tokens'],
+            'prompt_tps': (round(self.timed_prompt_tokens / totals['prompt_seconds'], 2)
+                           if totals['prompt_seconds'] else None),
+            'generation_tps': (round(self.timed_completion_tokens / totals['decode_seconds'], 2)
+                               if totals['decode_seconds'] else None),
+            'load_seconds': round(totals['load_seconds'], 4),
+            'model_loads': self.loads,
+            'queue_seconds': round(totals['queue_seconds'], 4),
+            'mean_queue_seconds': round(totals['queue_seconds'] / self.calls, 4) if self.calls else None,
+            'request_seconds': round(totals['request_seconds'], 4),
+        }
@@ -1,17 +1,270 @@
 # core/llm_processor.py
-import json
-import re
+import time
 import asyncio
-from typing import Dict, Any, Optional
+import contextvars
+from typing import Dict, List, Any, Optional, Union
+
+from .tracing import span
+from .cancellation import guarded
+from .adaptive_limiter import AdaptiveLimiter
+from .json_scanner import JSONStreamScanner, extract_json
+from .llm_cache import LLMResponseCache, llm_cache_allowed, shared_response_cache
+from .token_budget import PromptTooLarge, default_budget
+from .llm_router import LLMRouter, NoEndpointAvailable, shared_router
+from .llm_retry import RetryPolicy, LatencyWindow, error_class, result_error_class
+from .llm_metrics import call_metrics, record_llm_call, record_llm_event
+from .config import (OLLAMA_HOST, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_MAX_CONNECTIONS,
+                     OLLAMA_KEEPALIVE_EXPIRY, LLM_ADAPTIVE_CONCURRENCY, LLM_INITIAL_CONCURRENCY,
+                     LLM_MIN_CONCURRENCY, LLM_MAX_CONCURRENCY, LLM_CACHE_ENABLED, LLM_STREAM,
+                     LLM_MAX_TOKENS)
+
+# Endpoints already serving the current call; a hedged duplicate of the call prefers another one
+_call_endpoints: contextvars.ContextVar = contextvars.ContextVar('llm_call_endpoints', default=None)
+
 
 class LLMProcessor:
     """Handle LLM interactions using ollama"""
     
-    def __init__(self, model: str = "qwen2.5-coder:7b-instruct"):
+    def __init__(self, model: str = "qwen2.5-coder:7b-instruct", host: Optional[str] = None,
+                 router: Optional[LLMRouter] = None):
         self.model = model
+        self.host = host or OLLAMA_HOST
+        # Several endpoints (OLLAMA_ENDPOINTS): each request goes where the router sends it
+        self.router = router if router is not None else (shared_router() if host is None else None)
+        # Generation options sent with every request (also part of the response cache key);
+        # num_ctx and num_predict are sized per request by the token budget
+        self.options = {"temperature": 0.1}
+        self.budget = default_budget()
+        # Stream responses and stop generating once the JSON answer is complete (steps can override)
+        self.stream = LLM_STREAM
+        # How long Ollama keeps the model loaded after each request (None: the server default);
+        # the engine raises it while a run still has steps for this model
+        self.keep_alive: Optional[Any] = None
+        self.response_cache: Optional[LLMResponseCache] = shared_response_cache() if LLM_CACHE_ENABLED else None
+        # Pooled async client per endpoint, created on first use and bound to the event loop that created it
+        self._clients: Dict[str, Any] = {}
+        self._client_loop = None
+        # Concurrent requests to this model, tuned from observed latency and tokens/s
+        self.limiter = AdaptiveLimiter(LLM_INITIAL_CONCURRENCY, LLM_MIN_CONCURRENCY,
+                                       LLM_MAX_CONCURRENCY) if LLM_ADAPTIVE_CONCURRENCY else None
+        # Retry policy of calls made without a step's own, and observed latencies per policy name (step)
+        self.retry = RetryPolicy.from_step({})
+        self.latencies: Dict[str, LatencyWindow] = {}
+
+    def _get_client(self, host: Optional[str] = None):
+        """The ollama.AsyncClient for `host`; concurrent prompts share its keep-alive connection pool"""
+        host = host or self.host
+        loop = asyncio.get_running_loop()
+        if self._client_loop is not loop:
+            # Connections of a finished event loop (an earlier asyncio.run) cannot be reused
+            self._clients = {}
+            self._client_loop = loop
+        client = self._clients.get(host)
+        if client is None:
+            import httpx
+            import ollama
+            client = self._clients[host] = ollama.AsyncClient(
+                host=host,
+                timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                                    max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+                                    keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY),
+            )
+        return client
+
+    async def aclose(self):
+        """Close the pooled connections (call on the loop that used them)"""
+        clients, self._clients, self._client_loop = self._clients, {}, None
+        for client in clients.values():
+            await client.close()
     
-    async def process_prompt(self, prompt: str, timeout: int = 120, breakdown: bool = False) -> Dict[str, Any]:
-        """Process a prompt with the LLM and return structured result. If breakdown=True, condense to a single queriable requirement."""
+    async def load(self, keep_alive: Optional[Any] = None) -> Dict[str, Any]:
+        """Load the model into memory without generating anything (keep_alive=0 unloads it)"""
+        action = 'unload' if keep_alive == 0 else 'load'
+        started = time.perf_counter()
+        with span(f"{action} {self.model}", 'model_load', model=self.model) as attrs:
+            try:
+                # An empty prompt makes Ollama load the model (or, with keep_alive 0, unload it)
+                await self._routed(lambda client: client.generate(model=self.model, prompt='', keep_alive=keep_alive))
+            except Exception as e:
+                print(f"[WARN] Could not {action} {self.model}: {e}")
+                attrs['success'] = False
+                return {'model': self.model, 'success': False, 'error': str(e)}
+            seconds = time.perf_counter() - started
+            attrs['success'] = True
+            return {'model': self.model, 'success': True, 'seconds': round(seconds, 4)}
+
+    async def unload(self) -> Dict[str, Any]:
+        return await self.load(keep_alive=0)
+
+    async def process_prompt(self, prompt: str, timeout: int = 120, breakdown: bool = False,
+                             images: Optional[List[bytes]] = None, stream: Union[bool, str, None] = None,
+                             max_tokens: Optional[int] = None, retry: Optional[RetryPolicy] = None) -> Dict[str, Any]:
+        """Process a prompt with the LLM and return structured result. If breakdown=True, condense to a single queriable requirement.
+
+        With stream=True (default: LLM_STREAM) the response is read as it is generated and the
+        request is closed as soon as a complete JSON object or array has arrived; stream='object'
+        (or 'array') waits for an object (or array), passing over any other JSON before it. The context
+        window is sized for the prompt plus max_tokens of answer (default: LLM_MAX_TOKENS); a
+        prompt that cannot fit returns an error with 'too_large' without calling the model.
+        Failed calls are retried and slow ones hedged as the step's `retry` policy says (default:
+        LLM_RETRY_* and LLM_HEDGE settings); results of retried calls carry 'attempts'.
+        """
+        if stream is None:
+            stream = self.stream
+        elif stream not in JSONStreamScanner.EXPECT:
+            stream = bool(stream)
+        policy = retry or self.retry
+        max_tokens = int(max_tokens or LLM_MAX_TOKENS)
+        with span('llm_call', 'llm', model=self.model, prompt_chars=len(prompt),
+                  prompt_tokens_est=len(prompt) // 4, breakdown=breakdown, stream=stream) as attrs:
+            try:
+                plan = self.budget.plan(self._breakdown_prompt(prompt) if breakdown else prompt, max_tokens)
+            except PromptTooLarge as e:
+                print(f"[LLM] Error: {e}")
+                attrs['success'] = False
+                attrs['too_large'] = True
+                return {'error': str(e), 'success': False, 'too_large': True,
+                        'prompt_tokens': e.prompt_tokens, 'max_prompt_tokens': e.max_prompt_tokens}
+            options = {**self.options, 'num_ctx': plan['num_ctx'], 'num_predict': plan['num_predict']}
+            attrs['num_ctx'] = plan['num_ctx']
+            attrs['prompt_tokens_est'] = plan['prompt_tokens']
+            cache = self.response_cache if llm_cache_allowed.get() else None
+            cache_key = None
+            if cache:
+                # The window size does not change the answer; keying on it would miss across buckets
+                cache_key = cache.key(self.model, prompt, {**self.options, 'num_predict': plan['num_predict']},
+                                      breakdown, images)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    attrs['cached'] = True
+                    attrs['success'] = True
+                    attrs['response_chars'] = len(cached.get('raw_response') or '')
+                    return {**cached, 'cached': True}
+            attempt = 0
+            while True:
+                attempt += 1
+                result = await self._attempt(prompt, timeout, breakdown, images, stream, options, plan['num_ctx'],
+                                             policy, attrs)
+                if not policy.should_retry(result, attempt):
+                    break
+                delay = policy.delay(attempt)
+                print(f"[LLM] {self.model}: attempt {attempt} failed ({result_error_class(result)}: "
+                      f"{result.get('error', 'no JSON in the answer')}), retrying in {delay:.1f}s")
+                record_llm_event('llm_retries')
+                await guarded(asyncio.sleep(delay))
+            if attempt > 1:
+                result = {**result, 'attempts': attempt}
+                attrs['attempts'] = attempt
+            if cache and result.get('success'):
+                # Timings of this request would be misleading on a cache hit
+                cache.put(cache_key, {key: value for key, value in result.items() if key != 'metrics'})
+            attrs['success'] = result.get('success')
+            attrs['response_chars'] = len(result.get('raw_response') or '')
+            attrs['completion_tokens_est'] = attrs['response_chars'] // 4
+            usage = result.get('usage') or {}
+            for key in ('ttft_seconds', 'json_seconds', 'stopped_early'):
+                if usage.get(key) is not None:
+                    attrs[key] = usage[key]
+            # Server-reported counts and timings (the trace export and PerfHistory read them)
+            for key, value in (result.get('metrics') or {}).items():
+                if key != 'model' and value is not None:
+                    attrs[key] = value
+            return result
+
+    async def _attempt(self, prompt: str, timeout: int, breakdown: bool, images: Optional[List[bytes]],
+                       stream: bool, options: Dict[str, Any], num_ctx: int, policy: RetryPolicy,
+                       attrs: Dict[str, Any]) -> Dict[str, Any]:
+        """One attempt at a call: a single request, or two when the first runs past the hedge point"""
+        latencies = self.latencies.setdefault(policy.name, LatencyWindow())
+        hedge_after = policy.hedge_after(latencies)
+        endpoints = []
+        started = time.perf_counter()
+        if hedge_after is None:
+            result = await self._once(prompt, timeout, breakdown, images, stream, options, num_ctx, endpoints)
+        else:
+            result = await self._hedged(prompt, timeout, breakdown, images, stream, options, num_ctx, endpoints,
+                                        hedge_after, attrs)
+        if result.get('success'):
+            latencies.add(time.perf_counter() - started)
+        return result
+
+    async def _hedged(self, prompt: str, timeout: int, breakdown: bool, images: Optional[List[bytes]],
+                      stream: bool, options: Dict[str, Any], num_ctx: int, endpoints: list, hedge_after: float,
+                      attrs: Dict[str, Any]) -> Dict[str, Any]:
+        """Send the request again if it has not answered after hedge_after seconds; the first success wins"""
+        primary = asyncio.ensure_future(
+            self._once(prompt, timeout, breakdown, images, stream, options, num_ctx, endpoints))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if done:
+                return primary.result()
+            print(f"[LLM] {self.model}: no answer after {hedge_after:.2f}s, sending a hedged request")
+            record_llm_event('llm_hedges')
+            attrs['hedged'] = True
+            # The hedge keeps the primary's remaining time, not a whole new timeout
+            remaining = None if timeout is None else max(0.001, timeout - hedge_after)
+            backup = asyncio.ensure_future(self._once(prompt, remaining, breakdown, images, stream, options, num_ctx,
+                                                      endpoints))
+            tasks.append(backup)
+            pending = set(tasks)
+            failed = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.index):
+                    result = task.result()
+                    if result.get('success'):
+                        if task is backup:
+                            record_llm_event('llm_hedge_wins')
+                        attrs['hedge_won'] = task is backup
+                        return {**result, 'hedged': True}
+                    failed = failed or result
+            return {**failed, 'hedged': True}
+        finally:
+            # Cancelling the slower request aborts its HTTP request, so Ollama stops generating it
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _once(self, prompt: str, timeout: int, breakdown: bool, images: Optional[List[bytes]],
+                    stream: bool, options: Dict[str, Any], num_ctx: int, endpoints: list) -> Dict[str, Any]:
+        """A single request within the concurrency limit and timeout"""
+        limiter = self.limiter
+        queued = time.perf_counter()
+        if limiter:
+            await guarded(limiter.acquire())
+        started = time.perf_counter()
+        timed_out = False
+        self.budget.begin(num_ctx)
+        token = _call_endpoints.set(endpoints)
+        try:
+            # Returns at the step timeout, or at once when the run is cancelled (raises RunCancelled)
+            result = await guarded(self._process_prompt(prompt, timeout, breakdown, images, stream, options),
+                                   timeout)
+        except asyncio.TimeoutError:
+            print(f"[LLM] Error: no response from {self.model} within {timeout:g}s")
+            result = {'error': f"LLM call timed out after {timeout:g}s", 'error_type': 'timeout', 'success': False}
+            timed_out = True
+        finally:
+            _call_endpoints.reset(token)
+            self.budget.end(num_ctx)
+            if limiter:
+                limiter.release()
+        request_seconds = time.perf_counter() - started
+        # Timeouts, server errors and dropped connections are overload signals; a rejected
+        # request (client error) or an unparseable answer says nothing about load
+        overloaded = timed_out or result.get('error_type') in ('timeout', 'server', 'connection')
+        if limiter and (overloaded or result.get('success')):
+            limiter.record(request_seconds, (result.get('usage') or {}).get('completion_tokens'), ok=not overloaded)
+        if result.get('success'):
+            result['metrics'] = call_metrics(self.model, result.get('usage'), request_seconds, started - queued)
+            record_llm_call(result['metrics'])
+        return result
+
+    async def _process_prompt(self, prompt: str, timeout: int, breakdown: bool,
+                              images: Optional[List[bytes]] = None, stream: bool = False,
+                              options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         import os
         import datetime
         try:
@@ -29,76 +282,230 @@ class LLMProcessor:
                 feature_text = prompt.strip()
                 orig_feature = feature_text
                 print(f"[LLM DEBUG] Feature text for breakdown: {feature_text!r}")
-                prompt = (
-                    "You are an expert requirements engineer. "
-                    "Condense the following feature or requirement into a single, short, queriable requirement. "
-                    "The result should be a concise phrase (2-8 words) that best represents the core of the feature for database search. "
-                    "If the feature includes any accuracy, measurement, or tolerance values (such as ±0.5%), include them in the phrase. "
-                    "Output ONLY valid JSON in the format: {\"atomic_requirement\": \"...\"}. "
-                    "If the input is already atomic, return it as is.\n"
-                    "\nExample:\n"
-                    "Feature:\nTrue RMS Volts: all phase-to-phase & phase-to-neutral ±0.5%\n"
-                    "Output:\n{\"atomic_requirement\": \"RMS voltage measurement ±0.5%\"}\n"
-                ) + f"\nFeature:\n{feature_text}"
+                prompt = self._breakdown_prompt(feature_text)
             # [LLM DEBUG] Prompt print removed as requested
-            client = ollama.Client()
-            response = client.chat(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                options={
-                    "temperature": 0.1,
-                    "timeout": timeout,
-                    "num_ctx": 32768,
-                    "num_predict": 4096
-                }
-            )
-            print(f"[LLM DEBUG] ollama.Client().chat response: {response}")
-            ai_content = response['message']['content']
-            ai_content_clean = ai_content.strip()
-            if ai_content_clean.startswith("```"):
-                lines = ai_content_clean.splitlines()
-                if lines[0].startswith("```json"):
-                    lines = lines[1:]
-                elif lines[0].startswith("```"):
-                    lines = lines[1:]
-                if lines and lines[-1].strip().startswith("```"):
-                    lines = lines[:-1]
-                ai_content_clean = "\n".join(lines).strip()
-            json_result = self._extract_json_from_response(ai_content_clean)
+            message = {"role": "user", "content": prompt}
+            if images:
+                message["images"] = images
+            # Cancelling this await (step timeout, run cancelled) aborts the HTTP request
+            ai_content, usage = await self._chat(message, options or self.options, stream)
+            json_result = self._extract_json_from_response(ai_content)
             # No post-processing: trust the LLM to return a single short phrase
             if breakdown and json_result and isinstance(json_result, dict):
-                atomic = json_result.get("atomic_requirement")
-                if not (isinstance(atomic, str) and 2 <= len(atomic.split()) <= 8):
+                if not self.is_atomic_requirement(json_result.get("atomic_requirement")):
                     # If the LLM did not return a valid short phrase, set to empty string
                     json_result["atomic_requirement"] = ""
             # Debug file writing removed as requested
             return {
                 'raw_response': ai_content,
                 'parsed_result': json_result,
+                'usage': usage,
                 'success': True
             }
         except Exception as e:
             print(f"[LLM] Error: {e}")
             return {
                 'error': str(e),
+                'error_type': error_class(e),
                 'success': False
             }
     
-    def _extract_json_from_response(self, text: str) -> Optional[Dict[str, Any]]:
-        """Extract JSON from LLM response"""
-        
-        # Try to find JSON in the response
-        json_pattern = re.compile(r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}', re.DOTALL)
-        matches = json_pattern.findall(text)
-        
-        # Try each match, from longest to shortest
-        if matches:
-            matches.sort(key=len, reverse=True)
-            for match in matches:
-                try:
-                    return json.loads(match)
-                except json.JSONDecodeError:
+    async def _chat(self, message: Dict[str, Any], options: Dict[str, Any], stream: bool):
+        """(content, usage) from the configured host, or the endpoint the router picks"""
+        return await self._routed(lambda client: self._chat_on(client, message, options, stream))
+
+    async def _routed(self, request):
+        """Await request(client) on the configured host, or on the endpoint the router picks. An
+        endpoint that is down or does not have the model is left for the next best one; when
+        none is left, the last endpoint's error is raised."""
+        if self.router is None:
+            return await request(self._get_client())
+        tried = []
+        busy = _call_endpoints.get()
+        last_error = None
+        while True:
+            try:
+                endpoint = self._acquire_endpoint(tried, busy)
+            except NoEndpointAvailable:
+                if last_error is None:
+                    raise
+                raise last_error
+            try:
+                result = await request(self._get_client(endpoint.url))
+            except Exception as e:
+                missing = self.router.is_missing_model(e)
+                failed = not missing and self.router.is_endpoint_failure(e)
+                self.router.release(endpoint, self.model, ok=not failed)
+                if missing:
+                    self.router.forget_model(endpoint, self.model)
+                if not (missing or failed):
+                    raise
+                print(f"[LLM] {endpoint.url} failed for {self.model} ({e!r}), trying another endpoint")
+                tried.append(endpoint)
+                last_error = e
+                continue
+            except BaseException:
+                # Cancelled (hedge lost, timeout, run cancelled): the endpoint gave no answer either way
+                self.router.abandon(endpoint)
+                raise
+            self.router.release(endpoint, self.model)
+            return result
+
+    def _acquire_endpoint(self, tried: list, busy: Optional[list]):
+        """Reserve an endpoint, avoiding those a hedged twin of this call uses when another can serve"""
+        endpoint = None
+        if busy:
+            try:
+                endpoint = self.router.acquire(self.model, exclude=tried + busy)
+            except NoEndpointAvailable:
+                pass
+        if endpoint is None:
+            endpoint = self.router.acquire(self.model, exclude=tried)
+        if busy is not None:
+            busy.append(endpoint)
+        return endpoint
+
+    async def _chat_on(self, client, message: Dict[str, Any], options: Dict[str, Any], stream: Union[bool, str]):
+        if stream:
+            return await self._chat_streaming(client, message, options, stream if isinstance(stream, str) else None)
+        response = await client.chat(
+            model=self.model,
+            messages=[message],
+            options=options,
+            keep_alive=self.keep_alive
+        )
+        return response['message']['content'], self._usage(response)
+
+    async def _chat_streaming(self, client, message: Dict[str, Any], options: Dict[str, Any],
+                              expect: Optional[str] = None):
+        """Streamed chat: (content, usage). Closing the stream early makes Ollama stop generating.
+
+        expect ('object', 'array' or None for either) is the kind of JSON value that ends the answer.
+        """
+        started = time.perf_counter()
+        scanner = JSONStreamScanner(expect)
+        first_token = json_complete = None
+        last = None
+        chunks = 0
+        responses = await client.chat(
+            model=self.model,
+            messages=[message],
+            options=options,
+            stream=True,
+            keep_alive=self.keep_alive
+        )
+        try:
+            async for chunk in responses:
+                last = chunk
+                piece = chunk['message']['content'] or ""
+                if not piece:
+                    continue
+                chunks += 1
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                if scanner.feed(piece):
+                    json_complete = time.perf_counter() - started
+                    break
+        finally:
+            await responses.aclose()
+        stopped_early = json_complete is not None and not (last and last.get('done'))
+        if stopped_early:
+            # The final chunk with Ollama's counters never arrived: one streamed chunk is one token
+            usage = {**self._usage({}), 'completion_tokens': chunks}
+            content = scanner.text[:scanner.end]
+        else:
+            usage = self._usage(last or {})
+            content = scanner.text
+        usage.update(ttft_seconds=first_token, json_seconds=json_complete, stopped_early=stopped_early)
+        if stopped_early:
+            print(f"[LLM] {self.model}: JSON answer complete after {chunks} tokens, stopped generation")
+        return content, usage
+
+    @staticmethod
+    def _breakdown_prompt(feature: str) -> str:
+        """Prompt condensing one feature into a single queriable requirement"""
+        return (
+            "You are an expert requirements engineer. "
+            "Condense the following feature or requirement into a single, short, queriable requirement. "
+            "The result should be a concise phrase (2-8 words) that best represents the core of the feature for database search. "
+            "If the feature includes any accuracy, measurement, or tolerance values (such as ±0.5%), include them in the phrase. "
+            "Output ONLY valid JSON in the format: {\"atomic_requirement\": \"...\"}. "
+            "If the input is already atomic, return it as is.\n"
+            "\nExample:\n"
+            "Feature:\nTrue RMS Volts: all phase-to-phase & phase-to-neutral ±0.5%\n"
+            "Output:\n{\"atomic_requirement\": \"RMS voltage measurement ±0.5%\"}\n"
+        ) + f"\nFeature:\n{feature.strip()}"
+
+    @staticmethod
+    def is_atomic_requirement(value: Any) -> bool:
+        """A breakdown answer is usable when it is a short phrase of 2-8 words"""
+        return isinstance(value, str) and 2 <= len(value.split()) <= 8
+
+    @staticmethod
+    def breakdown_batch_prompt(features: List[str]) -> str:
+        """One breakdown prompt for several features, numbered from 1; answered by a JSON array"""
+        numbered = "\n".join(f"{i}. {' '.join(feature.split())}" for i, feature in enumerate(features, 1))
+        return (
+            "You are an expert requirements engineer. "
+            "Condense each of the following numbered features or requirements into a single, short, queriable requirement. "
+            "Each result should be a concise phrase (2-8 words) that best represents the core of its feature for database search. "
+            "If a feature includes any accuracy, measurement, or tolerance values (such as ±0.5%), include them in the phrase. "
+            "If a feature is already atomic, return it as is. "
+            "Output ONLY valid JSON in the format: "
+            "{\"results\": [{\"index\": 1, \"atomic_requirement\": \"...\"}, ...]} "
+            "with exactly one entry per feature, using the feature's number as index.\n"
+            "\nExample:\n"
+            "Features:\n1. True RMS Volts: all phase-to-phase & phase-to-neutral ±0.5%\n2. Frequency 45-65Hz\n"
+            "Output:\n{\"results\": [{\"index\": 1, \"atomic_requirement\": \"RMS voltage measurement ±0.5%\"}, "
+            "{\"index\": 2, \"atomic_requirement\": \"Frequency measurement 45-65Hz\"}]}\n"
+            f"\nFeatures:\n{numbered}"
+        )
+
+    @classmethod
+    def parse_breakdown_batch(cls, result: Dict[str, Any], features: List[str]) -> Dict[str, str]:
+        """Feature -> atomic requirement from a batch answer; missing or invalid answers map to \"\"."""
+        answers = {feature: "" for feature in features}
+        parsed = result.get('parsed_result') if isinstance(result, dict) and result.get('success') else None
+        entries = parsed.get('results') if isinstance(parsed, dict) else parsed
+        if not isinstance(entries, list):
+            return answers
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                continue
+            index = entry.get('index')
+            if isinstance(index, str) and index.strip().isdigit():
+                index = int(index)
+            if not isinstance(index, int):
+                # Without indices the answers can only be matched by position
+                if len(entries) != len(features):
                     continue
-        
+                index = position + 1
+            atomic = entry.get('atomic_requirement')
+            if 1 <= index <= len(features) and cls.is_atomic_requirement(atomic):
+                answers[features[index - 1]] = atomic.strip()
+        return answers
+
+    @staticmethod
+    def _usage(response) -> Dict[str, Any]:
+        """Token counts and server timings Ollama reports with a response (its durations are in ns)"""
+        def field(name):
+            return response.get(name) if isinstance(response, dict) else getattr(response, name, None)
+
+        def seconds(name):
+            value = field(name)
+            return value / 1e9 if value is not None else None
+
+        return {
+            'prompt_tokens': field('prompt_eval_count'),
+            'completion_tokens': field('eval_count'),
+            'prompt_seconds': seconds('prompt_eval_duration'),
+            'decode_seconds': seconds('eval_duration'),
+            'load_seconds': seconds('load_duration'),
+            'total_seconds': seconds('total_duration'),
+        }
+
+    def _extract_json_from_response(self, text: str) -> Any:
+        """Extract JSON from LLM response (code fences, trailing commas and truncation are repaired)"""
+        json_result = extract_json(text)
         # If no JSON found, return the text as a message
-        return {"message": text}
\ No newline at end of file
+        return json_result if json_result is not None else {"message": text}
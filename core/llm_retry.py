@@ -0,0 +1,138 @@
+# core/llm_retry.py
+import random
+import asyncio
+from bisect import insort
+from collections import deque
+from typing import Dict, List, Any, Iterable, Optional
+
+from .config import (LLM_RETRY_ATTEMPTS, LLM_RETRY_BACKOFF, LLM_RETRY_MAX_BACKOFF, LLM_RETRY_JITTER,
+                     LLM_RETRY_ON, LLM_HEDGE, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_SAMPLES)
+from .llm_router import NoEndpointAvailable
+
+# Error classes recorded in a failed LLM result's 'error_type'
+ERROR_CLASSES = ('timeout', 'connection', 'server', 'client', 'invalid_json', 'error')
+
+
+def error_class(error: BaseException) -> str:
+    """Which ERROR_CLASSES entry an exception raised by an LLM call belongs to"""
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return 'server' if status >= 500 or status == 429 else 'client'
+    try:
+        import httpx
+        if isinstance(error, httpx.TimeoutException):
+            return 'timeout'
+        if isinstance(error, httpx.TransportError):
+            return 'connection'
+    except ImportError:
+        pass
+    if isinstance(error, OSError):  # includes ConnectionError raised by the ollama client
+        return 'connection'
+    if isinstance(error, NoEndpointAvailable):  # every endpoint down or skipped until its cooldown ends
+        return 'connection'
+    return 'error'
+
+
+def result_error_class(result: Dict[str, Any]) -> Optional[str]:
+    """Error class of an LLM result; a successful answer without any JSON in it is 'invalid_json'"""
+    if not result.get('success'):
+        return result.get('error_type') or 'error'
+    parsed = result.get('parsed_result')
+    if isinstance(parsed, dict) and set(parsed) == {'message'} and parsed['message'] == result.get('raw_response'):
+        return 'invalid_json'
+    return None
+
+
+class LatencyWindow:
+    """The last `size` latencies of one step's LLM calls, for quantiles"""
+
+    def __init__(self, size: int = 200):
+        self._recent: deque = deque(maxlen=size)
+        self._sorted: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def add(self, seconds: float):
+        if len(self._recent) == self._recent.maxlen:
+            self._sorted.remove(self._recent[0])
+        self._recent.append(seconds)
+        insort(self._sorted, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._sorted:
+            return None
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class RetryPolicy:
+    """Retries and hedging of one step's LLM calls.
+
+    A call failing with an error class in `retry_on` is repeated, up to max_attempts in total,
+    after backoff * 2**(n-1) seconds (at most max_backoff) shortened at random by up to `jitter`
+    of it, so items that failed together do not retry in lockstep. With hedge=True a call still
+    running past the `hedge_quantile` of the step's observed latencies is sent once more (another
+    limiter slot, another endpoint when several are routed) and the first answer wins.
+    """
+
+    def __init__(self, max_attempts: int = 1, backoff: float = 1.0, max_backoff: float = 30.0,
+                 jitter: float = 0.5, retry_on: Iterable[str] = ('connection', 'server'), hedge: bool = False,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 10, name: str = ""):
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = max(0.0, float(backoff))
+        self.max_backoff = max(0.0, float(max_backoff))
+        self.jitter = min(1.0, max(0.0, float(jitter)))
+        self.retry_on = frozenset(retry_on)
+        unknown = self.retry_on - set(ERROR_CLASSES)
+        if unknown:
+            raise ValueError(f"unknown retry error classes {sorted(unknown)}; expected some of {list(ERROR_CLASSES)}")
+        self.hedge = bool(hedge)
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = max(1, int(hedge_min_samples))
+        # Calls with the same name share a latency window (the step name)
+        self.name = name
+
+    @classmethod
+    def from_step(cls, step: Dict[str, Any]) -> 'RetryPolicy':
+        """Policy from a step's `retry:` (attempts, a mapping, or false) and `hedge:` (bool or mapping) keys"""
+        options = {'max_attempts': LLM_RETRY_ATTEMPTS, 'backoff': LLM_RETRY_BACKOFF,
+                   'max_backoff': LLM_RETRY_MAX_BACKOFF, 'jitter': LLM_RETRY_JITTER, 'retry_on': LLM_RETRY_ON,
+                   'hedge': LLM_HEDGE, 'hedge_quantile': LLM_HEDGE_QUANTILE,
+                   'hedge_min_samples': LLM_HEDGE_MIN_SAMPLES, 'name': step.get('name', '')}
+        retry = step.get('retry')
+        if retry is False:
+            options['max_attempts'] = 1
+        elif isinstance(retry, int) and not isinstance(retry, bool):
+            options['max_attempts'] = retry
+        elif isinstance(retry, dict):
+            options['max_attempts'] = retry.get('attempts', options['max_attempts'])
+            for key in ('backoff', 'max_backoff', 'jitter'):
+                options[key] = retry.get(key, options[key])
+            retry_on = retry.get('on', options['retry_on'])
+            options['retry_on'] = [retry_on] if isinstance(retry_on, str) else retry_on
+        hedge = step.get('hedge')
+        if isinstance(hedge, dict):
+            options['hedge'] = hedge.get('enabled', True)
+            options['hedge_quantile'] = hedge.get('quantile', options['hedge_quantile'])
+            options['hedge_min_samples'] = hedge.get('min_samples', options['hedge_min_samples'])
+        elif hedge is not None:
+            options['hedge'] = bool(hedge)
+        return cls(**options)
+
+    def should_retry(self, result: Dict[str, Any], attempt: int) -> bool:
+        if attempt >= self.max_attempts or result.get('too_large') or result.get('cancelled'):
+            return False
+        return result_error_class(result) in self.retry_on
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number `attempt` (from 1)"""
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def hedge_after(self, latencies: Optional[LatencyWindow]) -> Optional[float]:
+        """Seconds after which a call is hedged, or None (hedging off or too few observations)"""
+        if not self.hedge or latencies is None or len(latencies) < self.hedge_min_samples:
+            return None
+        return latencies.quantile(self.hedge_quantile)
@@ -0,0 +1,219 @@
+# core/llm_router.py
+import time
+import asyncio
+import threading
+from typing import Dict, List, Any, Iterable, Optional, Set
+
+from .config import (OLLAMA_ENDPOINTS, LLM_ROUTER_FAILURE_THRESHOLD, LLM_ROUTER_COOLDOWN,
+                     LLM_ROUTER_HEALTH_INTERVAL)
+
+
+class NoEndpointAvailable(RuntimeError):
+    """Every endpoint is down, has its circuit open, or does not serve the model"""
+
+
+class Endpoint:
+    """One Ollama daemon: requests in flight, the models it serves and its circuit breaker"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.completed = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        # Circuit breaker: no requests until open_until; afterwards one trial request (half-open)
+        self.open_until: Optional[float] = None
+        self.trial_in_flight = False
+        # None until a health check has listed the endpoint's models
+        self.models: Optional[Set[str]] = None
+        self.loaded: Set[str] = set()
+        self.last_check: Optional[float] = None
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models or model in self.loaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'url': self.url,
+            'outstanding': self.outstanding,
+            'completed': self.completed,
+            'errors': self.errors,
+            'circuit': 'open' if self.open_until is not None else 'closed',
+            'loaded': sorted(self.loaded),
+        }
+
+
+class LLMRouter:
+    """Spreads LLM requests over several Ollama endpoints serving the same models.
+
+    Each request goes to the endpoint with the fewest requests in flight among those serving
+    the model, counting `affinity_penalty` extra for endpoints that do not have the model loaded
+    yet. An endpoint failing `failure_threshold` times in a row (connection refused, 5xx) is
+    skipped for `cooldown` seconds, then gets a single trial request. Health checks of
+    /api/tags and /api/ps run in the background every `health_interval` seconds.
+    """
+
+    def __init__(self, urls: Iterable[str], failure_threshold: int = 3, cooldown: float = 30,
+                 health_interval: float = 15, affinity_penalty: int = 2, health_timeout: float = 2):
+        self.endpoints = [Endpoint(url) for url in urls]
+        if not self.endpoints:
+            raise ValueError("LLMRouter needs at least one endpoint")
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.health_interval = health_interval
+        self.affinity_penalty = affinity_penalty
+        self.health_timeout = health_timeout
+        self._lock = threading.Lock()
+        self._last_health: Optional[float] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    def acquire(self, model: str, exclude: Iterable[Endpoint] = ()) -> Endpoint:
+        """Reserve the best endpoint for one request to `model`; pair with release()"""
+        self._maybe_check_health()
+        excluded = set(id(endpoint) for endpoint in exclude)
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for position, endpoint in enumerate(self.endpoints):
+                if id(endpoint) in excluded or not endpoint.serves(model):
+                    continue
+                if endpoint.open_until is not None and (now < endpoint.open_until or endpoint.trial_in_flight):
+                    continue
+                load = endpoint.outstanding + (0 if model in endpoint.loaded else self.affinity_penalty)
+                candidates.append((load, position, endpoint))
+            if not candidates:
+                raise NoEndpointAvailable(f"no Ollama endpoint available for model {model}")
+            endpoint = min(candidates)[2]
+            if endpoint.open_until is not None:
+                endpoint.trial_in_flight = True
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, model: str, ok: bool = True):
+        """Finish a request; ok=False counts towards opening the endpoint's circuit"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.trial_in_flight = False
+            if ok:
+                endpoint.completed += 1
+                endpoint.consecutive_failures = 0
+                endpoint.loaded.add(model)
+                if endpoint.open_until is not None:
+                    print(f"[LLM] Endpoint {endpoint.url} recovered")
+                endpoint.open_until = None
+                return
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.open_until is not None or endpoint.consecutive_failures >= self.failure_threshold:
+                if endpoint.open_until is None:
+                    print(f"[LLM] Endpoint {endpoint.url} failed {endpoint.consecutive_failures} times, "
+                          f"skipping it for {self.cooldown:g}s")
+                endpoint.open_until = time.monotonic() + self.cooldown
+
+    def abandon(self, endpoint: Endpoint):
+        """Finish a request cancelled before it answered: neither a success nor a failure"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.trial_in_flight = False
+
+    def forget_model(self, endpoint: Endpoint, model: str):
+        """The endpoint answered 404 for `model`: route the model elsewhere"""
+        with self._lock:
+            endpoint.loaded.discard(model)
+            endpoint.models = (endpoint.models or set()) - {model}
+
+    @staticmethod
+    def is_endpoint_failure(error: BaseException) -> bool:
+        """Errors that say the endpoint is down or overloaded rather than the request being bad"""
+        status = getattr(error, 'status_code', None)
+        if status is not None:
+            return status >= 500 or status == 429
+        if isinstance(error, OSError):  # includes ConnectionError raised by the ollama client
+            return True
+        try:
+            import httpx
+        except ImportError:
+            return False
+        return isinstance(error, httpx.TransportError)
+
+    @staticmethod
+    def is_missing_model(error: BaseException) -> bool:
+        return getattr(error, 'status_code', None) == 404
+
+    def _maybe_check_health(self):
+        if self.health_interval <= 0:
+            return
+        now = time.monotonic()
+        if self._last_health is not None and now - self._last_health < self.health_interval:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # A check still pending on an earlier event loop (a previous asyncio.run) never finishes
+        task = self._health_task
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        self._last_health = now
+        self._health_task = loop.create_task(self.check_health())
+
+    async def check_health(self):
+        """Refresh each endpoint's served and loaded models; a reachable endpoint closes its circuit"""
+        import httpx
+        async with httpx.AsyncClient(timeout=self.health_timeout) as client:
+            await asyncio.gather(*(self._check(client, endpoint) for endpoint in self.endpoints))
+
+    async def _check(self, client, endpoint: Endpoint):
+        try:
+            tags = await client.get(f"{endpoint.url}/api/tags")
+            tags.raise_for_status()
+            ps = await client.get(f"{endpoint.url}/api/ps")
+            models = _model_names(tags.json())
+            loaded = _model_names(ps.json()) if ps.is_success else set()
+        except Exception as e:
+            with self._lock:
+                if endpoint.open_until is None:
+                    print(f"[LLM] Endpoint {endpoint.url} failed its health check: {e!r}")
+                endpoint.consecutive_failures = max(endpoint.consecutive_failures, self.failure_threshold)
+                endpoint.open_until = time.monotonic() + self.cooldown
+                endpoint.last_check = time.monotonic()
+            return
+        with self._lock:
+            endpoint.models = models
+            endpoint.loaded = loaded
+            endpoint.consecutive_failures = 0
+            endpoint.open_until = None
+            endpoint.last_check = time.monotonic()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+
+def _model_names(listing: Dict[str, Any]) -> Set[str]:
+    names = set()
+    for entry in listing.get('models', []):
+        name = entry.get('name') or entry.get('model')
+        if name:
+            names.add(name)
+            # "qwen2.5-coder:latest" is also requested as "qwen2.5-coder"
+            if name.endswith(':latest'):
+                names.add(name[:-len(':latest')])
+    return names
+
+
+_shared: Optional[LLMRouter] = None
+_shared_lock = threading.Lock()
+
+
+def shared_router() -> Optional[LLMRouter]:
+    """The OLLAMA_ENDPOINTS router shared by every LLMProcessor, or None for a single daemon"""
+    global _shared
+    if not OLLAMA_ENDPOINTS:
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = LLMRouter(OLLAMA_ENDPOINTS, LLM_ROUTER_FAILURE_THRESHOLD, LLM_ROUTER_COOLDOWN,
+                                LLM_ROUTER_HEALTH_INTERVAL)
+            print(f"LLM router: {', '.join(OLLAMA_ENDPOINTS)}")
+        return _shared
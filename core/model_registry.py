@@ -0,0 +1,75 @@
+# core/model_registry.py
+import os
+import pickle
+import threading
+import time
+from typing import Dict, Any, Callable, Tuple
+
+from .tracing import span
+
+# Process-wide cache of loaded models and FAISS indexes. Loading a SentenceTransformer,
+# CrossEncoder or FAISS index takes seconds, so every pipeline run, batch document and
+# service job in this process reuses the same instances.
+_models: Dict[Tuple, Any] = {}
+_load_times: Dict[Tuple, float] = {}
+_registry_lock = threading.Lock()
+_key_locks: Dict[Tuple, threading.Lock] = {}
+
+
+def _get_or_load(key: Tuple, loader: Callable[[], Any]) -> Any:
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _registry_lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    # Per-key lock: concurrent callers wait for one load instead of loading twice
+    with key_lock:
+        model = _models.get(key)
+        if model is None:
+            started = time.perf_counter()
+            with span(f"load {key[0]}", 'model_load', path=str(key[1])):
+                model = loader()
+            _load_times[key] = time.perf_counter() - started
+            _models[key] = model
+            print(f"[MODELS] Loaded {key[0]} {key[1]} in {_load_times[key]:.2f}s")
+    return model
+
+
+def get_sentence_transformer(model_path: str):
+    """Shared SentenceTransformer for an embedding model path or name"""
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_path)
+    return _get_or_load(('sentence_transformer', model_path), load)
+
+
+def get_cross_encoder(model_name: str):
+    """Shared CrossEncoder for a reranker model path or name"""
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name)
+    return _get_or_load(('cross_encoder', model_name), load)
+
+
+def get_faiss_index(index_path: str, meta_path: str):
+    """Shared (index, metadata) pair; reloaded when either file changes on disk"""
+    def load():
+        import faiss
+        index = faiss.read_index(index_path)
+        with open(meta_path, 'rb') as f:
+            meta = pickle.load(f)
+        return index, meta
+    key = ('faiss_index', index_path, meta_path, os.path.getmtime(index_path), os.path.getmtime(meta_path))
+    return _get_or_load(key, load)
+
+
+def stats() -> Dict[str, Any]:
+    """Loaded models and how long each took to load"""
+    return {' '.join(str(part) for part in key[:2]): round(seconds, 3) for key, seconds in _load_times.items()}
+
+
+def clear():
+    with _registry_lock:
+        _models.clear()
+        _load_times.clear()
+        _key_locks.clear()
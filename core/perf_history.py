@@ -0,0 +1,125 @@
+# core/perf_history.py
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+# Totals are halved past this many calls so the history follows recent hardware and model changes
+_MAX_CALLS = 5000
+
+
+class PerfHistory:
+    """Per-model LLM throughput and per-step costs of past runs, used to estimate new runs.
+
+    Stored as JSON:
+        models: {model: {calls, prompt_tokens, completion_tokens, seconds, prompt_seconds}}
+        steps:  {"<pipeline>:<step>": {runs, seconds, calls, completion_tokens}}
+    `prompt_seconds` is only known when the backend reports prefill time separately.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault('models', {})
+        data.setdefault('steps', {})
+        return data
+
+    def save(self):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _decay(totals: Dict[str, float]):
+        if totals.get('calls', 0) > _MAX_CALLS:
+            for key in totals:
+                totals[key] /= 2
+
+    def record_call(self, model: str, step: Optional[str], pipeline: str, prompt_tokens: int,
+                    completion_tokens: int, seconds: float, prompt_seconds: Optional[float] = None):
+        with self._lock:
+            totals = self.data['models'].setdefault(model, {
+                'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'seconds': 0.0, 'prompt_seconds': 0.0,
+                'timed_prefill_calls': 0,
+            })
+            totals['calls'] += 1
+            totals['prompt_tokens'] += prompt_tokens
+            totals['completion_tokens'] += completion_tokens
+            totals['seconds'] += seconds
+            if prompt_seconds is not None:
+                totals['prompt_seconds'] += prompt_seconds
+                totals['timed_prefill_calls'] += 1
+            self._decay(totals)
+            if step:
+                step_totals = self.data['steps'].setdefault(f"{pipeline}:{step}", {
+                    'runs': 0, 'seconds': 0.0, 'calls': 0, 'completion_tokens': 0,
+                })
+                step_totals['calls'] += 1
+                step_totals['completion_tokens'] += completion_tokens
+
+    def record_step(self, pipeline: str, step: str, seconds: float):
+        with self._lock:
+            totals = self.data['steps'].setdefault(f"{pipeline}:{step}", {
+                'runs': 0, 'seconds': 0.0, 'calls': 0, 'completion_tokens': 0,
+            })
+            totals['runs'] += 1
+            totals['seconds'] += seconds
+
+    def record_spans(self, pipeline: str, spans: List[Dict[str, Any]]):
+        """Fold a traced run's LLM call and step spans into the history and save it"""
+        for span in spans:
+            args = span['args']
+            if span['cat'] == 'llm' and args.get('success') and args.get('model') and not args.get('cached'):
+                # Server-reported counts when Ollama sent them; time spent queued is not the model's
+                seconds = max(0.0, span['wall'] - (args.get('queue_seconds') or 0))
+                self.record_call(args['model'], args.get('step'), pipeline,
+                                 args.get('prompt_tokens', args.get('prompt_tokens_est', 0)),
+                                 args.get('completion_tokens', args.get('completion_tokens_est', 0)),
+                                 seconds, args.get('prompt_seconds'))
+            elif span['cat'] == 'step' and not args.get('replayed'):
+                self.record_step(pipeline, span['name'], span['wall'])
+        self.save()
+
+    def model_rates(self, model: Optional[str], default_prompt_tps: float,
+                    default_decode_tps: float) -> Dict[str, Any]:
+        """Prefill and decode tokens/s for a model; defaults when it has never been run"""
+        totals = self.data['models'].get(model or '')
+        if not totals or totals['calls'] < 1 or totals['completion_tokens'] <= 0:
+            return {'prompt_tps': default_prompt_tps, 'decode_tps': default_decode_tps,
+                    'completion_tokens_per_call': None, 'calls': 0}
+        if totals.get('timed_prefill_calls') and totals['prompt_seconds'] > 0:
+            prompt_tps = totals['prompt_tokens'] / totals['prompt_seconds']
+            prompt_seconds = totals['prompt_seconds']
+        else:
+            prompt_tps = default_prompt_tps
+            prompt_seconds = totals['prompt_tokens'] / prompt_tps
+        # Whatever call time is not prefill is attributed to decoding (at least 10% of it)
+        decode_seconds = max(totals['seconds'] - prompt_seconds, totals['seconds'] * 0.1)
+        return {
+            'prompt_tps': prompt_tps,
+            'decode_tps': totals['completion_tokens'] / decode_seconds,
+            'completion_tokens_per_call': totals['completion_tokens'] / totals['calls'],
+            'calls': totals['calls'],
+        }
+
+    def step_stats(self, pipeline: str, step: str) -> Optional[Dict[str, Any]]:
+        totals = self.data['steps'].get(f"{pipeline}:{step}")
+        if not totals:
+            return None
+        return {
+            'seconds': totals['seconds'] / totals['runs'] if totals['runs'] else None,
+            'completion_tokens_per_call': (totals['completion_tokens'] / totals['calls']) if totals['calls'] else None,
+            'calls_per_run': (totals['calls'] / totals['runs']) if totals['runs'] else None,
+        }
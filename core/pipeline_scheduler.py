@@ -0,0 +1,304 @@
+# core/pipeline_scheduler.py
+import re
+import time
+import asyncio
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Iterable, Set
+
+# Python steps share the mutable pipeline context, so writes like
+# context['rag_pdf_faiss_index_path'] = ... create ordering constraints that
+# are not listed under `dependencies`. These patterns pick them up.
+_CONTEXT_WRITE_PATTERN = re.compile(r"context\[\s*['\"]([^'\"]+)['\"]\s*\](?:\[[^\]]*\])*\s*=(?!=)")
+_CONTEXT_SETDEFAULT_PATTERN = re.compile(r"context\.setdefault\(\s*['\"]([^'\"]+)['\"]")
+_OPAQUE_WRITE_PATTERN = re.compile(r"context\.update\(|context\[\s*[^'\"\s\]][^\]]*\]\s*=(?!=)")
+# Changes made inside a context value (context['x'].append(...), context['cfg']['k'] = v) bypass
+# LayeredContext, so they are not recorded with the step's context writes
+_IN_PLACE_WRITE_PATTERN = re.compile(
+    r"context\[[^\]]*\](?:\[[^\]]*\])*(?:\[[^\]]*\]\s*[-+*/%|&^]?=(?!=)"
+    r"|\.(?:append|extend|insert|update|pop|popitem|remove|clear|setdefault|add|discard|sort|reverse)\()"
+    r"|del\s+context\[[^\]]*\]\["
+)
+
+# Steps that write to the context from inside the engine rather than from YAML code
+_ENGINE_WRITES = {
+    'llm_breakdown_features': {'requirements'},
+}
+
+
+class PipelineScheduler:
+    """Run pipeline steps as a DAG built from their declared and implicit dependencies"""
+
+    def __init__(self, steps: List[Dict[str, Any]], mode: str = "dag",
+                 step_models: Optional[Dict[str, str]] = None):
+        self.steps = steps
+        self.order = [step['name'] for step in steps]
+        self.mode = mode
+        if len(set(self.order)) != len(self.order):
+            print("[WARN] Duplicate step names found, falling back to sequential scheduling")
+            self.mode = "sequential"
+        self.graph = self.build_dependency_graph(steps, self.mode)
+        # Consumer step name -> upstream foreach step it streams items from
+        self.stream_sources = {step['name']: step['stream_from'] for step in steps if step.get('stream_from')}
+        # Steps that change context values in place: their effect cannot be replayed from a cache
+        self.in_place_steps = {step['name'] for step in steps if self.changes_context_in_place(step)}
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+        # LLM step name -> model it calls. With more than one model, ready steps of the model in use
+        # run first and a step needing another model waits until the current one has no step running,
+        # so the server swaps models as rarely as the DAG allows.
+        self.step_models = step_models or {}
+        self.model_switches = 0
+        self._current_model: Optional[str] = None
+
+    @staticmethod
+    def _step_text(step: Dict[str, Any]) -> str:
+        """Concatenate every field of a step that can read from the context"""
+        parts = []
+        for key in ('code', 'run', 'input', 'prompt_template', 'foreach', 'pre_hook', 'post_hook'):
+            value = step.get(key)
+            if isinstance(value, str):
+                parts.append(value)
+        return "\n".join(parts)
+
+    @staticmethod
+    def _step_writes(step: Dict[str, Any]):
+        """Return (keys written to the context, whether the writes cannot be determined)"""
+        writes = set(_ENGINE_WRITES.get(step['name'], set()))
+        opaque = False
+        if step.get('type', '') in ("python", "run"):
+            code = step.get('code') or step.get('run') or ''
+            writes.update(_CONTEXT_WRITE_PATTERN.findall(code))
+            writes.update(_CONTEXT_SETDEFAULT_PATTERN.findall(code))
+            opaque = bool(_OPAQUE_WRITE_PATTERN.search(code))
+        return writes, opaque
+
+    @staticmethod
+    def changes_context_in_place(step: Dict[str, Any]) -> bool:
+        """Whether a python step modifies a value inside the context rather than assigning a key"""
+        if step.get('type', '') not in ("python", "run"):
+            return False
+        return bool(_IN_PLACE_WRITE_PATTERN.search(step.get('code') or step.get('run') or ''))
+
+    @classmethod
+    def build_dependency_graph(cls, steps: List[Dict[str, Any]], mode: str = "dag") -> Dict[str, Set[str]]:
+        """Map each step name to the set of step names it must wait for"""
+        names = [step['name'] for step in steps]
+        graph: Dict[str, Set[str]] = {name: set() for name in names}
+
+        if mode == "sequential":
+            for prev, name in zip(names, names[1:]):
+                graph[name].add(prev)
+            return graph
+
+        step_writes = {}
+        opaque_writers = set()
+        for step in steps:
+            writes, opaque = cls._step_writes(step)
+            step_writes[step['name']] = writes
+            if opaque:
+                opaque_writers.add(step['name'])
+        all_written = set().union(*step_writes.values()) if step_writes else set()
+
+        step_reads = {}
+        for step in steps:
+            text = cls._step_text(step)
+            step_reads[step['name']] = {
+                key for key in all_written
+                if re.search(r'\b' + re.escape(key) + r'\b', text)
+            }
+
+        for i, step in enumerate(steps):
+            name = step['name']
+            text = cls._step_text(step)
+
+            # Declared dependencies
+            for dep in step.get('dependencies', []) or []:
+                if dep in graph and dep != name:
+                    graph[name].add(dep)
+                else:
+                    print(f"[WARN] Step '{name}' depends on unknown step '{dep}', ignoring")
+
+            # Implicit dependencies on earlier steps only, so these never form cycles
+            reads_all_results = bool(re.search(r'\bstep_results\b', text))
+            for earlier in steps[:i]:
+                other = earlier['name']
+                if reads_all_results or other in opaque_writers:
+                    graph[name].add(other)
+                    continue
+                if re.search(r'\bdep_' + re.escape(other) + r'\b', text):
+                    graph[name].add(other)
+                    continue
+                # read-after-write, write-after-write and write-after-read on context keys
+                if (step_writes[other] & (step_reads[name] | step_writes[name])
+                        or step_writes[name] & step_reads[other]):
+                    graph[name].add(other)
+            if name in opaque_writers:
+                graph[name].update(earlier['name'] for earlier in steps[:i])
+
+            # Streaming consumers start alongside their upstream step: they wait for
+            # the upstream's own prerequisites and then read its items as they finish
+            source = step.get('stream_from')
+            if source:
+                cls._check_stream_source(step, steps[:i])
+                graph[name].discard(source)
+                graph[name].update(graph[source])
+
+        cls._check_acyclic(graph, names)
+        return graph
+
+    @staticmethod
+    def _check_stream_source(step: Dict[str, Any], earlier_steps: List[Dict[str, Any]]):
+        """Raise ValueError unless an llm step's stream_from names an earlier foreach (or streaming) step"""
+        source = step['stream_from']
+        # Only llm steps iterate an upstream's item stream; others would run before their input exists
+        if step.get('type') != 'llm':
+            raise ValueError(f"Step '{step['name']}' streams from '{source}', but only llm steps can stream "
+                             f"(type is '{step.get('type', '')}'); use dependencies instead")
+        upstream = next((s for s in earlier_steps if s['name'] == source), None)
+        if upstream is None:
+            raise ValueError(f"Step '{step['name']}' streams from '{source}', which is not an earlier step")
+        if not (upstream.get('foreach') or upstream.get('stream_from')):
+            raise ValueError(f"Step '{step['name']}' streams from '{source}', which is not a foreach step")
+
+    @staticmethod
+    def _check_acyclic(graph: Dict[str, Set[str]], names: List[str]):
+        """Raise ValueError if the dependency graph contains a cycle"""
+        state: Dict[str, int] = {}
+
+        def visit(node, path):
+            state[node] = 1
+            for dep in graph[node]:
+                if state.get(dep) == 1:
+                    cycle = path[path.index(dep):] + [dep] if dep in path else [node, dep]
+                    raise ValueError(f"Cyclic step dependencies: {' -> '.join(cycle)}")
+                if dep not in state:
+                    visit(dep, path + [dep])
+            state[node] = 2
+
+        for name in names:
+            if name not in state:
+                visit(name, [name])
+
+    async def run(self,
+                  run_step: Callable[[Dict[str, Any]], Awaitable[Any]],
+                  max_parallel: Optional[int] = None,
+                  stop: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """Run every step as soon as its dependencies are done; return results in step order.
+
+        Once stop() returns True no further steps are started; running ones are awaited and the
+        results of the steps that ran are returned.
+        """
+        steps_by_name = {step['name']: step for step in self.steps}
+        pending = {name: set(deps) for name, deps in self.graph.items()}
+        done: Set[str] = set()
+        running: Dict[asyncio.Task, str] = {}
+        results: Dict[str, Any] = {}
+        started = time.perf_counter()
+
+        async def timed(name):
+            step_start = time.perf_counter()
+            try:
+                return await run_step(steps_by_name[name])
+            finally:
+                step_end = time.perf_counter()
+                # run_step may already have attached its own measurements for this step
+                self.metrics.setdefault(name, {}).update({
+                    'type': steps_by_name[name].get('type', ''),
+                    'start': round(step_start - started, 4),
+                    'end': round(step_end - started, 4),
+                    'duration': round(step_end - step_start, 4),
+                })
+
+        try:
+            while pending or running:
+                stopping = stop is not None and stop()
+                ready = [name for name in self.order if name in pending and pending[name] <= done]
+                allowed = self._allowed_models(ready, running.values())
+                for name in ready:
+                    if stopping:
+                        break
+                    if max_parallel and len(running) >= max_parallel:
+                        break
+                    model = self.step_models.get(name)
+                    if model is not None and name not in self.stream_sources:
+                        if model not in allowed:
+                            continue
+                        if self._current_model not in (None, model):
+                            self.model_switches += 1
+                        self._current_model = model
+                    del pending[name]
+                    running[asyncio.create_task(timed(name))] = name
+
+                if not running:
+                    if stopping:
+                        break
+                    raise RuntimeError(f"Pipeline stalled with unresolved steps: {sorted(pending)}")
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    name = running.pop(task)
+                    results[name] = task.result()
+                    done.add(name)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        self.wall_time = time.perf_counter() - started
+        return {name: results[name] for name in self.order if name in results}
+
+    def _allowed_models(self, ready: List[str], running: Iterable[str]) -> Set[str]:
+        """Models whose ready steps may start now: those already running, else the current model if
+        it has a ready step, else the model of the first ready step. Streaming consumers are exempt."""
+        if len(set(self.step_models.values())) < 2:
+            return set(self.step_models.values())
+        running_models = {self.step_models[name] for name in running
+                          if name in self.step_models and name not in self.stream_sources}
+        if running_models:
+            return running_models
+        ready_models = [self.step_models[name] for name in ready
+                        if name in self.step_models and name not in self.stream_sources]
+        if self._current_model in ready_models:
+            return {self._current_model}
+        return set(ready_models[:1])
+
+    def critical_path(self):
+        """Return (step names, seconds) of the longest dependency chain by measured duration"""
+        finish: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+
+        def longest(name):
+            if name in finish:
+                return finish[name]
+            best_dep, best_time = None, 0.0
+            for dep in self.graph[name]:
+                dep_time = longest(dep)
+                if dep_time > best_time:
+                    best_dep, best_time = dep, dep_time
+            previous[name] = best_dep
+            finish[name] = best_time + self.metrics.get(name, {}).get('duration', 0.0)
+            return finish[name]
+
+        if not self.order:
+            return [], 0.0
+        for name in self.order:
+            longest(name)
+        tail = max(self.order, key=lambda n: finish[n])
+        path = []
+        node = tail
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return list(reversed(path)), round(finish[tail], 4)
+
+    def summary(self) -> Dict[str, Any]:
+        """Step timings, dependency graph and critical path for the last run"""
+        path, path_time = self.critical_path()
+        return {
+            'mode': self.mode,
+            'wall_time': round(getattr(self, 'wall_time', 0.0), 4),
+            'steps': self.metrics,
+            'dependencies': {name: sorted(deps) for name, deps in self.graph.items()},
+            'critical_path': path,
+            'critical_path_time': path_time,
+            'model_switches': self.model_switches,
+        }
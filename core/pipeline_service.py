@@ -0,0 +1,319 @@
+# core/pipeline_service.py
+import json
+import time
+import uuid
+import base64
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+from urllib.parse import unquote
+
+from .prompt_engine import PromptEngine
+from . import model_registry
+from .cancellation import CancelToken
+from .llm_router import shared_router
+from .config import SERVICE_WORKERS, SERVICE_MAX_JOBS
+
+# run_prompt options a client must not set through job inputs
+RESERVED_INPUT_NAMES = frozenset({'prompt_config_path', 'resume', 'output_dir', 'cancel_token', 'deadline',
+                                  'inputs', 'checkpoint', 'trace', 'step_cache', 'llm_model'})
+
+
+@dataclass
+class PipelineJob:
+    job_id: str
+    prompt_config_path: str
+    inputs: Dict[str, Any]
+    output_dir: Path
+    status: str = "queued"
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    deadline: Optional[float] = None
+    cancel_token: CancelToken = field(default_factory=CancelToken, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = self.result or {}
+        return {
+            'job_id': self.job_id,
+            'prompt': self.prompt_config_path,
+            'status': self.status,
+            'submitted': self.submitted,
+            'queue_time': round((self.started or time.time()) - self.submitted, 3),
+            'run_time': round((self.finished or time.time()) - self.started, 3) if self.started else None,
+            'run_id': result.get('run_id'),
+            'error': result.get('error') or self.cancel_token.reason,
+            'deadline': self.deadline,
+            'output_files': [Path(p).name for p in result.get('output_files', [])],
+            'metrics': result.get('metrics'),
+        }
+
+
+class PipelineService:
+    """Keep one warm PromptEngine resident and run submitted pipeline jobs from a queue.
+
+    Jobs run as tasks on a single event loop thread, so the engine, its caches, loaded
+    models and database wrappers are shared by every job; HTTP handler threads only
+    enqueue jobs and read their status.
+    """
+
+    def __init__(self, engine: Optional[PromptEngine] = None, workers: int = SERVICE_WORKERS,
+                 prompts_dir: str = "prompts", max_jobs: int = SERVICE_MAX_JOBS):
+        self.engine = engine or PromptEngine(interactive=False)
+        self.engine.interactive = False
+        self.workers = max(1, int(workers))
+        self.prompts_dir = Path(prompts_dir).resolve()
+        self.jobs_dir = self.engine.outputs_dir / "jobs"
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, PipelineJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self.started = None
+
+    def start(self):
+        """Start the event loop thread and its job workers"""
+        self._thread = threading.Thread(target=self._run_loop, name="pipeline-service", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        self.started = time.time()
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [self._loop.create_task(self._worker(n)) for n in range(self.workers)]
+        self._loop.call_soon(self._ready.set)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _shutdown(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        await self.engine.aclose()
+
+    def stop(self):
+        """Cancel running jobs and stop the loop thread"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self.engine.step_executor.shutdown()
+
+    def resolve_prompt(self, prompt: str) -> Path:
+        """Map a prompt name (oneshot, oneshot.yaml) to a YAML file inside the prompts directory"""
+        name = prompt if prompt.endswith(('.yaml', '.yml')) else f"{prompt}.yaml"
+        path = (self.prompts_dir / name).resolve()
+        if self.prompts_dir not in path.parents or not path.exists():
+            raise FileNotFoundError(f"Unknown prompt: {prompt}")
+        return path
+
+    def submit(self, prompt: str, inputs: Optional[Dict[str, Any]] = None,
+               files: Optional[Dict[str, Dict[str, str]]] = None,
+               deadline: Optional[float] = None) -> PipelineJob:
+        """Queue a job; `files` maps input names to {'filename', 'content_base64'} uploads.
+
+        `deadline` (seconds from the start of the run) overrides the pipeline's deadline.
+        Raises ValueError for inputs the pipeline does not declare and file inputs given as paths.
+        """
+        prompt_path = self.resolve_prompt(prompt)
+        inputs = dict(inputs or {})
+        self._validate_inputs(prompt_path, inputs, files or {})
+        job_id = uuid.uuid4().hex[:12]
+        output_dir = self.jobs_dir / job_id
+        for input_name, upload in (files or {}).items():
+            upload_path = output_dir / "inputs" / Path(upload['filename']).name
+            upload_path.parent.mkdir(parents=True, exist_ok=True)
+            upload_path.write_bytes(base64.b64decode(upload['content_base64']))
+            inputs[input_name] = str(upload_path)
+        job = PipelineJob(job_id, str(prompt_path), inputs, output_dir,
+                          deadline=float(deadline) if deadline is not None else None)
+        with self._jobs_lock:
+            self.jobs[job_id] = job
+            self._prune_jobs()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job_id)
+        return job
+
+    def _validate_inputs(self, prompt_path: Path, inputs: Dict[str, Any], files: Dict[str, Dict[str, str]]):
+        """Only declared inputs are accepted, and file inputs only as uploads (never server paths)"""
+        declared = {spec['name']: spec.get('type') for spec in
+                    self.engine._load_yaml_config(str(prompt_path)).get('inputs', []) or []}
+        for name in [*inputs, *files]:
+            if name in RESERVED_INPUT_NAMES:
+                raise ValueError(f"'{name}' is a run option, not a pipeline input")
+            if name not in declared:
+                raise ValueError(f"Unknown input '{name}' (pipeline inputs: {', '.join(declared) or 'none'})")
+        for name in inputs:
+            if declared[name] == 'file':
+                raise ValueError(f"File input '{name}' must be uploaded through 'files'")
+
+    def _prune_jobs(self):
+        """Forget the oldest finished jobs beyond max_jobs (their output files stay on disk)"""
+        finished = [j for j in self.jobs.values() if j.status in ("succeeded", "failed", "cancelled")]
+        for job in sorted(finished, key=lambda j: j.submitted)[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job.job_id]
+
+    def cancel(self, job_id: str) -> Optional[PipelineJob]:
+        """Cancel a job: a queued job never starts, a running one stops and flushes partial outputs"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_token.cancel(f"job {job_id} cancelled")
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished = time.time()
+        return job
+
+    def get(self, job_id: str) -> Optional[PipelineJob]:
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self._jobs_lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def health(self) -> Dict[str, Any]:
+        with self._jobs_lock:
+            statuses = [job.status for job in self.jobs.values()]
+        router = shared_router()
+        return {
+            'status': 'ok',
+            'uptime': round(time.time() - self.started, 1) if self.started else 0,
+            'workers': self.workers,
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'models': model_registry.stats(),
+            'llm_models': sorted(self.engine._llm_processors),
+            'llm_concurrency': {model: processor.limiter.stats()
+                                for model, processor in self.engine._llm_processors.items() if processor.limiter},
+            'llm_endpoints': router.stats() if router else None,
+        }
+
+    async def _worker(self, n: int):
+        while True:
+            job_id = await self._queue.get()
+            job = self.get(job_id)
+            if job is None or job.status == "cancelled":
+                continue
+            job.status = "running"
+            job.started = time.time()
+            print(f"[SERVICE] Worker {n} running job {job_id} ({Path(job.prompt_config_path).name})")
+            try:
+                job.result = await self.engine.run_prompt(job.prompt_config_path, output_dir=str(job.output_dir),
+                                                          cancel_token=job.cancel_token, deadline=job.deadline,
+                                                          inputs=job.inputs)
+            except Exception as e:
+                job.result = {'success': False, 'error': str(e)}
+            job.finished = time.time()
+            if job.result.get('success'):
+                job.status = "succeeded"
+            else:
+                job.status = "cancelled" if job.result.get('cancelled') else "failed"
+            print(f"[SERVICE] Job {job_id} {job.status} in {job.finished - job.started:.1f}s")
+
+    def warm_up(self, prompts: List[str]):
+        """Load databases, templates, python steps and models the given pipelines use"""
+        future = asyncio.run_coroutine_threadsafe(self._warm_up(prompts), self._loop)
+        return future.result()
+
+    async def _warm_up(self, prompts: List[str]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        engine = self.engine
+        for prompt in prompts:
+            try:
+                config = engine._load_yaml_config(str(self.resolve_prompt(prompt)))
+                await engine._load_databases_smart(config.get('databases', {}))
+                engine.templates.precompile(engine.templates.collect_templates(config))
+                engine.step_executor.precompile(config)
+                if any(step.get('type') == 'reranker' for step in config.get('processing_steps', []) or []):
+                    await asyncio.to_thread(model_registry.get_cross_encoder, engine._reranker_model_name())
+            except Exception as e:
+                print(f"[WARN] Warm-up of {prompt} failed: {e}")
+        seconds = time.perf_counter() - started
+        print(f"[SERVICE] Warm-up finished in {seconds:.1f}s")
+        return {'seconds': seconds, 'models': model_registry.stats()}
+
+
+class PipelineRequestHandler(BaseHTTPRequestHandler):
+    """JSON job API: POST /jobs, POST /jobs/<id>/cancel, GET /jobs, /jobs/<id>, /jobs/<id>/outputs[/<file>], /health"""
+
+    service: PipelineService = None
+
+    def _send_json(self, status: int, payload: Any):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self) -> List[str]:
+        return [unquote(part) for part in self.path.split('?', 1)[0].strip('/').split('/') if part]
+
+    def do_POST(self):
+        parts = self._route()
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            job = self.service.cancel(parts[1])
+            if job is None:
+                return self._send_json(404, {'error': f"Unknown job: {parts[1]}"})
+            return self._send_json(202, job.to_dict())
+        if parts != ['jobs']:
+            return self._send_json(404, {'error': 'Not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            job = self.service.submit(request['prompt'], request.get('inputs'), request.get('files'),
+                                      request.get('deadline'))
+        except FileNotFoundError as e:
+            return self._send_json(404, {'error': str(e)})
+        except (KeyError, ValueError, TypeError) as e:
+            return self._send_json(400, {'error': f"Invalid job request: {e}"})
+        self._send_json(202, job.to_dict())
+
+    def do_GET(self):
+        parts = self._route()
+        if parts == ['health']:
+            return self._send_json(200, self.service.health())
+        if parts == ['jobs']:
+            return self._send_json(200, self.service.list_jobs())
+        if len(parts) < 2 or parts[0] != 'jobs':
+            return self._send_json(404, {'error': 'Not found'})
+        job = self.service.get(parts[1])
+        if job is None:
+            return self._send_json(404, {'error': f"Unknown job: {parts[1]}"})
+        if len(parts) == 2:
+            return self._send_json(200, job.to_dict())
+        if parts[2] != 'outputs' or len(parts) > 4:
+            return self._send_json(404, {'error': 'Not found'})
+        output_files = {Path(p).name: Path(p) for p in (job.result or {}).get('output_files', [])}
+        if len(parts) == 3:
+            return self._send_json(200, sorted(output_files))
+        path = output_files.get(parts[3])
+        if path is None or not path.exists():
+            return self._send_json(404, {'error': f"Unknown output: {parts[3]}"})
+        body = path.read_bytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Disposition', f'attachment; filename="{path.name}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"[SERVICE] {self.address_string()} {format % args}")
+
+
+def create_server(service: PipelineService, host: str, port: int) -> ThreadingHTTPServer:
+    """HTTP server bound to a running service"""
+    handler = type('BoundPipelineRequestHandler', (PipelineRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
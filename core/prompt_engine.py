@@ -3,21 +3,44 @@ import os
 import yaml
 import json
 import asyncio
+import contextvars
+from collections import Counter
+from contextlib import AsyncExitStack, nullcontext
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Tuple
 from jinja2 import Environment, BaseLoader, Template
-from dotenv import load_dotenv
 
 from .database_autodiscovery import DatabaseAutoDiscovery, SmartDatabaseWrapper
 from .function_registry import DatabaseFunctionRegistry  
 from .template_analyzer import TemplateAnalyzer
 from .file_processor import FileProcessor
 from .llm_processor import LLMProcessor
-from .excel_generator import ExcelGenerator
+from .pipeline_scheduler import PipelineScheduler
+from .step_cache import StepResultCache, stable_hash
+from .run_checkpoint import RunCheckpoint
+from .template_cache import TemplateCache
+from .layered_context import LayeredContext
+from .step_executor import PythonStepExecutor, compile_step_code
+from .item_stream import ItemStream
+from .model_registry import get_sentence_transformer, get_cross_encoder, get_faiss_index
+from .tracing import Tracer, span
+from .perf_history import PerfHistory
+from .cancellation import CancelToken, RunCancelled, current_token, guarded, is_cancelled
+from .llm_cache import llm_cache_allowed
+from .llm_retry import RetryPolicy
+from .llm_metrics import LLMUsage, track_llm_calls
+from .json_scanner import extract_json
+from .config import (FOREACH_MAX_CONCURRENCY, STEP_CACHE_ENABLED, STEP_CACHE_PATH, STEP_CACHE_MAX_BYTES,
+                     CHECKPOINT_RUNS, PYTHON_STEP_WORKERS, TRACE_RUNS, PERF_HISTORY_PATH,
+                     RUN_DEADLINE, BREAKDOWN_BATCH_SIZE, BREAKDOWN_MAX_RETRIES, LLM_PRELOAD_MODELS,
+                     LLM_KEEP_ALIVE, LLM_KEEP_ALIVE_IDLE)
 
-# Load environment variables from .env file
-load_dotenv()
+# Model selected for the current run. Several runs can share one engine (batch documents,
+# service jobs); each runs in its own task, so each sees only its own model and processor.
+_run_llm_model: contextvars.ContextVar = contextvars.ContextVar('run_llm_model', default=None)
+_run_llm_processor: contextvars.ContextVar = contextvars.ContextVar('run_llm_processor', default=None)
 
 class PromptEngine:
     def discover_faiss_indexes(self, index_dir=None):
@@ -37,24 +60,20 @@ class PromptEngine:
         return index_files
 
     def load_faiss_index(self, index_path, meta_path):
-        import faiss
-        import pickle
-        index = faiss.read_index(index_path)
-        with open(meta_path, 'rb') as f:
-            meta = pickle.load(f)
-        return index, meta
+        return get_faiss_index(index_path, meta_path)
 
     def query_all_faiss_indexes(self, query_text, index_dir=None, embedding_model_path=None, top_k=3):
-        from sentence_transformers import SentenceTransformer
         import numpy as np
         if embedding_model_path is None:
             embedding_model_path = r"C:/Users/cyqt2/Database/overhaul/jina_reranker/minilm-embedding"
-        model = SentenceTransformer(embedding_model_path)
-        query_emb = model.encode([query_text], convert_to_numpy=True)
+        model = get_sentence_transformer(embedding_model_path)
+        with span('embed_query', 'faiss'):
+            query_emb = model.encode([query_text], convert_to_numpy=True)
         results = []
         for idx_path, meta_path in self.discover_faiss_indexes(index_dir):
             index, meta = self.load_faiss_index(idx_path, meta_path)
-            D, I = index.search(query_emb, top_k)
+            with span('faiss_search', 'faiss', index=os.path.basename(idx_path), top_k=top_k):
+                D, I = index.search(query_emb, top_k)
             for idx in I[0]:
                 if idx < len(meta['metadatas']):
                     results.append({
@@ -72,6 +91,9 @@ class PromptEngine:
         cleaned = re.sub(r'^```[a-zA-Z0-9]*\s*\n', '', raw.strip())
         cleaned = re.sub(r'```\s*$', '', cleaned)
         return cleaned.strip()
+    def _extract_and_fix_json_from_raw_response(self, raw_response):
+        """JSON object or array in an LLM response, repairing fences, trailing commas and truncation; None if there is none."""
+        return extract_json(raw_response)
     def flatten_clause_requirements(self, clauses: list) -> list:
         """
         Given a list of clause texts, extract bullet points or feature-level requirements.
@@ -120,13 +142,20 @@ class PromptEngine:
     def __init__(self, 
                  databases_dir: str = "databases", 
                  prompts_dir: str = "prompts",
-                 outputs_dir: str = "outputs"):
+                 outputs_dir: str = "outputs",
+                 max_foreach_concurrency: Optional[int] = None,
+                 interactive: bool = True):
         self.databases_dir = Path(databases_dir)
         self.prompts_dir = Path(prompts_dir)
         self.outputs_dir = Path(outputs_dir)
         
         # Ensure output directory exists
         self.outputs_dir.mkdir(exist_ok=True)
+        # When False, missing inputs fall back to their defaults instead of prompting on stdin
+        self.interactive = interactive
+
+        # Global cap on foreach items in flight; each step's `concurrency:` is clamped to it
+        self.max_foreach_concurrency = max(1, int(max_foreach_concurrency or FOREACH_MAX_CONCURRENCY))
         
         # Initialize components
         self.discovery_engine = DatabaseAutoDiscovery()
@@ -134,33 +163,193 @@ class PromptEngine:
         self.template_analyzer = TemplateAnalyzer(self.function_registry)
         self.file_processor = FileProcessor()
         self.llm_processor = LLMProcessor()
+        self.llm_model = None
+        # Warm state reused across runs: one LLMProcessor per model, one wrapper per database file
+        self._llm_processors: Dict[str, LLMProcessor] = {}
+        self._database_wrappers: Dict[tuple, SmartDatabaseWrapper] = {}
         
         # Initialize database schemas storage
         self._database_schemas = {}
         
-        # Jinja2 environment for template rendering
+        # Jinja2 environment for template rendering; templates are compiled once per source text
         self.jinja_env = Environment(loader=BaseLoader())
+        self.templates = TemplateCache(self.jinja_env)
         
         # New: Initialize LlamaIndex query engines
         self.llamaindex_engines = {}
+
+        # Step result cache, created on first use by _get_step_cache
+        self.step_cache = None
+        # python/run steps: cached code objects, optional worker process pool
+        self.step_executor = PythonStepExecutor(max_workers=PYTHON_STEP_WORKERS)
+        # Throughput and step costs of past runs, for plan_run estimates
+        self.perf_history = PerfHistory(PERF_HISTORY_PATH)
         
         print("Prompt engine components initialized")
+
+    @property
+    def llm_processor(self) -> LLMProcessor:
+        """The current run's LLMProcessor, or the engine default outside a run"""
+        return _run_llm_processor.get() or self._llm_processor
+
+    @llm_processor.setter
+    def llm_processor(self, processor):
+        self._llm_processor = processor
+
+    @property
+    def llm_model(self) -> Optional[str]:
+        return _run_llm_model.get() or self._llm_model
+
+    @llm_model.setter
+    def llm_model(self, model):
+        self._llm_model = model
+
+    def get_llamaindex_engine(self, db_path: str):
+        """One LlamaIndex text-to-SQL engine per database; llama_index is only imported here"""
+        engine = self.llamaindex_engines.get(db_path)
+        if engine is None:
+            from .llamaindex_query_engine import LlamaIndexQueryEngine
+            with span(f"load llamaindex {Path(db_path).name}", 'model_load', path=str(db_path)):
+                engine = LlamaIndexQueryEngine(db_path, llm_model=self.llm_model or "qwen2.5-coder:7b-instruct")
+            self.llamaindex_engines[db_path] = engine
+        return engine
+
+    async def aclose(self):
+        """Close the pooled Ollama connections of this engine's LLM processors"""
+        processors = {id(p): p for p in [self._llm_processor, *self._llm_processors.values()]}
+        for processor in processors.values():
+            if hasattr(processor, 'aclose'):
+                await processor.aclose()
+
+    def _get_llm_processor(self, model: str) -> LLMProcessor:
+        """Reuse one LLMProcessor per model across runs"""
+        processor = self._llm_processors.get(model)
+        if processor is None:
+            processor = self._llm_processors[model] = LLMProcessor(model=model)
+        return processor
+
+    def _model_llm_processor(self, model: Optional[str]) -> LLMProcessor:
+        """The run's processor for its own model (or model=None), else the shared one for `model`"""
+        default = self.llm_processor
+        if not model or model == getattr(default, 'model', None):
+            return default
+        return self._get_llm_processor(model)
+
+    def _step_models(self, steps: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Model each LLM step calls: its `model:` key, else the run's model"""
+        default = getattr(self.llm_processor, 'model', None)
+        models = {}
+        for step in steps:
+            if step.get('type') == 'llm' or step['name'] == 'llm_breakdown_features':
+                model = step.get('model') or default
+                if model:
+                    models[step['name']] = model
+        return models
+
+    async def _preload_models(self, models: List[str]) -> Dict[str, Any]:
+        """Load the run's models in parallel, each kept loaded for LLM_KEEP_ALIVE"""
+        processors = [self._model_llm_processor(model) for model in models]
+        loads = await asyncio.gather(*(processor.load(LLM_KEEP_ALIVE) for processor in processors
+                                       if hasattr(processor, 'load')))
+        for load in loads:
+            if load['success']:
+                print(f"[LLM] Preloaded {load['model']} in {load['seconds']:.2f}s")
+        return {load['model']: load for load in loads}
+
+    @staticmethod
+    def _reranker_model_name() -> str:
+        """Local CrossEncoder for offline support, else the HuggingFace model"""
+        local_model_path = os.path.abspath('./jina_reranker/cross-encoder').replace('\\', '/')
+        if os.path.exists(local_model_path):
+            return local_model_path
+        print("[WARN] Local CrossEncoder model not found, falling back to HuggingFace")
+        return 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+    def _ask(self, message: str) -> str:
+        """Prompt on stdin for a missing input; non-interactive engines answer '' (use the default)"""
+        return input(message) if self.interactive else ''
     
-    async def run_prompt(self, prompt_config_path: str, **kwargs) -> Dict[str, Any]:
-        """Run a prompt configuration with inputs and return results"""
-        self.llm_model = kwargs.get('llm_model')
+    async def run_prompt(self, prompt_config_path: Optional[str] = None, resume: Optional[str] = None,
+                         output_dir: Optional[str] = None, cancel_token: Optional[CancelToken] = None,
+                         deadline: Optional[float] = None, inputs: Optional[Dict[str, Any]] = None,
+                         **kwargs) -> Dict[str, Any]:
+        """Run a prompt configuration with inputs and return results.
+
+        Input values come from `inputs` and/or keyword arguments (keyword arguments win).
+
+        Every finished step and foreach item is checkpointed under outputs/runs/<run_id>/.
+        Pass resume=<run_id> to continue a run from its last completed unit of work.
+        Output files are written to output_dir (default: the engine's outputs directory).
+        cancel_token.cancel() or the deadline (seconds; else the config's `deadline:`, else
+        RUN_DEADLINE) aborts in-flight LLM calls, skips pending work and flushes partial outputs.
+        """
+        kwargs = {**(inputs or {}), **kwargs}
+        checkpoint = None
+        if resume:
+            try:
+                checkpoint = RunCheckpoint.open(self.outputs_dir, resume)
+            except FileNotFoundError as e:
+                return {'success': False, 'error': str(e)}
+            prompt_config_path = prompt_config_path or checkpoint.manifest['prompt_config_path']
+            # Explicit arguments win over the inputs recorded with the original run
+            kwargs = {**checkpoint.manifest.get('inputs', {}), **kwargs}
+            print(f"Resuming run {resume}")
+        if not prompt_config_path:
+            raise ValueError("prompt_config_path is required unless resuming a run")
+
+        _run_llm_model.set(kwargs.get('llm_model'))
+        _run_llm_processor.set(None)
         # Use local MiniLM embedding model for all embedding steps
         self.embedding_model = None  # Set dynamically if needed
         config = self._load_yaml_config(prompt_config_path)
 
         # Remove ChromaDB support: FAISS only
 
+        if checkpoint is None and kwargs.get('checkpoint', CHECKPOINT_RUNS):
+            checkpoint = RunCheckpoint.create(self.outputs_dir, prompt_config_path, kwargs)
+        run_id = checkpoint.run_id if checkpoint else None
+        if run_id:
+            print(f"Run ID: {run_id}")
+
+        cancel_token = cancel_token or CancelToken()
+        deadline = deadline or config.get('deadline') or RUN_DEADLINE
+        if deadline and cancel_token.deadline is None:
+            cancel_token.start_deadline(float(deadline))
+
+        tracer = None
+        if kwargs.get('trace', TRACE_RUNS):
+            tracer = Tracer(run_id or f"{Path(prompt_config_path).stem}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}")
+        with tracer.activate() if tracer else nullcontext(), cancel_token.activate():
+            result = await self._run_loaded_config(config, checkpoint, output_dir, kwargs)
+        if tracer:
+            # Trace next to the run's outputs: <run>_trace.json (Chrome trace) and <run>_trace_summary.txt
+            result['trace_files'] = tracer.export(Path(output_dir) if output_dir else self.outputs_dir,
+                                                  tracer.name, result.get('metrics'))
+            print(f"Trace written to {result['trace_files'][0]}")
+            if result.get('success'):
+                self.perf_history.record_spans(Path(prompt_config_path).stem, tracer.spans)
+        return result
+
+    async def plan_run(self, prompt_config_path: str, **kwargs) -> Dict[str, Any]:
+        """Dry run: execute only cheap python steps and estimate LLM calls, tokens and wall time"""
+        from .run_planner import RunPlanner
+        return await RunPlanner(self, self.perf_history).plan(prompt_config_path, **kwargs)
+
+    async def _run_loaded_config(self, config: Dict[str, Any], checkpoint: Optional[RunCheckpoint],
+                                 output_dir: Optional[str], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Process inputs, execute the pipeline and generate outputs for a loaded config (kwargs: run inputs)"""
+        run_id = checkpoint.run_id if checkpoint else None
         try:
             # config already loaded above, do not reload
             validation = self.template_analyzer.validate_template(config)
             if not validation['valid']:
                 return {'success': False, 'error': f"Configuration errors: {validation['errors']}"}
 
+            if config.get('precompile_templates', True):
+                precompiled = self.templates.precompile(TemplateCache.collect_templates(config))
+                print(f"Precompiled {precompiled['compiled']} templates in {precompiled['seconds'] * 1000:.1f}ms")
+            self.step_executor.precompile(config)
+
             inputs_config = config.get('inputs', [])
             input_data = await self._process_inputs(inputs_config, **kwargs)
 
@@ -168,7 +357,7 @@ class PromptEngine:
             self.embedding_model = r"C:/Users/cyqt2/Database/overhaul/jina_reranker/minilm-embedding"
             llm_model = input_data.get('llm_model') or getattr(self, 'llm_model', None)
             if llm_model:
-                self.llm_processor = LLMProcessor(model=llm_model)
+                _run_llm_processor.set(self._get_llm_processor(llm_model))
             # print(f"Using embedding model: {self.embedding_model}")
 
             databases = await self._load_databases_smart(config.get('databases', {}))
@@ -182,11 +371,16 @@ class PromptEngine:
                 'config': config
             }
 
-            pipeline_results = await self._execute_pipeline(
-                config.get('processing_steps', []),
-                context
-            )
+            with span('pipeline', 'pipeline'):
+                pipeline_results = await self._execute_pipeline(
+                    config.get('processing_steps', []),
+                    context,
+                    step_cache=self._get_step_cache(kwargs.get('step_cache', config.get('step_cache'))),
+                    checkpoint=checkpoint
+                )
             context['step_results'] = pipeline_results
+            if is_cancelled():
+                return await self._flush_cancelled_run(config, context, checkpoint, output_dir)
 
 
             # NEW: If extract_clauses step returns structured requirements, pass them to context for downstream steps
@@ -304,22 +498,78 @@ class PromptEngine:
                 if isinstance(rerank_result, dict) and 'results' in rerank_result:
                     context['reranked_candidates'] = rerank_result['results']
 
-            output_files = await self._generate_outputs(
-                config.get('outputs', []),
-                context
-            )
+            output_template_stats = {}
+            with self.templates.track(output_template_stats), span('outputs', 'outputs'):
+                output_files = await self._generate_outputs(
+                    config.get('outputs', []),
+                    context,
+                    output_dir=output_dir
+                )
+            context.setdefault('pipeline_metrics', {})['outputs'] = output_template_stats
 
+            if checkpoint:
+                checkpoint.mark('completed')
             return {
                 'success': True,
+                'run_id': run_id,
                 'pipeline_results': pipeline_results,
-                'output_files': output_files
+                'output_files': output_files,
+                'metrics': context.get('pipeline_metrics', {})
             }
+        except RunCancelled as e:
+            if checkpoint:
+                checkpoint.mark('cancelled', e.reason)
+            return {'success': False, 'cancelled': True, 'error': e.reason, 'run_id': run_id}
         except Exception as e:
             import traceback
             traceback.print_exc()
-            return {'success': False, 'error': str(e)}
+            if checkpoint:
+                checkpoint.mark('failed', str(e))
+                print(f"Run {run_id} can be resumed with resume='{run_id}'")
+            return {'success': False, 'error': str(e), 'run_id': run_id}
+
+
+    async def _flush_cancelled_run(self, config: Dict[str, Any], context: Dict[str, Any],
+                                   checkpoint: Optional[RunCheckpoint], output_dir: Optional[str]) -> Dict[str, Any]:
+        """Write what a cancelled run finished: its outputs where they render, plus all step results as JSON"""
+        reason = current_token().reason
+        run_id = checkpoint.run_id if checkpoint else None
+        print(f"[CANCEL] Run stopped ({reason}); flushing partial outputs")
+        try:
+            with span('outputs', 'outputs', partial=True):
+                output_files = await self._generate_outputs(config.get('outputs', []), context, output_dir=output_dir)
+        except Exception as e:
+            print(f"[WARN] Outputs of the cancelled run could not be generated: {e}")
+            output_files = []
+        partial_path = Path(output_dir or self.outputs_dir) / f"partial_results_{context['timestamp']}.json"
+        partial_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            json.dump({'cancelled': reason, 'step_results': context['step_results']}, f, indent=2, default=str)
+        output_files.append(str(partial_path))
+        if checkpoint:
+            checkpoint.mark('cancelled', reason)
+            print(f"Run {run_id} can be resumed with resume='{run_id}'")
+        return {
+            'success': False,
+            'cancelled': True,
+            'error': reason,
+            'run_id': run_id,
+            'pipeline_results': context['step_results'],
+            'output_files': output_files,
+            'metrics': context.get('pipeline_metrics', {})
+        }
+
+    def _get_step_cache(self, enabled: Optional[bool] = None) -> Optional[StepResultCache]:
+        """Return the shared step result cache, or None if caching is disabled for this run"""
+        if enabled is None:
+            enabled = STEP_CACHE_ENABLED
+        if not enabled:
+            return None
+        if self.step_cache is None:
+            self.step_cache = StepResultCache(STEP_CACHE_PATH, STEP_CACHE_MAX_BYTES)
+            print(f"Step result cache enabled: {STEP_CACHE_PATH}")
+        return self.step_cache
 
-    
     def _load_yaml_config(self, prompt_file: str) -> Dict[str, Any]:
         """Load and parse YAML configuration"""
         
@@ -351,7 +601,7 @@ class PromptEngine:
                 file_path = kwargs.get(input_name)
                 if not file_path:
                     # Only prompt if not provided (should never happen in Streamlit)
-                    file_path = input(f"Enter path for {input_name} ({desc}): ")
+                    file_path = self._ask(f"Enter path for {input_name} ({desc}): ")
                 if not file_path and required:
                     raise ValueError(f"Required input '{input_name}' not provided")
                 if file_path and Path(file_path).exists():
@@ -365,7 +615,7 @@ class PromptEngine:
             elif input_type == 'text':
                 value = kwargs.get(input_name, default)
                 if value is None:
-                    value = input(f"📝 Enter {input_name} (default: {default}): ").strip() or default
+                    value = self._ask(f"📝 Enter {input_name} (default: {default}): ").strip() or default
                 input_data[input_name] = value
             elif input_type == 'option':
                 options = input_spec.get('options', [])
@@ -374,7 +624,7 @@ class PromptEngine:
                     print(f"Select {input_name}:")
                     for i, option in enumerate(options, 1):
                         print(f"  {i}. {option}")
-                    choice = input(f"Enter choice (1-{len(options)}, default: {default}): ").strip()
+                    choice = self._ask(f"Enter choice (1-{len(options)}, default: {default}): ").strip()
                     if choice and choice.isdigit():
                         choice_idx = int(choice) - 1
                         if 0 <= choice_idx < len(options):
@@ -387,7 +637,7 @@ class PromptEngine:
             elif input_type == 'number':
                 value = kwargs.get(input_name, default)
                 if value is None:
-                    value = input(f"🔢 Enter {input_name} (default: {default}): ").strip()
+                    value = self._ask(f"🔢 Enter {input_name} (default: {default}): ").strip()
                 try:
                     if value:
                         input_data[input_name] = float(value)
@@ -400,7 +650,7 @@ class PromptEngine:
             elif input_type == 'boolean':
                 value = kwargs.get(input_name, default)
                 if value is None:
-                    value = input(f"[y/n] {input_name} (default: {default}): ").strip().lower()
+                    value = self._ask(f"[y/n] {input_name} (default: {default}): ").strip().lower()
                 if isinstance(value, str):
                     if value in ['y', 'yes', 'true', '1']:
                         input_data[input_name] = True
@@ -422,9 +672,14 @@ class PromptEngine:
             if not Path(db_path).exists():
                 print(f"Database not found: {db_path}, skipping {db_name}")
                 continue
-            wrapper = SmartDatabaseWrapper(db_path, self.discovery_engine)
+            # Schema discovery runs once per database file (and again only if it changes)
+            wrapper_key = (db_name, str(Path(db_path).resolve()), os.path.getmtime(db_path))
+            wrapper = self._database_wrappers.get(wrapper_key)
+            if wrapper is None:
+                wrapper = SmartDatabaseWrapper(db_path, self.discovery_engine)
+                self._database_wrappers[wrapper_key] = wrapper
+                self.function_registry.register_database(db_name, wrapper)
             smart_databases[db_name] = wrapper
-            self.function_registry.register_database(db_name, wrapper)
             available_functions = len(self.function_registry.get_available_functions(db_name))
             print(f"{db_name}: {available_functions} functions auto-discovered")
         # Autodetect FAISS indexes in faiss_indexes/
@@ -437,271 +692,688 @@ class PromptEngine:
         self._last_loaded_databases = smart_databases
         return smart_databases
     
-    async def _execute_pipeline(self, steps: List[Dict[str, Any]], context: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute the processing pipeline with unified context passing, including reranker support"""
+    async def _execute_pipeline(self, steps: List[Dict[str, Any]], context: Dict[str, Any],
+                                step_cache: Optional[StepResultCache] = None,
+                                checkpoint: Optional[RunCheckpoint] = None) -> Dict[str, Any]:
+        """Execute the processing pipeline as a dependency DAG with unified context passing, including reranker support"""
         results = {}
-        llm_model = getattr(self, 'llm_model', None)
-        embedding_model = getattr(self, 'embedding_model', None)
+        config = context.get('config') or {}
+        scheduler_mode = config.get('scheduler', 'dag')
+        step_models = self._step_models(steps)
+        scheduler = PipelineScheduler(steps, mode=scheduler_mode,
+                                      step_models=step_models if config.get('model_affinity', True) else None)
+        # Steps left per model: a model stays loaded until its last step has finished
+        models_remaining = Counter(step_models.values())
+        for model in models_remaining:
+            self._model_llm_processor(model).keep_alive = LLM_KEEP_ALIVE
+        preload = None
+        if models_remaining and config.get('preload_models', LLM_PRELOAD_MODELS):
+            preload = asyncio.ensure_future(self._preload_models(list(models_remaining)))
+        unloads = []
+        # Hash of each finished step's result and context writes, used to key dependent steps in the cache
+        step_hashes = {}
+        cached_steps = []
+        resumed_steps = []
+        interrupted_steps = []
+        inputs_hash = stable_hash(context.get('inputs', {})) if step_cache else None
+        # Per-item result streams of foreach steps that a `stream_from` step consumes
+        item_streams = {source: ItemStream(source) for source in set(scheduler.stream_sources.values())}
+        # Set once a stream source has been replayed or has started running: its consumers start
+        # alongside it and only know then whether it has a result hash to key them with
+        stream_started = {source: asyncio.Event() for source in item_streams}
+        # Consumers whose upstream ran: no result hash when they start, so no cache lookup
+        unkeyed_stream_steps = []
 
-        for step in steps:
-            # Reduced debug output for clarity
+        def source_started(step_name):
+            if step_name in stream_started:
+                stream_started[step_name].set()
+
+        def replay(step_name, entry):
+            context.update(entry['context_updates'])
+            results[step_name] = entry['result']
+            step_hashes[step_name] = stable_hash(entry)
+            source_started(step_name)
+            return entry['result']
+
+        def close_stream(step, dependencies):
+            """Make sure consumers of a step's items see every item, then end its stream"""
+            stream = item_streams.get(step['name'])
+            if stream is None or stream.closed:
+                return
+            step_result = results.get(step['name'])
+            sources = None
+            if isinstance(step_result, list) and step.get('foreach'):
+                # Replayed steps never streamed; recover the items their results came from
+                try:
+                    step_context = self._build_step_context(context, results, dependencies)
+                    sources = self._resolve_foreach_items(step, step_context, context, results)
+                except Exception as e:
+                    print(f"[WARN] Could not recover foreach items of replayed step '{step['name']}': {e}")
+            stream.close(step_result, sources)
+
+        def model_finished(step_name):
+            """After a model's last step, let it expire, or free its memory for models still to run"""
+            model = step_models.get(step_name)
+            if model is None:
+                return
+            models_remaining[model] -= 1
+            if models_remaining[model]:
+                return
+            processor = self._model_llm_processor(model)
+            processor.keep_alive = LLM_KEEP_ALIVE_IDLE or None
+            if any(models_remaining.values()) and hasattr(processor, 'unload'):
+                print(f"[LLM] {model} has no steps left in this run, unloading it")
+                unloads.append(asyncio.ensure_future(processor.unload()))
+
+        async def run_step(step):
             step_name = step['name']
-            step_type = step.get('type', '')
-            # Support both 'prompt_template' and 'input' keys for LLM prompts
-            prompt_template = step.get('prompt_template', '') or step.get('input', '')
-            dependencies = step.get('dependencies', [])
-            timeout = step.get('timeout', 120)
-            if llm_model:
-                step['llm_model'] = llm_model
-            if embedding_model:
-                step['embedding_model'] = embedding_model
-
-            for dep in dependencies:
-                if dep in results:
-                    context[f"dep_{dep}"] = results[dep]
-
-            step_context = context.copy()
-            step_context['step_results'] = results.copy()
-            for dep in dependencies:
-                if dep in results:
-                    step_context[f"dep_{dep}"] = results[dep]
-
-            # For LLM steps, inject drawing_image_path from context if present and attach image for vision models
-            image_bytes = None
-            if step_type == "llm":
-                if 'drawing_image_path' in context:
-                    step_context['drawing_image_path'] = context['drawing_image_path']
-                    llm_model_val = step.get('llm_model') or step_context.get('llm_model', '')
-                    image_path = context['drawing_image_path']
-                    if llm_model_val and 'moondream' in llm_model_val.lower() and image_path and Path(image_path).exists():
-                        try:
-                            with open(image_path, 'rb') as f:
-                                image_bytes = f.read()
-                        except Exception as e:
-                            print(f"[ERROR] Could not read image for vision model: {e}")
-            # Remove ChromaDB semantic search step: FAISS only
-
-            # Force breakdown=True for any LLM step named 'llm_breakdown_features'
-            if step_name == "llm_breakdown_features":
-                print(f"[DEBUG] Forcing breakdown=True for step: {step_name}")
-                # Patch: Flatten all features from all clauses for LLM breakdown
-                features = []
-                # Try to get clauses from dependencies (load_clauses step)
-                dep_clauses = None
-                if 'dep_load_clauses' in step_context and 'clauses' in step_context['dep_load_clauses']:
-                    dep_clauses = step_context['dep_load_clauses']['clauses']
-                elif 'clauses' in step_context:
-                    dep_clauses = step_context['clauses']
-                if dep_clauses and isinstance(dep_clauses, list):
-                    for clause in dep_clauses:
-                        if isinstance(clause, dict) and 'features' in clause and isinstance(clause['features'], list):
-                            features.extend([f for f in clause['features'] if isinstance(f, str) and f.strip()])
-                # Fallback: try requirements
-                elif 'requirements' in step_context and isinstance(step_context['requirements'], list):
-                    features = [f for f in step_context['requirements'] if isinstance(f, str) and f.strip()]
-                print(f"[DEBUG] Features to send to LLM: {features[:3]} ... (total {len(features)})")
-                atomic_map = {}
-                for feature in features:
+            try:
+                with span(step_name, 'step', step=step_name, type=step.get('type', '')) as attrs:
                     try:
-                        # Directly send the feature string to the LLM for breakdown
-                        print(f"[LLM TEST] Sending feature string to LLM: {feature!r}")
-                        step_result = await self.llm_processor.process_prompt(feature, timeout, breakdown=True)
-                        atomic_value = ""
-                        if step_result and isinstance(step_result, dict):
-                            parsed = step_result.get('parsed_result')
-                            if parsed and isinstance(parsed, dict):
-                                atomic_value = parsed.get('atomic_requirement', "")
-                                if not (isinstance(atomic_value, str) and atomic_value.strip()):
-                                    atomic_value = ""
-                        atomic_map[feature] = atomic_value
+                        step_result = await run_unstreamed_step(step)
+                    except RunCancelled as e:
+                        # Not cached or checkpointed; the partial result only feeds the flushed outputs
+                        interrupted_steps.append(step_name)
+                        attrs['cancelled'] = True
+                        if e.partial is not None:
+                            results[step_name] = e.partial
+                        return e.partial
+                    attrs['replayed'] = step_name in cached_steps or step_name in resumed_steps
+                    return step_result
+            finally:
+                source_started(step_name)
+                close_stream(step, scheduler.graph[step['name']])
+                model_finished(step_name)
+
+        async def run_unstreamed_step(step):
+            step_name = step['name']
+            if step.get('model'):
+                # Each step runs in its own task: the step's LLM calls (and cache key) use its model
+                _run_llm_processor.set(self._model_llm_processor(step['model']))
+            dependencies = scheduler.graph[step_name]
+            # Streaming consumers start before their upstream finishes, but their result still derives from it
+            key_dependencies = set(dependencies)
+            stream_source = scheduler.stream_sources.get(step_name)
+            if stream_source:
+                key_dependencies.add(stream_source)
+                # The scheduler may start this before its upstream (model affinity, max_parallel);
+                # once the run is cancelled the upstream never starts, so stop waiting then
+                await guarded(stream_started[stream_source].wait())
+            # Values the step changes in place are not in its context_updates, so it must always run
+            replayable = step_name not in scheduler.in_place_steps
+            # A checkpoint is only valid if everything it was computed from was replayed too
+            if replayable and checkpoint and all(dep in resumed_steps for dep in key_dependencies):
+                saved = checkpoint.load_step(step_name)
+                if saved is not None:
+                    print(f"[RESUME] Restoring checkpointed step: {step_name}")
+                    resumed_steps.append(step_name)
+                    return replay(step_name, saved)
+
+            def make_cache_key():
+                return step_cache.step_key(
+                    step, inputs_hash, getattr(self.llm_processor, 'model', None),
+                    {dep: step_hashes.get(dep) for dep in sorted(key_dependencies)}
+                )
+
+            use_cache = bool(replayable and step_cache and step.get('cache', True))
+            cache_key = None
+            # An upstream that is still streaming has no result hash yet; key the step once it has
+            if use_cache and stream_source and stream_source not in step_hashes:
+                unkeyed_stream_steps.append(step_name)
+            elif use_cache and all(dep in step_hashes for dep in key_dependencies):
+                cache_key = make_cache_key()
+                cached = step_cache.get(cache_key)
+                if cached is not None:
+                    print(f"[CACHE] Replaying cached result for step: {step_name}")
+                    cached_steps.append(step_name)
+                    if checkpoint:
+                        checkpoint.save_step(step_name, cached['result'], cached['context_updates'])
+                    return replay(step_name, cached)
+
+            source_started(step_name)
+            context_updates = {}
+            # Each step runs in its own task, so this only affects this step's LLM calls
+            llm_cache_allowed.set(bool(step.get('cache', True)))
+            template_stats = scheduler.metrics.setdefault(step_name, {})
+            with self.templates.track(template_stats), track_llm_calls(template_stats):
+                step_result = await self._execute_step(step, context, results, dependencies, context_updates,
+                                                       checkpoint=checkpoint, item_streams=item_streams)
+            results[step_name] = step_result
+            entry = {'result': step_result, 'context_updates': context_updates}
+            step_hashes[step_name] = stable_hash(entry)
+            if replayable and StepResultCache.is_cacheable(step_result):
+                if use_cache:
+                    step_cache.put(cache_key or make_cache_key(), step_result, context_updates)
+                if checkpoint:
+                    checkpoint.save_step(step_name, step_result, context_updates)
+            return step_result
+
+        # Once the run is cancelled no new step starts; running ones return promptly
+        try:
+            ordered_results = await scheduler.run(run_step, stop=is_cancelled)
+        finally:
+            # A load still running is of no use any more (e.g. every LLM step was replayed)
+            if preload is not None and not preload.done():
+                preload.cancel()
+            await asyncio.gather(*([preload] if preload else []), *unloads, return_exceptions=True)
+        results.clear()
+        results.update((name, result) for name, result in ordered_results.items()
+                       if result is not None or name not in interrupted_steps)
+
+        summary = scheduler.summary()
+        summary['templates'] = self.templates.stats()
+        # Ollama's token counts and timings per step and model, and per model over the run
+        usage_by_model: Dict[str, LLMUsage] = {}
+        for metrics in scheduler.metrics.values():
+            step_usage = metrics.pop('llm_usage', None)
+            if step_usage:
+                metrics['llm'] = {model: usage.as_dict() for model, usage in step_usage.items()}
+                for model, usage in step_usage.items():
+                    usage_by_model.setdefault(model, LLMUsage()).merge(usage)
+        summary['llm_usage'] = {model: usage.as_dict() for model, usage in usage_by_model.items()}
+        for model, usage in summary['llm_usage'].items():
+            print(f"[PIPELINE] {model}: {usage['calls']} LLM calls, prompt {usage['prompt_tps'] or '-'} tok/s, "
+                  f"generation {usage['generation_tps'] or '-'} tok/s, load {usage['load_seconds']:.2f}s, "
+                  f"queued {usage['queue_seconds']:.2f}s")
+        if step_models:
+            preloaded = preload is not None and not preload.cancelled() and preload.exception() is None
+            loads = preload.result() if preloaded else {}
+            summary['models'] = {model: {'steps': sum(1 for m in step_models.values() if m == model),
+                                         'preload': loads.get(model)}
+                                 for model in dict.fromkeys(step_models.values())}
+        for key in ('llm_retries', 'llm_hedges', 'llm_hedge_wins'):
+            summary[key] = sum(metrics.get(key, 0) for metrics in scheduler.metrics.values())
+        if checkpoint:
+            summary['run_id'] = checkpoint.run_id
+            summary['resumed_steps'] = resumed_steps
+        if step_cache:
+            summary['cached_steps'] = cached_steps
+            summary['unkeyed_stream_steps'] = unkeyed_stream_steps
+            summary['step_cache'] = step_cache.stats()
+        response_cache = getattr(self.llm_processor, 'response_cache', None)
+        if response_cache:
+            summary['llm_cache'] = response_cache.stats()
+        if is_cancelled():
+            summary['cancelled'] = current_token().reason
+            summary['interrupted_steps'] = interrupted_steps
+            summary['skipped_steps'] = [step['name'] for step in steps if step['name'] not in scheduler.metrics]
+        context['pipeline_metrics'] = summary
+        if summary['critical_path']:
+            print(f"[PIPELINE] Wall time {summary['wall_time']:.2f}s, critical path "
+                  f"({summary['critical_path_time']:.2f}s): {' -> '.join(summary['critical_path'])}")
+        return results
+
+    async def _breakdown_features(self, features: List[str], timeout: int, batch_size: int) -> Dict[str, str]:
+        """Feature -> atomic requirement ("" when the LLM gave no usable phrase).
+
+        Distinct features are sent batch_size per prompt, the batches concurrently (bounded by the
+        processor's concurrency limit). Only features without a valid answer are retried, in
+        batches half the size each round; a batch of one uses the single-feature breakdown prompt.
+        """
+        unique = list(dict.fromkeys(features))
+        atomic_map = {feature: "" for feature in unique}
+        pending = unique
+        calls = 0
+        size = max(1, batch_size)
+        for attempt in range(1 + max(0, BREAKDOWN_MAX_RETRIES)):
+            if not pending:
+                break
+            if is_cancelled():
+                raise RunCancelled(current_token().reason, partial=atomic_map)
+            batches = [pending[i:i + size] for i in range(0, len(pending), size)]
+            calls += len(batches)
+            answers = await asyncio.gather(*(self._breakdown_batch(batch, timeout) for batch in batches),
+                                           return_exceptions=True)
+            for batch, answer in zip(batches, answers):
+                if isinstance(answer, RunCancelled):
+                    answer.partial = atomic_map
+                    raise answer
+                if isinstance(answer, BaseException):
+                    print(f"[LLM] Breakdown of {len(batch)} feature(s) failed: {answer}")
+                    continue
+                atomic_map.update({feature: value for feature, value in answer.items() if value})
+            pending = [feature for feature in pending if not atomic_map[feature]]
+            if pending and attempt < BREAKDOWN_MAX_RETRIES:
+                print(f"[LLM] Retrying breakdown of {len(pending)} feature(s)")
+            size = max(1, size // 2)
+        print(f"[DEBUG] Broke down {len(features)} features ({len(unique)} distinct) in {calls} LLM calls, "
+              f"{len(pending)} without a valid answer")
+        return atomic_map
+
+    async def _breakdown_batch(self, batch: List[str], timeout: int) -> Dict[str, str]:
+        if len(batch) == 1:
+            result = await self.llm_processor.process_prompt(batch[0], timeout, breakdown=True, max_tokens=64)
+            parsed = result.get('parsed_result') if isinstance(result, dict) else None
+            atomic = parsed.get('atomic_requirement') if isinstance(parsed, dict) else None
+            return {batch[0]: atomic.strip() if LLMProcessor.is_atomic_requirement(atomic) else ""}
+        # About 30 tokens per answer entry: the window stays small instead of sized for a long analysis
+        result = await self.llm_processor.process_prompt(LLMProcessor.breakdown_batch_prompt(batch), timeout,
+                                                         max_tokens=64 + 32 * len(batch))
+        return LLMProcessor.parse_breakdown_batch(result, batch)
+
+    async def _execute_step(self, step: Dict[str, Any], context: Dict[str, Any],
+                            results: Dict[str, Any], dependencies,
+                            context_updates: Optional[Dict[str, Any]] = None,
+                            checkpoint: Optional[RunCheckpoint] = None,
+                            item_streams: Optional[Dict[str, ItemStream]] = None) -> Any:
+        """Execute a single pipeline step once all of its dependencies have finished.
+
+        Keys the step writes to the shared context are also recorded in context_updates.
+        """
+        if context_updates is None:
+            context_updates = {}
+        # The run's models are not written into the step: its definition keys the step cache
+        llm_model = getattr(self, 'llm_model', None)
+
+        # Reduced debug output for clarity
+        step_name = step['name']
+        step_type = step.get('type', '')
+        # Support both 'prompt_template' and 'input' keys for LLM prompts
+        prompt_template = step.get('prompt_template', '') or step.get('input', '')
+        # Declared dependencies plus implicit ones found by the scheduler
+        dependencies = sorted(dependencies)
+        timeout = step.get('timeout', 120)
+
+        step_context = self._build_step_context(context, results, dependencies)
+
+        # For LLM steps, inject drawing_image_path from context if present and attach image for vision models
+        image_bytes = None
+        if step_type == "llm":
+            if 'drawing_image_path' in context:
+                llm_model_val = step.get('model') or llm_model or step_context.get('llm_model', '')
+                image_path = context['drawing_image_path']
+                if llm_model_val and 'moondream' in llm_model_val.lower() and image_path and Path(image_path).exists():
+                    try:
+                        with open(image_path, 'rb') as f:
+                            image_bytes = f.read()
                     except Exception as e:
-                        print(f"[LLM TEST] Exception during LLM call for feature {feature!r}: {e}")
-                        atomic_map[feature] = ""
-                print(f"[DEBUG] LLM breakdown mapping: {atomic_map}")
-                results[step_name] = atomic_map
-
-                # PATCH: After LLM breakdown, set requirements to list of atomic requirement strings for downstream steps
-                atomic_requirements = [v for v in atomic_map.values() if isinstance(v, str) and v.strip()]
-                context['requirements'] = atomic_requirements
-                print(f"[DEBUG] Patched requirements for downstream steps: {atomic_requirements}")
-                continue
+                        print(f"[ERROR] Could not read image for vision model: {e}")
+        # Remove ChromaDB semantic search step: FAISS only
 
-            # Native Python code execution step
-            if step_type in ("python", "run"):
-                print(f"[DEBUG] _execute_pipeline: calling process_step for python step: {step_name}")
-                # Use a mutable dict for local_vars to capture context changes
-                local_vars = step_context.copy()
-                step_result = await self.process_step(step, local_vars)
-                # Merge any new keys from local_vars back into main context
-                for k, v in local_vars.items():
-                    if k not in context or context[k] != v:
-                        context[k] = v
-                results[step_name] = step_result
-                continue
+        # Force breakdown=True for any LLM step named 'llm_breakdown_features'
+        if step_name == "llm_breakdown_features":
+            print(f"[DEBUG] Forcing breakdown=True for step: {step_name}")
+            # Patch: Flatten all features from all clauses for LLM breakdown
+            features = []
+            # Try to get clauses from dependencies (load_clauses step)
+            dep_clauses = None
+            if 'dep_load_clauses' in step_context and 'clauses' in step_context['dep_load_clauses']:
+                dep_clauses = step_context['dep_load_clauses']['clauses']
+            elif 'clauses' in step_context:
+                dep_clauses = step_context['clauses']
+            if dep_clauses and isinstance(dep_clauses, list):
+                for clause in dep_clauses:
+                    if isinstance(clause, dict) and 'features' in clause and isinstance(clause['features'], list):
+                        features.extend([f for f in clause['features'] if isinstance(f, str) and f.strip()])
+            # Fallback: try requirements
+            elif 'requirements' in step_context and isinstance(step_context['requirements'], list):
+                features = [f for f in step_context['requirements'] if isinstance(f, str) and f.strip()]
+            print(f"[DEBUG] Features to send to LLM: {features[:3]} ... (total {len(features)})")
+            batch_size = int(step.get('batch_size', BREAKDOWN_BATCH_SIZE))
+            atomic_map = await self._breakdown_features(features, timeout, batch_size)
+            print(f"[DEBUG] LLM breakdown mapping: {atomic_map}")
 
-            # Reranker step using cross-encoder
-            if step_type == "reranker":
-                try:
-                    from sentence_transformers import CrossEncoder
-                    # Use local model path for offline support
-                    local_model_path = os.path.abspath('./jina_reranker/cross-encoder').replace('\\', '/')
-                    if os.path.exists(local_model_path):
-                        model_name = local_model_path
-                        print(f"Executing reranker step: {step_name} using local CrossEncoder model at {model_name}")
-                    else:
-                        model_name = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
-                        print(f"[WARN] Local CrossEncoder model not found, falling back to HuggingFace: {model_name}")
-                    reranker = CrossEncoder(model_name)
-                    faiss_results = results[step['dependencies'][0]]
-                    print(f"[DEBUG] FAISS results for reranker: {faiss_results}")
-                    # PATCH: If faiss_results is a list, skip reranking and pass through
-                    if isinstance(faiss_results, list):
-                        print("[PATCH] FAISS results is a list, skipping reranking and passing through.")
-                        step_result = {'success': True, 'results': faiss_results}
-                        results[step_name] = step_result
+            # PATCH: After LLM breakdown, set requirements to list of atomic requirement strings for downstream steps
+            atomic_requirements = [v for v in atomic_map.values() if isinstance(v, str) and v.strip()]
+            context['requirements'] = atomic_requirements
+            context_updates['requirements'] = atomic_requirements
+            print(f"[DEBUG] Patched requirements for downstream steps: {atomic_requirements}")
+            return atomic_map
+
+        # Native Python code execution step
+        if step_type in ("python", "run"):
+            print(f"[DEBUG] _execute_pipeline: calling process_step for python step: {step_name}")
+            # Writes land in the step's own layer and are tracked
+            step_result = await self.process_step(step, step_context)
+            # Merge only the keys the step wrote back into main context
+            for k, v in step_context.writes().items():
+                if k != 'step_results' and not k.startswith('dep_'):
+                    context[k] = v
+                    context_updates[k] = v
+            return step_result
+
+        # Reranker step using cross-encoder
+        if step_type == "reranker":
+            try:
+                model_name = self._reranker_model_name()
+                print(f"Executing reranker step: {step_name} using CrossEncoder model {model_name}")
+                reranker = get_cross_encoder(model_name)
+                faiss_results = results[step['dependencies'][0]]
+                print(f"[DEBUG] FAISS results for reranker: {faiss_results}")
+                # PATCH: If faiss_results is a list, skip reranking and pass through
+                if isinstance(faiss_results, list):
+                    print("[PATCH] FAISS results is a list, skipping reranking and passing through.")
+                    step_result = {'success': True, 'results': faiss_results}
+                    return step_result
+                # If faiss_results is a dict with 'results', rerank as before
+                reranked_results = {}
+                for req, candidates in faiss_results.get('results', {}).items():
+                    if not candidates:
+                        reranked_results[req] = []
                         continue
-                    # If faiss_results is a dict with 'results', rerank as before
-                    reranked_results = {}
-                    for req, candidates in faiss_results.get('results', {}).items():
-                        if not candidates:
-                            reranked_results[req] = []
-                            continue
-                        pairs = [(req, c.get('text', '[NO TEXT]')) for c in candidates]
-                        try:
+                    pairs = [(req, c.get('text', '[NO TEXT]')) for c in candidates]
+                    try:
+                        with span('rerank', 'reranker', candidates=len(pairs)):
                             scores = reranker.predict(pairs)
-                        except Exception as rerank_e:
-                            print(f"[ERROR] CrossEncoder reranker failed: {rerank_e}")
-                            reranked_results[req] = []
-                            continue
-                        top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:3]
-                        top_candidates = [candidates[i] for i in top_indices]
-                        reranked_results[req] = top_candidates
-                        print(f"CrossEncoder reranked {len(candidates)} candidates for '{req}' -> {top_indices}")
-                    step_result = {'success': True, 'results': reranked_results}
-                except Exception as e:
-                    print(f"Reranker step failed: {e}")
-                    step_result = {'success': False, 'error': str(e)}
-                results[step_name] = step_result
-                continue
+                    except Exception as rerank_e:
+                        print(f"[ERROR] CrossEncoder reranker failed: {rerank_e}")
+                        reranked_results[req] = []
+                        continue
+                    top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:3]
+                    top_candidates = [candidates[i] for i in top_indices]
+                    reranked_results[req] = top_candidates
+                    print(f"CrossEncoder reranked {len(candidates)} candidates for '{req}' -> {top_indices}")
+                step_result = {'success': True, 'results': reranked_results}
+            except Exception as e:
+                print(f"Reranker step failed: {e}")
+                step_result = {'success': False, 'error': str(e)}
+            return step_result
 
-            # LlamaIndex step
-            if step_name.startswith("llamaindex_"):
-                template = self.jinja_env.from_string(prompt_template)
-                rendered_prompt = template.render(**step_context)
-                try:
-                    db_config = context.get('databases', {})
-                    if db_config:
-                        db_name, db_wrapper = next(iter(db_config.items()))
-                        if hasattr(db_wrapper, 'db_path'):
-                            db_path = db_wrapper.db_path
-                        elif hasattr(db_wrapper, 'database_path'):
-                            db_path = db_wrapper.database_path
-                        elif hasattr(db_wrapper, 'path'):
-                            db_path = db_wrapper.path
-                        else:
-                            db_path = getattr(db_wrapper, '_db_path', None)
-                            if not db_path:
-                                if isinstance(db_wrapper, str):
-                                    db_path = db_wrapper
-                                else:
-                                    raise ValueError(f"Could not extract database path from {type(db_wrapper)}")
-                        llamaindex_engine = self.get_llamaindex_engine(db_path)
-                        llamaindex_result = await llamaindex_engine.query(rendered_prompt)
-                        step_result = {
-                            'llamaindex_result': llamaindex_result,
-                            'raw_response': llamaindex_result,
-                            'success': True
-                        }
+        # LlamaIndex step
+        if step_name.startswith("llamaindex_"):
+            rendered_prompt = self.templates.render(prompt_template, step_context)
+            try:
+                db_config = context.get('databases', {})
+                if db_config:
+                    db_name, db_wrapper = next(iter(db_config.items()))
+                    if hasattr(db_wrapper, 'db_path'):
+                        db_path = db_wrapper.db_path
+                    elif hasattr(db_wrapper, 'database_path'):
+                        db_path = db_wrapper.database_path
+                    elif hasattr(db_wrapper, 'path'):
+                        db_path = db_wrapper.path
                     else:
-                        step_result = {
-                            'error': 'No database configured for LlamaIndex',
-                            'success': False
-                        }
-                except Exception as e:
+                        db_path = getattr(db_wrapper, '_db_path', None)
+                        if not db_path:
+                            if isinstance(db_wrapper, str):
+                                db_path = db_wrapper
+                            else:
+                                raise ValueError(f"Could not extract database path from {type(db_wrapper)}")
+                    llamaindex_engine = self.get_llamaindex_engine(db_path)
+                    llamaindex_result = await llamaindex_engine.query(rendered_prompt)
+                    step_result = {
+                        'llamaindex_result': llamaindex_result,
+                        'raw_response': llamaindex_result,
+                        'success': True
+                    }
+                else:
                     step_result = {
-                        'error': str(e),
+                        'error': 'No database configured for LlamaIndex',
                         'success': False
                     }
-                results[step_name] = step_result
-                continue
+            except Exception as e:
+                step_result = {
+                    'error': str(e),
+                    'success': False
+                }
+            return step_result
 
-            # PATCH: foreach support for LLM steps
-            if step_type == "llm" and 'foreach' in step and step['foreach']:
-                print("[PATCH ACTIVE] Foreach logic for LLM step triggered.")
-                foreach_expr = step['foreach']
-                # Try to resolve context['...'] expressions manually
+        # PATCH: foreach support for LLM steps
+        if step_type == "llm" and (step.get('foreach') or step.get('stream_from')):
+            print("[PATCH ACTIVE] Foreach logic for LLM step triggered.")
+            stream_source = step.get('stream_from')
+            item_streams = item_streams or {}
+            # Downstream consumers of this step's items, if any
+            own_stream = item_streams.get(step_name)
+            if stream_source:
                 foreach_items = None
-                if isinstance(foreach_expr, str) and foreach_expr.startswith('context['):
-                    import re
-                    m = re.match(r"context\['([^']+)'\](?:\['([^']+)'\])?", foreach_expr)
-                    foreach_items = None
-                    if m:
-                        key1 = m.group(1)
-                        key2 = m.group(2)
-                        val = None
-                        # Direct, explicit resolution order
-                        if key1 in step_context:
-                            val = step_context[key1]
-                        elif key1 in context:
-                            val = context[key1]
-                        elif 'inputs' in context and key1 in context['inputs']:
-                            val = context['inputs'][key1]
-                        elif key1 in results:
-                            val = results[key1]
-                        else:
-                            raise KeyError(f"foreach: Could not resolve key '{key1}' in step_context, context, inputs, or results.")
-                        print(f"[DEBUG] foreach key1: {key1}, resolved value type: {type(val)}")
-                        if key2 and isinstance(val, dict):
-                            foreach_items = val.get(key2)
-                        else:
-                            foreach_items = val
-                    else:
-                        foreach_items = eval(foreach_expr, {}, context)
-                elif isinstance(foreach_expr, str):
-                    foreach_items = eval(foreach_expr, {}, context)
-                else:
-                    foreach_items = foreach_expr
-                if not isinstance(foreach_items, list):
-                    print(f"[ERROR] foreach items is not a list: {type(foreach_items)}. Value: {repr(foreach_items)[:200]}")
-                    foreach_items = []
-                results_list = []
-                for idx, item in enumerate(foreach_items):
-                    # PATCH: Ensure passthrough logic matches test_prompt_engine_foreach.py
-                    item_context = step_context.copy()
-                    item_context['item'] = item
-                    # If item is a dict, also inject its keys for template access
-                    if isinstance(item, dict):
-                        item_context.update(item)
-                    print(f"[DEBUG] foreach item {idx}: type={type(item)}, value={repr(item)[:200]}")
-                    prompt_template = step.get('input', '')
-                    template = self.jinja_env.from_string(prompt_template)
-                    rendered_prompt = template.render(**item_context)
-                    print(f"[DEBUG] LLM foreach prompt for item {idx}: {repr(rendered_prompt)[:200]}")
-                    if image_bytes:
-                        step_result = await self.llm_processor.process_prompt(rendered_prompt, timeout, images=[image_bytes])
-                    else:
-                        step_result = await self.llm_processor.process_prompt(rendered_prompt, timeout)
-                    print(f"[DEBUG] LLM response for chunk {idx}: {repr(step_result)[:200]}")
-                    results_list.append(step_result)
-                results[step_name] = results_list
-                continue
+                concurrency = self._foreach_concurrency(step, self.max_foreach_concurrency)
+            else:
+                foreach_items = self._resolve_foreach_items(step, step_context, context, results)
+                concurrency = self._foreach_concurrency(step, len(foreach_items))
+            step_slots = asyncio.Semaphore(concurrency)
+            global_slots = self._global_foreach_slots()
+            if stream_source:
+                print(f"[DEBUG] foreach step '{step_name}': streaming items from '{stream_source}', concurrency {concurrency}")
+            else:
+                print(f"[DEBUG] foreach step '{step_name}': {len(foreach_items)} items, concurrency {concurrency}")
+
+            async def run_item(idx, item):
+                item_result = await run_checkpointed_item(idx, item)
+                if own_stream:
+                    own_stream.publish(idx, item, item_result)
+                return item_result
+
+            async def run_checkpointed_item(idx, item):
+                if checkpoint:
+                    saved = checkpoint.load_item(step_name, idx, item)
+                    if saved is not None:
+                        return saved
+                async with step_slots, global_slots:
+                    # Items still waiting for a slot when the run is cancelled are skipped
+                    if is_cancelled():
+                        return {'error': current_token().reason, 'success': False, 'cancelled': True}
+                    try:
+                        with span(f"{step_name}[{idx}]", 'foreach_item', foreach_index=idx):
+                            item_result = await self._run_foreach_item(step, step_context, idx, item, timeout,
+                                                                       image_bytes, (step_slots, global_slots))
+                    except RunCancelled as e:
+                        return {'error': e.reason, 'success': False, 'cancelled': True}
+                    except Exception as e:
+                        # A failing item must not abort its siblings
+                        print(f"[ERROR] foreach item {idx} of step '{step_name}' failed: {e}")
+                        return {'error': str(e), 'success': False}
+                if checkpoint and StepResultCache.is_cacheable(item_result):
+                    checkpoint.save_item(step_name, idx, item, item_result)
+                return item_result
 
-            # Default: LLM step
-            print(f"[DEBUG] _execute_pipeline: defaulting to LLM step for {step_name}")
-            template = self.jinja_env.from_string(prompt_template)
-            rendered_prompt = template.render(**step_context)
-            # If image_bytes is set, pass it to the LLM processor
-            if image_bytes:
-                step_result = await self.llm_processor.process_prompt(rendered_prompt, timeout, images=[image_bytes])
+            if stream_source:
+                results_list = await self._consume_item_stream(step, step_context, item_streams[stream_source],
+                                                               run_item)
             else:
-                step_result = await self.llm_processor.process_prompt(rendered_prompt, timeout)
-            results[step_name] = step_result
+                results_list = list(await asyncio.gather(*(run_item(idx, item)
+                                                           for idx, item in enumerate(foreach_items))))
+            if is_cancelled() and any(isinstance(r, dict) and r.get('cancelled') for r in results_list):
+                # Finished items are checkpointed individually; the step itself must not be stored as complete
+                raise RunCancelled(current_token().reason, partial=results_list)
+            return results_list
 
-        return results
+        # Default: LLM step
+        print(f"[DEBUG] _execute_pipeline: defaulting to LLM step for {step_name}")
+        rendered_prompt = self.templates.render(prompt_template, step_context)
+        # If image_bytes is set, pass it to the LLM processor
+        images = [image_bytes] if image_bytes else None
+        step_result = await self.llm_processor.process_prompt(rendered_prompt, timeout, images=images,
+                                                              stream=step.get('stream'),
+                                                              max_tokens=step.get('max_tokens'),
+                                                              retry=RetryPolicy.from_step(step))
+        return step_result
     
-    async def _generate_outputs(self, outputs_config: List[Dict[str, Any]], context: Dict[str, Any]) -> List[str]:
+    def _build_step_context(self, context: Dict[str, Any], results: Dict[str, Any], dependencies) -> LayeredContext:
+        """Copy-on-write view: step locals on top of the shared run context, no per-step dict copies"""
+        step_locals = {'step_results': MappingProxyType(results)}
+        for dep in dependencies:
+            if dep in results:
+                step_locals[f"dep_{dep}"] = results[dep]
+        return LayeredContext({}, step_locals, context)
+
+    def _resolve_foreach_items(self, step: Dict[str, Any], step_context: Dict[str, Any],
+                               context: Dict[str, Any], results: Dict[str, Any]) -> List[Any]:
+        """Evaluate a step's `foreach:` expression to the list of items it iterates"""
+        foreach_expr = step['foreach']
+        # Try to resolve context['...'] expressions manually
+        foreach_items = None
+        if isinstance(foreach_expr, str) and foreach_expr.startswith('context['):
+            import re
+            m = re.match(r"context\['([^']+)'\](?:\['([^']+)'\])?", foreach_expr)
+            foreach_items = None
+            if m:
+                key1 = m.group(1)
+                key2 = m.group(2)
+                val = None
+                # Direct, explicit resolution order
+                if key1 in step_context:
+                    val = step_context[key1]
+                elif key1 in context:
+                    val = context[key1]
+                elif 'inputs' in context and key1 in context['inputs']:
+                    val = context['inputs'][key1]
+                elif key1 in results:
+                    val = results[key1]
+                else:
+                    raise KeyError(f"foreach: Could not resolve key '{key1}' in step_context, context, inputs, or results.")
+                print(f"[DEBUG] foreach key1: {key1}, resolved value type: {type(val)}")
+                if key2 and isinstance(val, dict):
+                    foreach_items = val.get(key2)
+                else:
+                    foreach_items = val
+            else:
+                foreach_items = eval(foreach_expr, {}, step_context)
+        elif isinstance(foreach_expr, str):
+            foreach_items = eval(foreach_expr, {}, step_context)
+        else:
+            foreach_items = foreach_expr
+        if not isinstance(foreach_items, list):
+            print(f"[ERROR] foreach items is not a list: {type(foreach_items)}. Value: {repr(foreach_items)[:200]}")
+            foreach_items = []
+        return foreach_items
+
+    async def _consume_item_stream(self, step: Dict[str, Any], step_context: Dict[str, Any],
+                                   stream: ItemStream, run_item) -> List[Any]:
+        """Run a `stream_from` step on upstream items as they finish; results keep upstream order"""
+        filter_code = None
+        if step.get('stream_filter'):
+            filter_code = compile_step_code(step['stream_filter'], f"<stream_filter:{step['name']}>")
+        tasks = {}
+        async for index, source, upstream_result in stream:
+            if filter_code is None:
+                # By default forward every upstream result that did not fail
+                if isinstance(upstream_result, dict) and upstream_result.get('success') is False:
+                    continue
+                item = upstream_result
+            else:
+                local_vars = {'context': step_context, 'result': upstream_result, 'source': source, 'index': index}
+                try:
+                    exec(filter_code, {}, local_vars)
+                except Exception as e:
+                    print(f"[WARN] stream_filter of step '{step['name']}' failed on item {index}: {e}")
+                    continue
+                item = local_vars.get('item')
+                if item is None:
+                    continue
+            tasks[index] = asyncio.create_task(run_item(index, item))
+        try:
+            return list(await asyncio.gather(*(tasks[index] for index in sorted(tasks))))
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    @staticmethod
+    def _item_context(step_context: LayeredContext, item: Any) -> LayeredContext:
+        """Template context for one foreach item on top of its step's context"""
+        # PATCH: Ensure passthrough logic matches test_prompt_engine_foreach.py
+        # If item is a dict, also expose its keys for template access (they take precedence)
+        item_layers = [item] if isinstance(item, dict) else []
+        return LayeredContext({}, *item_layers, {'item': item}, *step_context.maps)
+
+    async def _run_foreach_item(self, step: Dict[str, Any], step_context: Dict[str, Any], idx: int, item: Any,
+                                timeout: int, image_bytes: Optional[bytes] = None,
+                                slots: Tuple[asyncio.Semaphore, ...] = ()) -> Dict[str, Any]:
+        """Render and run the LLM prompt of a foreach step for a single item (called holding `slots`)"""
+        item_context = self._item_context(step_context, item)
+        print(f"[DEBUG] foreach item {idx}: type={type(item)}, value={repr(item)[:200]}")
+        prompt_template = step.get('input', '')
+        rendered_prompt = self.templates.render(prompt_template, item_context)
+        print(f"[DEBUG] LLM foreach prompt for item {idx}: {repr(rendered_prompt)[:200]}")
+        images = [image_bytes] if image_bytes else None
+        step_result = await self.llm_processor.process_prompt(rendered_prompt, timeout, images=images,
+                                                              stream=step.get('stream'),
+                                                              max_tokens=step.get('max_tokens'),
+                                                              retry=RetryPolicy.from_step(step))
+        if (isinstance(step_result, dict) and step_result.get('too_large') and step.get('overflow') == 'split'
+                and isinstance(item, str)):
+            step_result = await self._run_split_item(step, step_context, idx, item, timeout, images, step_result,
+                                                     slots)
+        print(f"[DEBUG] LLM response for chunk {idx}: {repr(step_result)[:200]}")
+        return step_result
+
+    async def _run_split_item(self, step: Dict[str, Any], step_context: Dict[str, Any], idx: int, item: str,
+                              timeout: int, images: Optional[List[bytes]], too_large: Dict[str, Any],
+                              slots: Tuple[asyncio.Semaphore, ...] = ()) -> Dict[str, Any]:
+        """Run a text item too large for the context window as consecutive pieces that fit, merging their results.
+
+        Pieces run one after another in the item's own slots; each extra piece in flight takes another
+        set of `slots` (the step's `concurrency:` and the engine-wide foreach cap) like a foreach item.
+        """
+        budget = self.llm_processor.budget
+        # Tokens the rendered prompt spends besides the item itself
+        overhead = too_large['prompt_tokens'] - budget.counter.count(item)
+        room = too_large['max_prompt_tokens'] - overhead
+        pieces = budget.split_text(item, room) if room > 0 else []
+        if len(pieces) < 2:
+            return too_large
+        print(f"[DEBUG] foreach item {idx} does not fit the context window, running it in {len(pieces)} parts")
+        retry = RetryPolicy.from_step(step)
+        parts = [None] * len(pieces)
+        pending = list(enumerate(pieces))
+
+        async def drain():
+            while pending:
+                n, piece = pending.pop(0)
+                if is_cancelled():
+                    parts[n] = {'error': current_token().reason, 'success': False, 'cancelled': True}
+                    continue
+                prompt = self.templates.render(step.get('input', ''), self._item_context(step_context, piece))
+                parts[n] = await self.llm_processor.process_prompt(prompt, timeout, images=images,
+                                                                   stream=step.get('stream'),
+                                                                   max_tokens=step.get('max_tokens'), retry=retry)
+
+        helping = set()
+
+        async def helper():
+            async with AsyncExitStack() as stack:
+                for semaphore in slots:
+                    await stack.enter_async_context(semaphore)
+                helping.add(asyncio.current_task())
+                await drain()
+
+        helpers = [asyncio.create_task(helper()) for _ in range(len(pieces) - 1)] if slots else []
+        try:
+            await drain()
+            # Helpers still waiting for a slot have nothing left to do (and may wait on slots this item holds)
+            for task in helpers:
+                if task not in helping:
+                    task.cancel()
+            for outcome in await asyncio.gather(*helpers, return_exceptions=True):
+                if isinstance(outcome, Exception):
+                    raise outcome
+        finally:
+            for task in helpers:
+                task.cancel()
+        merged = {
+            'raw_response': "\n".join(part.get('raw_response') or '' for part in parts),
+            'parsed_result': [part.get('parsed_result') for part in parts],
+            'parts': parts,
+            'split': len(parts),
+            'success': all(part.get('success') for part in parts),
+        }
+        if not merged['success']:
+            merged['error'] = next(part.get('error') for part in parts if not part.get('success'))
+        return merged
+
+    def _foreach_concurrency(self, step: Dict[str, Any], item_count: int) -> int:
+        """Resolve a foreach step's `concurrency:` setting against the global cap"""
+        try:
+            concurrency = int(step.get('concurrency', 1) or 1)
+        except (TypeError, ValueError):
+            print(f"[WARN] Invalid concurrency for step '{step.get('name')}': {step.get('concurrency')!r}, using 1")
+            concurrency = 1
+        return max(1, min(concurrency, self.max_foreach_concurrency, max(item_count, 1)))
+
+    def _global_foreach_slots(self) -> asyncio.Semaphore:
+        """Engine-wide semaphore bounding foreach items in flight across all running steps"""
+        loop = asyncio.get_running_loop()
+        if getattr(self, '_foreach_slots_loop', None) is not loop:
+            self._foreach_slots = asyncio.Semaphore(self.max_foreach_concurrency)
+            self._foreach_slots_loop = loop
+        return self._foreach_slots
+
+    async def _generate_outputs(self, outputs_config: List[Dict[str, Any]], context: Dict[str, Any],
+                                output_dir: Optional[str] = None) -> List[str]:
         """Generate output files using unified context"""
         output_files = []
+        output_dir = Path(output_dir) if output_dir else self.outputs_dir
+        output_dir.mkdir(parents=True, exist_ok=True)
 
         for output_spec in outputs_config:
             output_type = output_spec['type']
@@ -711,8 +1383,8 @@ class PromptEngine:
             condition = output_spec.get('condition')
             if condition:
                 try:
-                    template = self.jinja_env.from_string(f"{{{{ {condition} }}}}")
-                    should_generate = template.render(**context).strip().lower() in ['true', '1', 'yes']
+                    rendered_condition = self.templates.render(f"{{{{ {condition} }}}}", context)
+                    should_generate = rendered_condition.strip().lower() in ['true', '1', 'yes']
                     if not should_generate:
                         continue
                 except:
@@ -720,16 +1392,14 @@ class PromptEngine:
                     continue
 
             # Render filename
-            filename_tmpl = self.jinja_env.from_string(filename_template)
-            filename = filename_tmpl.render(**context)
-            output_path = self.outputs_dir / filename
+            filename = self.templates.render(filename_template, context)
+            output_path = output_dir / filename
 
             # Generate content based on type
             if output_type == 'json':
                 data = output_spec.get('data', context['step_results'])
                 if isinstance(data, str):
-                    data_template = self.jinja_env.from_string(data)
-                    data = data_template.render(**context)
+                    data = self.templates.render(data, context)
                     # Strip code fences if present
                     data = self.strip_code_fences(data)
                     try:
@@ -744,6 +1414,7 @@ class PromptEngine:
             elif output_type == 'excel':
                 # Excel generation code here
                 # Placeholder: Write an empty Excel file or log a message
+                from .excel_generator import ExcelGenerator
                 excel_generator = ExcelGenerator()
                 try:
                     excel_generator.generate_empty_excel(str(output_path))
@@ -763,6 +1434,7 @@ class PromptEngine:
                     excel_data = self._extract_and_fix_json_from_raw_response(raw_response)
                     # Generate Excel file
                     if excel_data is not None:
+                        from .excel_generator import ExcelGenerator
                         excel_generator = ExcelGenerator()
                         try:
                             if excel_generator.generate_compliance_report(str(output_path), excel_data):
@@ -784,16 +1456,14 @@ class PromptEngine:
                 else:
                     template_content = output_spec.get('content', '# Results\n\n{{ step_results | tojson(indent=2) }}')
 
-                template = self.jinja_env.from_string(template_content)
-                content = template.render(**context)
+                content = self.templates.render(template_content, context)
 
                 with open(output_path, 'w', encoding='utf-8') as f:
                     f.write(content)
 
             elif output_type == 'text':
                 content_template = output_spec.get('content', '{{ step_results }}')
-                template = self.jinja_env.from_string(content_template)
-                content = template.render(**context)
+                content = self.templates.render(content_template, context)
                 # Strip code fences if present
                 content = self.strip_code_fences(content)
                 with open(output_path, 'w', encoding='utf-8') as f:
@@ -812,8 +1482,7 @@ class PromptEngine:
             return [self._render_template_dict(item, context) for item in data]
         elif isinstance(data, str) and '{{' in data:
             try:
-                template = self.jinja_env.from_string(data)
-                return template.render(**context)
+                return self.templates.render(data, context)
             except:
                 return data
         else:
@@ -823,23 +1492,9 @@ class PromptEngine:
         step_type = step.get('type', '')
         # Native Python code execution step
         if step_type in ("python", "run"):
-            code = step.get('code') or step.get('run')
-            if not code:
-                raise ValueError("No code provided for python/run step")
-            # Prepare local context for exec (use actual context, not a copy)
-            local_vars = {'context': context}
-            try:
-                exec(code, {}, local_vars)
-                # If 'result' is set in local_vars, return it; else return all locals except context
-                if 'result' in local_vars:
-                    return local_vars['result']
-                # Remove 'context' from output if present
-                output = {k: v for k, v in local_vars.items() if k != 'context'}
-                return output if output else None
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-                return {'success': False, 'error': str(e)}
+            # Code objects are cached per source; `executor: process` runs the step off the event loop
+            with span(step.get('name', 'python'), 'python', executor=step.get('executor', 'inline')):
+                return await self.step_executor.run(step, context)
         if step_type == "chroma":
             if not self.chroma_processor:
                 raise RuntimeError("ChromaProcessor not initialized")
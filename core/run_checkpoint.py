@@ -0,0 +1,120 @@
+# core/run_checkpoint.py
+import os
+import json
+import pickle
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from .step_cache import stable_hash
+
+
+class RunCheckpoint:
+    """Crash-safe record of finished steps and foreach items for one pipeline run.
+
+    Layout under outputs/runs/<run_id>/:
+        manifest.json              prompt config path, run inputs, status
+        steps/<step>.pkl           {'result': ..., 'context_updates': {...}}
+        items/<step>/<index>.pkl   {'item_hash': ..., 'result': ...}
+    """
+
+    def __init__(self, run_dir: Path, manifest: Dict[str, Any]):
+        self.run_dir = Path(run_dir)
+        self.manifest = manifest
+        self.run_id = manifest['run_id']
+        (self.run_dir / "steps").mkdir(parents=True, exist_ok=True)
+        (self.run_dir / "items").mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def create(cls, outputs_dir: Path, prompt_config_path: str, inputs: Dict[str, Any]) -> 'RunCheckpoint':
+        """Start a new run directory"""
+        stamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+        run_id = f"{Path(prompt_config_path).stem}_{stamp}"
+        manifest = {
+            'run_id': run_id,
+            'prompt_config_path': str(prompt_config_path),
+            # Only plain values can be replayed into run_prompt on resume
+            'inputs': {k: v for k, v in inputs.items() if isinstance(v, (str, int, float, bool)) or v is None},
+            'created': datetime.utcnow().isoformat(),
+            'status': 'running',
+        }
+        checkpoint = cls(Path(outputs_dir) / "runs" / run_id, manifest)
+        checkpoint._write_manifest()
+        return checkpoint
+
+    @classmethod
+    def open(cls, outputs_dir: Path, run_id: str) -> 'RunCheckpoint':
+        """Reopen an existing run directory for resuming"""
+        run_dir = Path(outputs_dir) / "runs" / run_id
+        manifest_path = run_dir / "manifest.json"
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"No checkpointed run found for run_id '{run_id}' in {run_dir}")
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return cls(run_dir, manifest)
+
+    def _write_manifest(self):
+        self._atomic_write(self.run_dir / "manifest.json",
+                           json.dumps(self.manifest, indent=2).encode('utf-8'))
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes):
+        """Write to a temp file and rename so a crash never leaves a half-written checkpoint"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _safe_name(step_name: str) -> str:
+        return "".join(c if c.isalnum() or c in "-_." else "_" for c in step_name)
+
+    def _load(self, path: Path) -> Optional[Any]:
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"[WARN] Ignoring unreadable checkpoint {path}: {e}")
+            return None
+
+    def save_step(self, step_name: str, result: Any, context_updates: Dict[str, Any]) -> bool:
+        try:
+            data = pickle.dumps({'result': result, 'context_updates': context_updates})
+        except Exception as e:
+            print(f"[WARN] Could not checkpoint step '{step_name}': {e}")
+            return False
+        self._atomic_write(self.run_dir / "steps" / f"{self._safe_name(step_name)}.pkl", data)
+        return True
+
+    def load_step(self, step_name: str) -> Optional[Dict[str, Any]]:
+        return self._load(self.run_dir / "steps" / f"{self._safe_name(step_name)}.pkl")
+
+    def save_item(self, step_name: str, index: int, item: Any, result: Any) -> bool:
+        try:
+            data = pickle.dumps({'item_hash': stable_hash(item), 'result': result})
+        except Exception as e:
+            print(f"[WARN] Could not checkpoint item {index} of step '{step_name}': {e}")
+            return False
+        self._atomic_write(self.run_dir / "items" / self._safe_name(step_name) / f"{index}.pkl", data)
+        return True
+
+    def load_item(self, step_name: str, index: int, item: Any) -> Optional[Any]:
+        """Return the checkpointed result for a foreach item, if it was produced for the same item"""
+        entry = self._load(self.run_dir / "items" / self._safe_name(step_name) / f"{index}.pkl")
+        if entry is None or entry.get('item_hash') != stable_hash(item):
+            return None
+        return entry['result']
+
+    def mark(self, status: str, error: Optional[str] = None):
+        self.manifest['status'] = status
+        self.manifest['updated'] = datetime.utcnow().isoformat()
+        if error:
+            self.manifest['error'] = error
+        else:
+            self.manifest.pop('error', None)
+        self._write_manifest()
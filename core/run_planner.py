@@ -0,0 +1,233 @@
+# core/run_planner.py
+import math
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Set, Tuple
+
+from .pipeline_scheduler import PipelineScheduler
+from .perf_history import PerfHistory
+from .token_budget import PromptTooLarge, default_budget
+from .config import PLANNER_PROMPT_TPS, PLANNER_DECODE_TPS, PLANNER_DEFAULT_COMPLETION_TOKENS, LLM_MAX_TOKENS
+
+# Step types that call a model; everything else is either cheap python or measured from history
+_MODEL_STEP_TYPES = ("llm",)
+
+
+class RunPlanner:
+    """Estimate LLM calls, tokens and wall time of a pipeline from a dry run of its cheap steps.
+
+    Python steps that only depend on other python steps (file processing, chunking) are
+    executed for real, so foreach steps over their output get exact item counts and prompt
+    sizes. Steps fed by model output are estimated from their upstream fan-out, and
+    completion sizes and throughput come from the history of past runs. Prompts are counted
+    and their context windows sized by the LLM processor's own TokenBudget, so prompts too
+    large for the window (or split by `overflow: split`) show up as they will in the run.
+    """
+
+    def __init__(self, engine, history: PerfHistory):
+        self.engine = engine
+        self.history = history
+        self.budget = getattr(engine.llm_processor, 'budget', None) or default_budget()
+
+    @staticmethod
+    def cheap_steps(steps: List[Dict[str, Any]], graph: Dict[str, Set[str]]) -> Set[str]:
+        """Python steps whose whole upstream is python; `dry_run: false` excludes a step"""
+        cheap: Set[str] = set()
+        for step in steps:
+            name = step['name']
+            if (step.get('type', '') in ("python", "run") and step.get('dry_run', True)
+                    and name != "llm_breakdown_features"
+                    and all(dep in cheap for dep in graph[name])):
+                cheap.add(name)
+        return cheap
+
+    def _count_tokens(self, text: str) -> int:
+        return self.budget.count(text)
+
+    def _prompt_calls(self, step: Dict[str, Any], template: str, context,
+                      item: Any = None) -> Tuple[int, int, int, int]:
+        """(calls, prompt tokens, num_ctx, prompts refused as too large) of one prompt as the engine sends it"""
+        try:
+            prompt = self.engine.templates.render(template, context)
+        except Exception:
+            prompt = template
+        try:
+            plan = self.budget.plan(prompt, int(step.get('max_tokens') or LLM_MAX_TOKENS))
+            return 1, plan['prompt_tokens'], plan['num_ctx'], 0
+        except PromptTooLarge as e:
+            too_large = e
+        if step.get('overflow') == 'split' and isinstance(item, str):
+            # Same split as PromptEngine._run_split_item
+            overhead = too_large.prompt_tokens - self.budget.counter.count(item)
+            room = too_large.max_prompt_tokens - overhead
+            pieces = self.budget.split_text(item, room) if room > 0 else []
+            if len(pieces) >= 2:
+                return (len(pieces), sum(overhead + self.budget.counter.count(piece) for piece in pieces),
+                        self.budget.max_ctx, 0)
+        return 0, too_large.prompt_tokens, 0, 1
+
+    async def plan(self, prompt_config_path: str, **kwargs) -> Dict[str, Any]:
+        engine = self.engine
+        config = engine._load_yaml_config(prompt_config_path)
+        pipeline = Path(prompt_config_path).stem
+        input_data = await engine._process_inputs(config.get('inputs', []), **kwargs)
+        model = (input_data.get('llm_model') or kwargs.get('llm_model')
+                 or getattr(engine.llm_processor, 'model', None))
+        databases = await engine._load_databases_smart(config.get('databases', {}))
+        context = {
+            'inputs': input_data,
+            'databases': databases,
+            'database_schemas': {name: db.get_schema_info() for name, db in databases.items()},
+            'step_results': {},
+            'timestamp': datetime.utcnow().strftime('%Y%m%d_%H%M%S'),
+            'config': config,
+        }
+        steps = config.get('processing_steps', []) or []
+        scheduler = PipelineScheduler(steps, mode=config.get('scheduler', 'dag'))
+        cheap = self.cheap_steps(steps, scheduler.graph)
+
+        print(f"[PLAN] Dry-running {len(cheap)} of {len(steps)} steps: {sorted(cheap)}")
+        started = time.perf_counter()
+        results = await engine._execute_pipeline([s for s in steps if s['name'] in cheap], context) if cheap else {}
+        dry_run_seconds = time.perf_counter() - started
+        measured = (context.get('pipeline_metrics') or {}).get('steps', {})
+
+        rates = self.history.model_rates(model, PLANNER_PROMPT_TPS, PLANNER_DECODE_TPS)
+        estimates: Dict[str, Dict[str, Any]] = {}
+        for step in steps:
+            name = step['name']
+            if name in cheap:
+                estimates[name] = {
+                    'name': name, 'type': step.get('type', ''), 'basis': 'dry run', 'calls': 0,
+                    'items': len(results[name]) if isinstance(results.get(name), list) else 1,
+                    'seconds': measured.get(name, {}).get('duration', 0.0),
+                }
+            elif step.get('type', '') in _MODEL_STEP_TYPES:
+                estimates[name] = self._estimate_llm_step(step, scheduler, results, context, estimates, rates,
+                                                          pipeline)
+            else:
+                estimates[name] = self._estimate_other_step(step, scheduler, estimates, pipeline)
+
+        scheduler.metrics = {name: {'duration': est['seconds'] or 0.0} for name, est in estimates.items()}
+        path, path_seconds = scheduler.critical_path()
+        llm_steps = [est for est in estimates.values() if est['calls']]
+        return {
+            'pipeline': pipeline,
+            'model': model,
+            'inputs': {name: {'estimated_tokens': value['estimated_tokens']}
+                       for name, value in input_data.items() if isinstance(value, dict) and 'estimated_tokens' in value},
+            'throughput': {**rates, 'source': 'history' if rates['calls'] else 'defaults'},
+            'dry_run_seconds': round(dry_run_seconds, 3),
+            'steps': list(estimates.values()),
+            'llm_calls': sum(est['calls'] for est in llm_steps),
+            'prompt_tokens': sum(est['prompt_tokens'] for est in llm_steps),
+            'completion_tokens': sum(est['completion_tokens'] for est in llm_steps),
+            'expected_wall_time': path_seconds,
+            'critical_path': path,
+            'unknown_steps': [est['name'] for est in estimates.values() if est['seconds'] is None],
+        }
+
+    def _upstream(self, step: Dict[str, Any], scheduler: PipelineScheduler, estimates) -> List[Dict[str, Any]]:
+        names = set(scheduler.graph[step['name']])
+        if step.get('stream_from'):
+            names.add(step['stream_from'])
+        return [estimates[name] for name in names if name in estimates]
+
+    def _estimate_llm_step(self, step, scheduler, results, context, estimates, rates, pipeline) -> Dict[str, Any]:
+        engine = self.engine
+        name = step['name']
+        dependencies = scheduler.graph[name]
+        template = step.get('input') or step.get('prompt_template') or ''
+        template_tokens = self._count_tokens(template)
+        upstream = self._upstream(step, scheduler, estimates)
+        widest = max(upstream, key=lambda est: est.get('items', 1), default=None)
+        available = not step.get('stream_from') and all(dep in results for dep in dependencies)
+        fans_out = bool(step.get('foreach') or step.get('stream_from') or name == "llm_breakdown_features")
+
+        num_ctx = too_large = None
+        if fans_out and available and step.get('foreach'):
+            step_context = engine._build_step_context(context, results, dependencies)
+            items = engine._resolve_foreach_items(step, step_context, context, results)
+            planned = [self._prompt_calls(step, template, engine._item_context(step_context, item), item)
+                       for item in items]
+            calls = sum(p[0] for p in planned)
+            prompt_tokens = sum(p[1] for p in planned)
+            num_ctx = max((p[2] for p in planned), default=0)
+            too_large = sum(p[3] for p in planned)
+            basis = 'dry run'
+        elif fans_out:
+            # Items come from model output: at most one per upstream item, each about one upstream answer long
+            calls = widest.get('items', 1) if widest else 1
+            per_item = (widest.get('completion_tokens_per_call') or 0) if widest else 0
+            prompt_tokens = calls * (template_tokens + per_item)
+            basis = f"upper bound from {widest['name']}" if widest else 'assumed 1 item'
+        else:
+            calls = 1
+            if available:
+                calls, prompt_tokens, num_ctx, too_large = self._prompt_calls(
+                    step, template, engine._build_step_context(context, results, dependencies))
+                basis = 'dry run'
+            else:
+                prompt_tokens = template_tokens + sum(est.get('completion_tokens', 0) for est in upstream)
+                basis = 'estimated from upstream'
+
+        history = self.history.step_stats(pipeline, name) or {}
+        completion_per_call = (history.get('completion_tokens_per_call') or rates['completion_tokens_per_call']
+                               or PLANNER_DEFAULT_COMPLETION_TOKENS)
+        latency = (prompt_tokens / max(calls, 1)) / rates['prompt_tps'] + completion_per_call / rates['decode_tps']
+        concurrency = engine._foreach_concurrency(step, calls) if fans_out else 1
+        return {
+            'name': name, 'type': step.get('type', ''), 'basis': basis,
+            'calls': calls, 'items': calls, 'concurrency': concurrency,
+            'prompt_tokens': prompt_tokens,
+            # Known from a dry run only: the largest context window and prompts that do not fit
+            'num_ctx': num_ctx or None,
+            'too_large': too_large,
+            'completion_tokens': round(calls * completion_per_call),
+            'completion_tokens_per_call': round(completion_per_call),
+            'seconds_per_call': round(latency, 2),
+            'seconds': round(math.ceil(calls / concurrency) * latency, 2) if calls else 0.0,
+        }
+
+    def _estimate_other_step(self, step, scheduler, estimates, pipeline) -> Dict[str, Any]:
+        """Python steps after model steps, rerankers, etc.: past durations, else unknown"""
+        upstream = self._upstream(step, scheduler, estimates)
+        history = self.history.step_stats(pipeline, step['name']) or {}
+        seconds = history.get('seconds')
+        return {
+            'name': step['name'], 'type': step.get('type', ''),
+            'basis': 'history' if seconds is not None else 'unknown',
+            'calls': 0,
+            'items': max((est.get('items', 1) for est in upstream), default=1),
+            'seconds': round(seconds, 2) if seconds is not None else None,
+        }
+
+    @staticmethod
+    def format_plan(plan: Dict[str, Any]) -> str:
+        rates = plan['throughput']
+        lines = [
+            f"Plan for {plan['pipeline']} (model: {plan['model']})",
+            f"Throughput ({rates['source']}): prefill {rates['prompt_tps']:.0f} tok/s, "
+            f"decode {rates['decode_tps']:.1f} tok/s",
+            "",
+            f"{'Step':40} {'Calls':>6} {'Conc':>5} {'Prompt tok':>11} {'Compl tok':>10} {'Est s':>9}  Basis",
+        ]
+        for est in plan['steps']:
+            seconds = f"{est['seconds']:9.1f}" if est['seconds'] is not None else f"{'?':>9}"
+            lines.append(f"{est['name'][:40]:40} {est['calls']:6d} {est.get('concurrency', ''):>5} "
+                         f"{est.get('prompt_tokens', ''):>11} {est.get('completion_tokens', ''):>10} {seconds}  "
+                         f"{est['basis']}")
+        lines += [
+            "",
+            f"LLM calls: {plan['llm_calls']}, prompt tokens: {plan['prompt_tokens']}, "
+            f"completion tokens: {plan['completion_tokens']}",
+            f"Expected wall time: {plan['expected_wall_time'] / 60:.1f} min "
+            f"(critical path: {' -> '.join(plan['critical_path'])})",
+        ]
+        if plan['unknown_steps']:
+            lines.append(f"No timing history yet for: {', '.join(plan['unknown_steps'])}")
+        too_large = [f"{est['name']} ({est['too_large']})" for est in plan['steps'] if est.get('too_large')]
+        if too_large:
+            lines.append(f"Prompts too large for the context window: {', '.join(too_large)}")
+        return "\n".join(lines)
@@ -0,0 +1,161 @@
+# core/step_cache.py
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+
+def stable_hash(value: Any) -> str:
+    """Hash a JSON-like value independently of dict/set ordering and object addresses"""
+
+    def default(obj):
+        if isinstance(obj, (set, frozenset)):
+            return sorted(obj, key=repr)
+        if isinstance(obj, bytes):
+            return hashlib.sha256(obj).hexdigest()
+        # Arbitrary objects (e.g. processors injected into the context) only contribute their type
+        return f"<{type(obj).__module__}.{type(obj).__qualname__}>"
+
+    payload = json.dumps(value, sort_keys=True, default=default, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SQLiteLRUStore:
+    """Key/blob store in a local SQLite file with size-based least-recently-used eviction"""
+
+    def __init__(self, db_path: str, max_bytes: int, table: str = "entries"):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_access ON {self.table}(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[bytes]:
+        """Return a value and mark it recently used; entries older than max_age seconds are dropped"""
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            if max_age and time.time() - row[1] > max_age:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the store fits in max_bytes"""
+        total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            total -= size
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StepResultCache:
+    """Content-addressed cache of pipeline step results (and the context keys they wrote)"""
+
+    def __init__(self, db_path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.store = SQLiteLRUStore(db_path, max_bytes, table="step_results")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def step_key(step: Dict[str, Any], inputs_hash: str, model: Optional[str],
+                 dependency_hashes: Dict[str, str]) -> str:
+        """Key a step on its definition, the run inputs, the model and its dependencies' results"""
+        return stable_hash({
+            'step': step,
+            'inputs': inputs_hash,
+            'model': model,
+            'dependencies': dependency_hashes,
+        })
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        blob = self.store.get(key)
+        if blob is None:
+            self.misses += 1
+            return None
+        try:
+            entry = pickle.loads(blob)
+        except Exception as e:
+            print(f"[WARN] Dropping unreadable step cache entry {key[:12]}: {e}")
+            self.store.delete(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, result: Any, context_updates: Dict[str, Any]) -> bool:
+        """Store a step result; returns False if it cannot be pickled"""
+        try:
+            blob = pickle.dumps({'result': result, 'context_updates': context_updates})
+        except Exception as e:
+            print(f"[DEBUG] Step result not cacheable: {e}")
+            return False
+        self.store.put(key, blob)
+        return True
+
+    @staticmethod
+    def is_cacheable(result: Any) -> bool:
+        """Failed steps and foreach steps with failed items are never cached"""
+        if isinstance(result, dict) and result.get('success') is False:
+            return False
+        if isinstance(result, list):
+            return not any(isinstance(r, dict) and r.get('success') is False for r in result)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.store),
+            'bytes': self.store.total_bytes(),
+        }
@@ -0,0 +1,191 @@
+# core/step_executor.py
+import asyncio
+import pickle
+import linecache
+import traceback
+import multiprocessing
+from functools import lru_cache
+from types import MappingProxyType, CodeType
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+from .layered_context import LayeredContext
+from .cancellation import RunCancelled, guarded
+
+
+@lru_cache(maxsize=256)
+def compile_step_code(source: str, filename: str) -> CodeType:
+    """Compile a python/run step body once; later calls with the same source reuse the code object"""
+    code = compile(source, filename, 'exec')
+    # Register the source so tracebacks from exec'd step code show the offending lines
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    return code
+
+
+def _step_filename(step: Dict[str, Any]) -> str:
+    return f"<step:{step.get('name', 'unnamed')}>"
+
+
+def _exec_step_code(code: CodeType, context) -> Any:
+    """Run compiled step code against a context, with the same result rules as the original exec"""
+    local_vars = {'context': context}
+    exec(code, {}, local_vars)
+    # If 'result' is set in local_vars, return it; else return all locals except context
+    if 'result' in local_vars:
+        return local_vars['result']
+    output = {k: v for k, v in local_vars.items() if k != 'context'}
+    return output if output else None
+
+
+def _run_in_worker(source: str, filename: str, pickled_context: Dict[str, bytes]) -> Tuple[Any, Dict[str, Any]]:
+    """Process-pool entry point: rebuild the context, run the step and return (result, writes)"""
+    context = LayeredContext({}, {k: pickle.loads(v) for k, v in pickled_context.items()})
+    try:
+        result = _exec_step_code(compile_step_code(source, filename), context)
+    except Exception as e:
+        traceback.print_exc()
+        return {'success': False, 'error': str(e)}, {}
+    return result, context.writes()
+
+
+def _run_in_own_process(conn, source: str, filename: str, pickled_context: Dict[str, bytes]):
+    """Entry point of a step's own worker process: send ('ok', (result, writes)) or ('error', message)"""
+    try:
+        outcome = _run_in_worker(source, filename, pickled_context)
+        conn.send(('ok', outcome))
+    except Exception as e:
+        # The result or the writes could not be pickled back
+        conn.send(('error', str(e)))
+    finally:
+        conn.close()
+
+
+def _receive(conn, process) -> Tuple[str, Any]:
+    """Blocking wait for a worker's answer (run in a thread); a killed worker gives ('error', ...)"""
+    try:
+        return conn.recv()
+    except EOFError:
+        return 'error', f"worker process exited with code {process.exitcode}"
+    finally:
+        conn.close()
+        process.join()
+
+
+class PythonStepExecutor:
+    """Run python/run steps from cached code objects, inline or in a worker process pool"""
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def step_source(step: Dict[str, Any]) -> Optional[str]:
+        return step.get('code') or step.get('run')
+
+    def precompile(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Compile every python/run step when a config is loaded; syntax errors are reported, not raised"""
+        compiled, errors = 0, []
+        for step in config.get('processing_steps', []) or []:
+            if step.get('type', '') not in ("python", "run"):
+                continue
+            source = self.step_source(step)
+            if not source:
+                continue
+            try:
+                compile_step_code(source, _step_filename(step))
+                compiled += 1
+            except SyntaxError as e:
+                errors.append(f"{step.get('name')}: {e}")
+        for error in errors:
+            print(f"[WARN] Python step failed to compile: {error}")
+        return {'compiled': compiled, 'errors': errors}
+
+    async def run(self, step: Dict[str, Any], context) -> Any:
+        """Execute a python/run step; writes to `context` behave the same in both executors"""
+        source = self.step_source(step)
+        if not source:
+            raise ValueError("No code provided for python/run step")
+        if step.get('executor', 'inline') == 'process':
+            return await self._run_in_process(step, source, context)
+        try:
+            return _exec_step_code(compile_step_code(source, _step_filename(step)), context)
+        except Exception as e:
+            traceback.print_exc()
+            return {'success': False, 'error': str(e)}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn keeps workers independent of the event loop and threads in this process
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    @staticmethod
+    def _pickle_context(step_name: str, context) -> Dict[str, bytes]:
+        """Pickle each context key separately so unpicklable entries (processors, DB handles) are dropped"""
+        pickled, skipped = {}, []
+        for key in context:
+            value = context[key]
+            if isinstance(value, MappingProxyType):
+                value = dict(value)
+            try:
+                pickled[key] = pickle.dumps(value)
+            except Exception:
+                skipped.append(key)
+        if skipped:
+            print(f"[DEBUG] Step '{step_name}' runs in a worker process without unpicklable context keys: {skipped}")
+        return pickled
+
+    async def _run_in_process(self, step: Dict[str, Any], source: str, context) -> Any:
+        step_name = step.get('name', 'unnamed')
+        timeout = step.get('timeout')
+        pickled_context = self._pickle_context(step_name, context)
+        loop = asyncio.get_running_loop()
+        if timeout:
+            # A timed step gets a worker of its own, so killing it leaves the shared pool alone
+            future = self._run_own_process(source, _step_filename(step), pickled_context)
+        else:
+            future = loop.run_in_executor(self._get_pool(), _run_in_worker, source, _step_filename(step),
+                                          pickled_context)
+        try:
+            result, writes = await guarded(future, timeout)
+        except RunCancelled:
+            if timeout:
+                print(f"[CANCEL] Stopping python step '{step_name}'")
+            else:
+                print(f"[CANCEL] Python step '{step_name}' finishes in the background; its result is dropped")
+            raise
+        except asyncio.TimeoutError:
+            print(f"[ERROR] Python step '{step_name}' timed out after {timeout}s; worker stopped")
+            return {'success': False, 'error': f"Step timed out after {timeout}s"}
+        except Exception as e:
+            # Worker crashed, or the result/writes could not be pickled back
+            print(f"[ERROR] Python step '{step_name}' failed in worker process: {e}")
+            return {'success': False, 'error': str(e)}
+        for key, value in writes.items():
+            context[key] = value
+        return result
+
+    @staticmethod
+    async def _run_own_process(source: str, filename: str,
+                               pickled_context: Dict[str, bytes]) -> Tuple[Any, Dict[str, Any]]:
+        """Run the step in a new worker process; it is terminated if this is cancelled (timeout, run cancelled)"""
+        spawn = multiprocessing.get_context('spawn')
+        receiver, sender = spawn.Pipe(duplex=False)
+        process = spawn.Process(target=_run_in_own_process, args=(sender, source, filename, pickled_context),
+                                daemon=True)
+        process.start()
+        sender.close()
+        try:
+            status, payload = await asyncio.get_running_loop().run_in_executor(None, _receive, receiver, process)
+        finally:
+            if process.is_alive():
+                process.terminate()
+        if status != 'ok':
+            raise RuntimeError(payload)
+        return payload
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,125 @@
+# core/template_cache.py
+import time
+import threading
+import contextvars
+from collections import OrderedDict, ChainMap
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+
+from jinja2 import Environment, Template
+
+# Per-step timing accumulator; set by the pipeline for the duration of a step task
+# (foreach item tasks inherit it), so every render is attributed to its step.
+_active_stats: contextvars.ContextVar = contextvars.ContextVar('template_stats', default=None)
+
+
+class TemplateCache:
+    """Compile each Jinja template source once and time compile versus render"""
+
+    def __init__(self, env: Environment, max_size: int = 1024):
+        self.env = env
+        self.max_size = max_size
+        self._templates: "OrderedDict[str, Template]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _record(stats: Optional[Dict[str, Any]], key: str, seconds: float):
+        if stats is None:
+            return
+        stats[f'template_{key}_time'] = stats.get(f'template_{key}_time', 0.0) + seconds
+        stats[f'template_{key}s'] = stats.get(f'template_{key}s', 0) + 1
+
+    def get(self, source: str) -> Template:
+        """Return the compiled template for a source string, compiling it on first use"""
+        with self._lock:
+            template = self._templates.get(source)
+            if template is not None:
+                self._templates.move_to_end(source)
+                self.hits += 1
+                return template
+        started = time.perf_counter()
+        template = self.env.from_string(source)
+        self._record(_active_stats.get(), 'compile', time.perf_counter() - started)
+        with self._lock:
+            self.misses += 1
+            self._templates[source] = template
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def render(self, source: str, context: Dict[str, Any]) -> str:
+        """Render a template source with the given context using the compiled cache"""
+        template = self.get(source)
+        started = time.perf_counter()
+        # Hand Jinja the caller's mapping (plus globals) instead of copying it into a new dict,
+        # which is what Template.render(**context) does on every call
+        jinja_context = template.new_context(ChainMap(context, template.globals), shared=True)
+        try:
+            rendered = self.env.concat(template.root_render_func(jinja_context))
+        except Exception:
+            self.env.handle_exception()
+        self._record(_active_stats.get(), 'render', time.perf_counter() - started)
+        return rendered
+
+    @contextmanager
+    def track(self, stats: Dict[str, Any]):
+        """Attribute compile and render times inside this block (and tasks it spawns) to stats"""
+        token = _active_stats.set(stats)
+        try:
+            yield stats
+        finally:
+            _active_stats.reset(token)
+
+    def precompile(self, sources: List[str]) -> Dict[str, Any]:
+        """Compile every template up front; syntax errors are reported, not raised"""
+        started = time.perf_counter()
+        compiled, errors = 0, []
+        for source in sources:
+            try:
+                self.get(source)
+                compiled += 1
+            except Exception as e:
+                errors.append(f"{source[:60]!r}: {e}")
+        for error in errors:
+            print(f"[WARN] Template failed to compile: {error}")
+        return {'compiled': compiled, 'errors': errors, 'seconds': time.perf_counter() - started}
+
+    @staticmethod
+    def collect_templates(config: Dict[str, Any]) -> List[str]:
+        """Find every Jinja template string in a pipeline config (step prompts and outputs)"""
+        sources = []
+
+        def collect_strings(value):
+            if isinstance(value, dict):
+                for v in value.values():
+                    collect_strings(v)
+            elif isinstance(value, list):
+                for v in value:
+                    collect_strings(v)
+            elif isinstance(value, str) and '{{' in value:
+                sources.append(value)
+
+        for step in config.get('processing_steps', []) or []:
+            if step.get('type', '') in ("python", "run", "reranker"):
+                continue
+            if step.get('foreach'):
+                if step.get('input'):
+                    sources.append(step['input'])
+            else:
+                prompt_template = step.get('prompt_template', '') or step.get('input', '')
+                if prompt_template:
+                    sources.append(prompt_template)
+        for output_spec in config.get('outputs', []) or []:
+            if output_spec.get('condition'):
+                sources.append(f"{{{{ {output_spec['condition']} }}}}")
+            for key in ('filename', 'content'):
+                if isinstance(output_spec.get(key), str):
+                    sources.append(output_spec[key])
+            collect_strings(output_spec.get('data'))
+        # Preserve order, drop duplicates
+        return list(dict.fromkeys(sources))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'cached_templates': len(self._templates), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,157 @@
+# core/token_budget.py
+import math
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .config import LLM_TOKENIZER, LLM_CONTEXT_BUCKETS
+
+
+class PromptTooLarge(ValueError):
+    """A prompt does not fit the largest context window, even with a minimal answer"""
+
+    def __init__(self, prompt_tokens: int, max_prompt_tokens: int, max_ctx: int):
+        super().__init__(f"prompt of {prompt_tokens} tokens does not fit the {max_ctx}-token context window "
+                         f"(at most {max_prompt_tokens} prompt tokens)")
+        self.prompt_tokens = prompt_tokens
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_ctx = max_ctx
+
+
+class TokenCounter:
+    """Counts prompt tokens with a HuggingFace tokenizer, or a conservative estimate without one.
+
+    `tokenizer` is a tokenizer.json path or a hub name (e.g. Qwen/Qwen2.5-Coder-7B-Instruct) and
+    needs the optional `tokenizers` package; it is loaded on first use.
+    """
+
+    def __init__(self, tokenizer: str = ""):
+        self.name = tokenizer
+        self._tokenizer = None
+        self._loaded = not tokenizer
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        from tokenizers import Tokenizer
+                        if Path(self.name).exists():
+                            self._tokenizer = Tokenizer.from_file(self.name)
+                        else:
+                            self._tokenizer = Tokenizer.from_pretrained(self.name)
+                    except Exception as e:
+                        print(f"[WARN] Tokenizer {self.name!r} unavailable, estimating prompt tokens: {e}")
+                    self._loaded = True
+        return self._tokenizer
+
+    @property
+    def exact(self) -> bool:
+        return self._get() is not None
+
+    def count(self, text: str) -> int:
+        tokenizer = self._get()
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False).ids)
+        # BPE vocabularies of local models average 3.5-4 bytes per token on English prose and
+        # fewer on numbers and symbols; 3 bytes per token errs towards a larger window
+        return math.ceil(len(text.encode('utf-8')) / 3)
+
+
+class TokenBudget:
+    """Sizes num_ctx for each request: prompt tokens plus expected output, rounded up to a bucket.
+
+    Ollama reloads a model whenever num_ctx changes, so sizes are limited to a few buckets and a
+    request joins a larger bucket that is already serving other requests rather than forcing a
+    reload to a smaller one. When the prompt leaves less room than the expected output in the
+    largest bucket the answer is capped to what fits; below `min_predict` the request is refused.
+    """
+
+    def __init__(self, buckets: Sequence[int] = (2048, 8192, 32768), counter: Optional[TokenCounter] = None,
+                 template_tokens: int = 32, min_predict: int = 256):
+        self.buckets = sorted(set(int(b) for b in buckets if int(b) > 0))
+        self.max_ctx = self.buckets[-1]
+        self.counter = counter or TokenCounter()
+        # Chat template and role markers Ollama wraps around the message
+        self.template_tokens = template_tokens
+        self.min_predict = min_predict
+        self._in_flight: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        return self.counter.count(text) + self.template_tokens
+
+    def max_prompt_tokens(self, num_predict: int) -> int:
+        return self.max_ctx - min(num_predict, self.min_predict)
+
+    def plan(self, prompt: str, num_predict: int) -> Dict[str, int]:
+        """num_ctx, num_predict and prompt_tokens for one request; raises PromptTooLarge"""
+        prompt_tokens = self.count(prompt)
+        needed = prompt_tokens + num_predict
+        if needed > self.max_ctx:
+            room = self.max_ctx - prompt_tokens
+            if room < min(num_predict, self.min_predict):
+                raise PromptTooLarge(prompt_tokens, self.max_prompt_tokens(num_predict), self.max_ctx)
+            return {'num_ctx': self.max_ctx, 'num_predict': room, 'prompt_tokens': prompt_tokens}
+        num_ctx = next(b for b in self.buckets if b >= needed)
+        with self._lock:
+            busy = [b for b, count in self._in_flight.items() if count and b >= num_ctx]
+        if busy:
+            num_ctx = min(busy)
+        return {'num_ctx': num_ctx, 'num_predict': num_predict, 'prompt_tokens': prompt_tokens}
+
+    def begin(self, num_ctx: int):
+        with self._lock:
+            self._in_flight[num_ctx] = self._in_flight.get(num_ctx, 0) + 1
+
+    def end(self, num_ctx: int):
+        with self._lock:
+            self._in_flight[num_ctx] -= 1
+
+    def split_text(self, text: str, max_tokens: int) -> List[str]:
+        """Pieces of `text` of at most max_tokens each (template overhead excluded), cut at
+        paragraph breaks, then line breaks, then spaces"""
+        return self._split(text, max(1, max_tokens), ("\n\n", "\n", " "))
+
+    def _split(self, text: str, max_tokens: int, separators: Sequence[str]) -> List[str]:
+        if self.counter.count(text) <= max_tokens:
+            return [text]
+        if not separators:
+            # One unbroken run: cut by characters in proportion to its token count
+            size = max(1, len(text) * max_tokens // self.counter.count(text))
+            return [text[i:i + size] for i in range(0, len(text), size)]
+        separator, rest = separators[0], separators[1:]
+        pieces: List[str] = []
+        current, current_tokens = [], 0
+        for part in text.split(separator):
+            tokens = self.counter.count(part + separator)
+            if tokens > max_tokens:
+                if current:
+                    pieces.append(separator.join(current))
+                    current, current_tokens = [], 0
+                pieces.extend(self._split(part, max_tokens, rest))
+                continue
+            if current and current_tokens + tokens > max_tokens:
+                pieces.append(separator.join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += tokens
+        if current:
+            pieces.append(separator.join(current))
+        return [piece for piece in pieces if piece.strip()]
+
+
+_shared_counter: Optional[TokenCounter] = None
+
+
+def shared_token_counter() -> TokenCounter:
+    """The LLM_TOKENIZER counter, loaded once per process"""
+    global _shared_counter
+    if _shared_counter is None:
+        _shared_counter = TokenCounter(LLM_TOKENIZER)
+    return _shared_counter
+
+
+def default_budget() -> TokenBudget:
+    return TokenBudget(LLM_CONTEXT_BUCKETS, shared_token_counter())
@@ -0,0 +1,153 @@
+# core/tracing.py
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+# Tracer of the run executing in this task (None outside traced runs) and the innermost open span
+_active_tracer: contextvars.ContextVar = contextvars.ContextVar('active_tracer', default=None)
+_active_span: contextvars.ContextVar = contextvars.ContextVar('active_span', default=None)
+
+# Attributes child spans inherit from their parent, so an LLM call knows its step and item
+_INHERITED = ('step', 'foreach_index', 'model')
+
+
+class Tracer:
+    """Collect timed spans for one pipeline run and export them as a Chrome trace"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+        self._lanes: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+
+    def _lane(self) -> int:
+        """Chrome trace thread id: one lane per asyncio task (or OS thread), so spans in a lane nest"""
+        try:
+            owner = asyncio.current_task()
+        except RuntimeError:
+            owner = None
+        key = id(owner) if owner is not None else ('thread', threading.get_ident())
+        with self._lock:
+            return self._lanes.setdefault(key, len(self._lanes) + 1)
+
+    @contextmanager
+    def span(self, name: str, category: str = "pipeline", **attrs):
+        """Time a block; the yielded dict can be given more attributes before the block ends"""
+        parent = _active_span.get()
+        if parent:
+            for key in _INHERITED:
+                if key in parent['args'] and key not in attrs:
+                    attrs[key] = parent['args'][key]
+        record = {'name': name, 'cat': category, 'args': attrs, 'tid': self._lane()}
+        token = _active_span.set(record)
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record['start'] = start - self._origin
+            record['wall'] = time.perf_counter() - start
+            # CPU time of the executing thread; interleaved tasks on the loop thread are included
+            record['cpu'] = time.thread_time() - cpu_start
+            _active_span.reset(token)
+            with self._lock:
+                self.spans.append(record)
+
+    @contextmanager
+    def activate(self):
+        """Make this the tracer for module-level span() calls in this task and tasks it spawns"""
+        token = _active_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _active_tracer.reset(token)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Trace-event JSON loadable in chrome://tracing or https://ui.perfetto.dev"""
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': self.name}}]
+        for span in sorted(self.spans, key=lambda s: s['start']):
+            events.append({
+                'name': span['name'], 'cat': span['cat'], 'ph': 'X', 'pid': 1, 'tid': span['tid'],
+                'ts': round(span['start'] * 1e6, 1), 'dur': round(span['wall'] * 1e6, 1),
+                'args': {**span['args'], 'cpu_ms': round(span['cpu'] * 1000, 2)},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Spans aggregated by category and name, slowest total first"""
+        rows: Dict[tuple, Dict[str, Any]] = {}
+        for span in self.spans:
+            row = rows.setdefault((span['cat'], span['name']), {
+                'category': span['cat'], 'name': span['name'], 'count': 0, 'wall': 0.0, 'cpu': 0.0, 'max': 0.0,
+            })
+            row['count'] += 1
+            row['wall'] += span['wall']
+            row['cpu'] += span['cpu']
+            row['max'] = max(row['max'], span['wall'])
+        return sorted(rows.values(), key=lambda r: r['wall'], reverse=True)
+
+    def slowest(self, category: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        spans = [s for s in self.spans if category is None or s['cat'] == category]
+        return sorted(spans, key=lambda s: s['wall'], reverse=True)[:limit]
+
+    def summary_table(self, pipeline_metrics: Optional[Dict[str, Any]] = None) -> str:
+        lines = [f"Trace summary: {self.name}", ""]
+        if pipeline_metrics and pipeline_metrics.get('critical_path'):
+            lines.append(f"Wall time: {pipeline_metrics.get('wall_time', 0):.2f}s")
+            lines.append(f"Critical path ({pipeline_metrics['critical_path_time']:.2f}s): "
+                         f"{' -> '.join(pipeline_metrics['critical_path'])}")
+            lines.append("")
+        if pipeline_metrics and pipeline_metrics.get('llm_usage'):
+            lines.append(f"{'Model':32} {'Calls':>6} {'Prompt tok':>10} {'Prompt t/s':>10} {'Gen tok':>8} "
+                         f"{'Gen t/s':>8} {'Load s':>8} {'Queue s':>8}")
+            for model, usage in pipeline_metrics['llm_usage'].items():
+                lines.append(f"{model[:32]:32} {usage['calls']:6d} {usage['prompt_tokens']:10d} "
+                             f"{_rate(usage['prompt_tps']):>10} {usage['completion_tokens']:8d} "
+                             f"{_rate(usage['generation_tps']):>8} {usage['load_seconds']:8.2f} "
+                             f"{usage['queue_seconds']:8.2f}")
+            lines.append("")
+        lines.append(f"{'Category':12} {'Span':40} {'Count':>6} {'Total s':>9} {'Mean s':>8} {'Max s':>8} {'CPU s':>8}")
+        for row in self.summary():
+            lines.append(f"{row['category'][:12]:12} {row['name'][:40]:40} {row['count']:6d} {row['wall']:9.3f} "
+                         f"{row['wall'] / row['count']:8.3f} {row['max']:8.3f} {row['cpu']:8.3f}")
+        lines += ["", "Slowest spans:"]
+        for span in self.slowest(limit=10):
+            where = ", ".join(f"{k}={v}" for k, v in span['args'].items())
+            lines.append(f"  {span['wall']:8.3f}s  {span['cat']}/{span['name']}  {where}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: Path, stem: str,
+               pipeline_metrics: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Write <stem>_trace.json and <stem>_trace_summary.txt; returns their paths"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        trace_path = directory / f"{stem}_trace.json"
+        summary_path = directory / f"{stem}_trace_summary.txt"
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(self.summary_table(pipeline_metrics))
+        return [str(trace_path), str(summary_path)]
+
+
+def _rate(value: Optional[float]) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+@contextmanager
+def span(name: str, category: str = "pipeline", **attrs):
+    """Record a span on the active run's tracer; a no-op outside traced runs"""
+    tracer = _active_tracer.get()
+    if tracer is None:
+        yield attrs
+        return
+    with tracer.span(name, category, **attrs) as span_attrs:
+        yield span_attrs
@@ -1,8 +1,7 @@
 import os
 import pickle
-import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
+from core.model_registry import get_sentence_transformer, get_faiss_index
+from core.tracing import span
 
 # Paths
 DB_PATH = r"C:/Users/cyqt2/Database/overhaul/databases/meters.db"
@@ -13,6 +12,8 @@ FAISS_META_PATH = r"C:/Users/cyqt2/Database/overhaul/faiss_metadata.pkl"
 # 1. Build and save FAISS index from meter database
 def build_faiss_index():
     import sqlite3
+    import faiss
+    from sentence_transformers import SentenceTransformer
     model = SentenceTransformer(EMBEDDING_MODEL_PATH)
     documents = []
     metadatas = []
@@ -46,12 +47,13 @@ def build_faiss_index():
 
 # 2. Query FAISS index
 def query_faiss(query_text, top_k=3):
-    model = SentenceTransformer(EMBEDDING_MODEL_PATH)
-    index = faiss.read_index(FAISS_INDEX_PATH)
-    with open(FAISS_META_PATH, 'rb') as f:
-        meta = pickle.load(f)
-    query_emb = model.encode([query_text], convert_to_numpy=True)
-    D, I = index.search(query_emb, top_k)
+    # Model and index are loaded once per process and shared across queries and runs
+    model = get_sentence_transformer(EMBEDDING_MODEL_PATH)
+    index, meta = get_faiss_index(FAISS_INDEX_PATH, FAISS_META_PATH)
+    with span('embed_query', 'faiss'):
+        query_emb = model.encode([query_text], convert_to_numpy=True)
+    with span('faiss_search', 'faiss', index=os.path.basename(FAISS_INDEX_PATH), top_k=top_k):
+        D, I = index.search(query_emb, top_k)
     results = []
     for idx in I[0]:
         if idx < len(meta['metadatas']):
@@ -1,29 +1,17 @@
 import json
-import re
+
+from core.json_scanner import extract_json
 
 def clean_json_file(input_path, output_path=None):
     with open(input_path, 'r', encoding='utf-8') as f:
         raw = f.read()
 
-    # Remove Markdown code block markers if present
-    raw = re.sub(r"^```json\s*|```$", "", raw.strip(), flags=re.MULTILINE)
-
-    # Remove trailing commas before closing brackets/braces
-    raw = re.sub(r",\s*([\]}])", r"\1", raw)
-
-    # Try to find the largest valid JSON prefix by trimming from the end, skipping whitespace
-    raw_bytes = raw.encode('utf-8')
-    for end in range(len(raw_bytes), 0, -1):
-        candidate = raw_bytes[:end].decode('utf-8', errors='ignore').rstrip()
-        try:
-            data = json.loads(candidate)
-            print("Recovered valid JSON prefix.")
-            break
-        except Exception:
-            continue
-    else:
+    # One pass over the text: skips code fences, drops trailing commas and closes truncated output
+    data = extract_json(raw)
+    if data is None:
         print("Could not recover any valid JSON.")
         return
+    print("Recovered valid JSON.")
 
     out_path = output_path if output_path else input_path
     with open(out_path, 'w', encoding='utf-8') as f:
@@ -32,4 +20,4 @@ def clean_json_file(input_path, output_path=None):
 
 if __name__ == "__main__":
     input_path = input("Enter the path to the JSON file to clean: ").strip()
-    clean_json_file(input_path)
\ No newline at end of file
+    clean_json_file(input_path)
@@ -5,24 +5,173 @@ YAML Prompt Engine with Auto-Discovery Database Integration
 Main entry point for the Compliance Automation system
 """
 
+import argparse
 import asyncio
 import os
 import sys
 from pathlib import Path
 from core.prompt_engine import PromptEngine
+from core.batch_runner import BatchRunner
+from core.pipeline_service import PipelineService, create_server
+from core.config import BATCH_MAX_PARALLEL, SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="YAML Prompt Engine with Auto-Discovery")
+    parser.add_argument('--resume', metavar='RUN_ID',
+                        help='Resume a checkpointed run from outputs/runs/<RUN_ID> after a crash or failure')
+    parser.add_argument('--batch', metavar='DIR_OR_GLOB',
+                        help='Run the --prompt pipeline over every file in a directory or matching a glob')
+    parser.add_argument('--prompt', metavar='YAML', help='Pipeline YAML for --batch')
+    parser.add_argument('--parallel', type=int, default=BATCH_MAX_PARALLEL,
+                        help=f'Documents processed at the same time in --batch mode (default: {BATCH_MAX_PARALLEL})')
+    parser.add_argument('--input-name', help='Pipeline file input that receives each document (default: first file input)')
+    parser.add_argument('--llm-model', help='LLM model for every document in --batch mode')
+    parser.add_argument('--plan', action='store_true',
+                        help='Dry-run the --prompt pipeline and estimate LLM calls, tokens and wall time')
+    parser.add_argument('--input', action='append', default=[], metavar='NAME=VALUE',
+                        help='Pipeline input for --plan or --batch (repeatable), e.g. analysis_file=tender.pdf')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='Stop a run (each document in --batch mode) after this long and write partial outputs')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a resident job service with an HTTP/JSON API')
+    parser.add_argument('--host', default=SERVICE_HOST, help=f'--serve bind address (default: {SERVICE_HOST})')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help=f'--serve port (default: {SERVICE_PORT})')
+    parser.add_argument('--workers', type=int, default=SERVICE_WORKERS,
+                        help=f'Jobs run at the same time in --serve mode (default: {SERVICE_WORKERS})')
+    parser.add_argument('--warm', nargs='*', default=[], metavar='PROMPT',
+                        help='Prompts (e.g. oneshot) whose databases, templates and models are loaded at startup')
+    return parser.parse_args(argv)
+
+def report_result(result):
+    if result.get('success'):
+        print("✅ Analysis completed successfully!")
+        if result.get('output_files'):
+            print("\n📄 Generated files:")
+            for file_path in result['output_files']:
+                print(f"  - {file_path}")
+        return 0
+    if result.get('cancelled'):
+        print(f"⏹️ Analysis stopped: {result.get('error')}")
+        if result.get('output_files'):
+            print("\n📄 Partial output files:")
+            for file_path in result['output_files']:
+                print(f"  - {file_path}")
+        if result.get('run_id'):
+            print(f"↩️  Resume with: python main.py --resume {result['run_id']}")
+        return 1
+    print(f"❌ Analysis failed: {result.get('error', 'Unknown error')}")
+    if result.get('run_id'):
+        print(f"↩️  Resume with: python main.py --resume {result['run_id']}")
+    return 1
+
+def run_batch(engine, args):
+    if not args.prompt:
+        print("❌ --batch requires --prompt <pipeline.yaml>")
+        return 1
+    documents = BatchRunner.resolve_documents(args.batch)
+    if not documents:
+        print(f"❌ No input files found for {args.batch}")
+        return 1
+    try:
+        inputs = parse_inputs(args.input)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    if args.llm_model:
+        inputs['llm_model'] = args.llm_model
+    try:
+        runner = BatchRunner(engine, args.prompt, input_name=args.input_name,
+                             max_parallel=args.parallel, inputs=inputs, deadline=args.deadline)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"\n🔄 Running {Path(args.prompt).name} over {len(documents)} documents "
+          f"({runner.max_parallel} at a time)...")
+    try:
+        summary = asyncio.run(runner.run(documents))
+    except KeyboardInterrupt:
+        print("\n⏹️ Batch cancelled by user")
+        return 1
+    print(f"\n✅ {summary['succeeded']} succeeded, ❌ {summary['failed']} failed in {summary['wall_time']:.1f}s")
+    print(f"📄 Summary: {Path(summary['summary_dir']) / 'summary.txt'}")
+    return 0 if summary['failed'] == 0 else 1
+
+def parse_inputs(pairs):
+    inputs = {}
+    for pair in pairs:
+        name, sep, value = pair.partition('=')
+        if not sep:
+            raise ValueError(f"--input expects NAME=VALUE, got {pair!r}")
+        inputs[name] = value
+    return inputs
+
+def run_plan(engine, args):
+    from core.run_planner import RunPlanner
+    if not args.prompt:
+        print("❌ --plan requires --prompt <pipeline.yaml>")
+        return 1
+    try:
+        inputs = parse_inputs(args.input)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    if args.llm_model:
+        inputs['llm_model'] = args.llm_model
+    plan = asyncio.run(engine.plan_run(args.prompt, **inputs))
+    print()
+    print(RunPlanner.format_plan(plan))
+    return 0
+
+def run_service(engine, args):
+    service = PipelineService(engine, workers=args.workers)
+    service.start()
+    if args.warm:
+        print(f"🔥 Warming up: {', '.join(args.warm)}")
+        service.warm_up(args.warm)
+    server = create_server(service, args.host, args.port)
+    print(f"🌐 Serving pipeline jobs on http://{args.host}:{server.server_port} ({service.workers} workers)")
+    print("   POST /jobs, GET /jobs/<id>, GET /jobs/<id>/outputs[/<file>], GET /health")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ Service stopped")
+    finally:
+        server.server_close()
+        service.stop()
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
     print("🚀 YAML Prompt Engine with Auto-Discovery")
     print("=" * 50)
     
     # Initialize engine
     try:
-        engine = PromptEngine()
+        # Batch and service runs are unattended: missing inputs use their defaults instead of prompting
+        engine = PromptEngine(interactive=not (args.batch or args.serve))
         print("✅ Prompt engine initialized")
     except Exception as e:
         print(f"❌ Failed to initialize engine: {e}")
         return 1
     
+    if args.batch:
+        return run_batch(engine, args)
+
+    if args.serve:
+        return run_service(engine, args)
+
+    if args.plan:
+        return run_plan(engine, args)
+
+    if args.resume:
+        try:
+            print(f"\n🔄 Resuming run {args.resume}...")
+            result = asyncio.run(engine.run_prompt(resume=args.resume, deadline=args.deadline))
+            return report_result(result)
+        except KeyboardInterrupt:
+            print("\n⏹️ Analysis cancelled by user")
+            return 1
+    
     # List available prompts
     prompts_dir = Path("prompts")
     if not prompts_dir.exists():
@@ -58,16 +207,8 @@ def main():
     # Run the analysis
     try:
         print(f"\n🔄 Running analysis with {selected_prompt.name}...")
-        result = asyncio.run(engine.run_prompt(str(selected_prompt)))
-        
-        if result.get('success'):
-            print("✅ Analysis completed successfully!")
-            if result.get('output_files'):
-                print("\n📄 Generated files:")
-                for file_path in result['output_files']:
-                    print(f"  - {file_path}")
-        else:
-            print(f"❌ Analysis failed: {result.get('error', 'Unknown error')}")
+        result = asyncio.run(engine.run_prompt(str(selected_prompt), deadline=args.deadline))
+        if report_result(result):
             return 1
             
     except KeyboardInterrupt:
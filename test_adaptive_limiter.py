@@ -0,0 +1,151 @@
+import asyncio
+
+from core.adaptive_limiter import AdaptiveLimiter
+from core.llm_processor import LLMProcessor
+
+
+class SimulatedServer:
+    """Requests take 10ms up to 4 in parallel and slow down quadratically beyond that"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+
+    async def request(self):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.01 * max(1.0, self.in_flight / 4) ** 2)
+        finally:
+            self.in_flight -= 1
+        return 20
+
+
+def test_limiter_settles_near_the_throughput_peak():
+    server = SimulatedServer()
+    limiter = AdaptiveLimiter(initial=1, max_limit=16, window=4)
+    limits = []
+
+    async def call():
+        async with limiter.slot():
+            limits.append(int(limiter.limit))
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            tokens = await server.request()
+            limiter.record(loop.time() - started, tokens)
+
+    async def scenario():
+        await asyncio.gather(*(call() for _ in range(600)))
+
+    asyncio.run(scenario())
+    stats = limiter.stats()
+    assert stats['increases'] >= 3
+    # AIMD keeps probing around the peak, so judge where it spent the second half, not its last value
+    settled = sorted(limits[len(limits) // 2:])
+    assert 2 <= settled[len(settled) // 2] <= 6
+    assert server.peak <= 8
+
+
+def test_limiter_backs_off_when_server_latency_jumps():
+    limiter = AdaptiveLimiter(initial=4, max_limit=8, window=4)
+    latency = [0.01]
+
+    async def call():
+        async with limiter.slot():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await asyncio.sleep(latency[0])
+            limiter.record(loop.time() - started, 20)
+
+    async def scenario():
+        await asyncio.gather(*(call() for _ in range(16)))
+        before = (limiter.limit, limiter.decreases)
+        # Ten times the latency is well past the tolerance of twice the best window's
+        latency[0] = 0.1
+        await asyncio.gather(*(call() for _ in range(16)))
+        return before
+
+    limit, decreases = asyncio.run(scenario())
+    assert limiter.decreases > decreases and limiter.limit < limit
+    assert limiter.best_latency < 0.05
+
+
+def test_a_burst_of_failures_backs_off_once_per_window():
+    limiter = AdaptiveLimiter(initial=8, window=4)
+    for _ in range(8):
+        limiter.record(1.0, ok=False)
+    assert limiter.decreases == 1 and limiter.limit == 5
+    # A window (8 completions at the old limit) later, a failure is a new overload
+    limiter.record(1.0, 20)
+    limiter.record(1.0, ok=False)
+    assert limiter.decreases == 2 and limiter.limit == 3
+
+
+def test_waiters_respect_the_limit_and_wake_on_increase():
+    limiter = AdaptiveLimiter(initial=2, max_limit=4, window=1)
+
+    async def scenario():
+        await limiter.acquire()
+        await limiter.acquire()
+        third = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not third.done() and limiter.in_flight == 2
+        # A first window (as many samples as the limit) counts as an improvement: the waiter gets a slot
+        limiter.record(0.1, 10)
+        limiter.record(0.1, 10)
+        await asyncio.sleep(0.01)
+        assert third.done() and limiter.in_flight == 3
+
+    asyncio.run(scenario())
+
+
+def test_a_waiter_cancelled_after_its_wakeup_passes_the_slot_on():
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+
+    async def scenario():
+        await limiter.acquire()
+        woken = asyncio.create_task(limiter.acquire())
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        # The release wakes the first waiter, which is cancelled before it resumes
+        limiter.release()
+        woken.cancel()
+        await asyncio.wait_for(queued, 1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+class HangingLLMProcessor(LLMProcessor):
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        await asyncio.sleep(5)
+
+
+def test_timeouts_back_off_the_processor_limit():
+    processor = HangingLLMProcessor(model="hang")
+    processor.limiter = AdaptiveLimiter(initial=8)
+
+    async def scenario():
+        return await asyncio.gather(*(processor.process_prompt("x", 0.05) for _ in range(8)))
+
+    results = asyncio.run(scenario())
+    assert all('timed out' in r['error'] for r in results)
+    assert processor.limiter.limit < 8 and processor.limiter.in_flight == 0
+    # Eight requests timing out together are one overload
+    assert processor.limiter.decreases == 1
+
+
+class FailingLLMProcessor(LLMProcessor):
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        error_type = 'client' if prompt == 'bad' else 'server'
+        return {'error': f"{error_type} error", 'error_type': error_type, 'success': False}
+
+
+def test_server_errors_back_off_the_limit_and_client_errors_do_not():
+    processor = FailingLLMProcessor(model="fail")
+    processor.response_cache = None
+    processor.limiter = AdaptiveLimiter(initial=8)
+    asyncio.run(processor.process_prompt("bad", 5))
+    assert processor.limiter.decreases == 0
+    asyncio.run(processor.process_prompt("busy", 5))
+    assert processor.limiter.decreases == 1 and processor.limiter.limit < 8
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+
+from core.batch_runner import BatchRunner
+from core.prompt_engine import PromptEngine
+
+PIPELINE = """
+name: "batch_test"
+inputs:
+  - name: "tender"
+    type: "file"
+    required: true
+  - name: "label"
+    type: "text"
+    default: "meters"
+processing_steps:
+  - name: "summarize"
+    type: llm
+    input: "Summarize {{ inputs.label }}: {{ inputs.tender.content }}"
+outputs:
+  - type: "text"
+    filename: "report_{{ timestamp }}.txt"
+    content: "{{ step_results.summarize.raw_response }}"
+"""
+
+
+class EchoLLMProcessor:
+    """Stand-in for LLMProcessor that echoes prompts and tracks overlap"""
+
+    model = "echo"
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+
+    async def process_prompt(self, prompt, timeout=120, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.1)
+            return {'raw_response': prompt, 'success': True}
+        finally:
+            self.in_flight -= 1
+
+
+def test_batch_runs_documents_in_parallel_on_one_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda *a: pytest.fail("batch runs must not prompt"))
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    docs = tmp_path / "tenders"
+    docs.mkdir()
+    for name in ("a", "b", "c"):
+        (docs / f"{name}.txt").write_text(f"tender {name}", encoding='utf-8')
+
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    llm = EchoLLMProcessor()
+    engine.llm_processor = llm
+    runner = BatchRunner(engine, str(pipeline), max_parallel=2, inputs={'checkpoint': False})
+    assert runner.input_name == "tender"
+
+    summary = asyncio.run(runner.run(BatchRunner.resolve_documents(str(docs))))
+
+    assert summary['succeeded'] == 3 and summary['failed'] == 0
+    assert llm.peak == 2
+    outputs = [entry['output_files'] for entry in summary['documents']]
+    # Same-second timestamps do not collide: every document has its own output folder
+    assert len({path for files in outputs for path in files}) == 3
+    with open(outputs[1][0], encoding='utf-8') as f:
+        assert f.read() == "Summarize meters: tender b"
+    with open(f"{summary['summary_dir']}/summary.json", encoding='utf-8') as f:
+        written = json.load(f)
+    assert [entry['duration'] > 0 for entry in written['documents']] == [True] * 3
+
+
+def test_missing_required_input_fails_instead_of_prompting(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+    assert result['success'] is False and 'tender' in result['error']
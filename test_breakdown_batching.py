@@ -0,0 +1,83 @@
+import asyncio
+import json
+import re
+
+from core.llm_processor import LLMProcessor
+from core.prompt_engine import PromptEngine
+
+PIPELINE = """
+name: "breakdown_test"
+processing_steps:
+  - name: "load_clauses"
+    type: python
+    code: |
+      result = {'clauses': [
+          {'features': ['Voltage 230V ±1%', 'Current 5A', 'Frequency 50Hz']},
+          {'features': ['Current 5A', 'Power factor 0.5-1', 'Garbled', 'Voltage 230V ±1%']},
+          {'features': ['Energy class 0.5S', 'Harmonics to 31st']},
+      ]}
+  - name: "llm_breakdown_features"
+    type: llm
+    dependencies: [load_clauses]
+    batch_size: 3
+    input: "{{ dep_load_clauses }}"
+  - name: "report"
+    type: python
+    dependencies: [llm_breakdown_features]
+    code: "result = context['requirements']"
+"""
+
+
+class BatchingLLMProcessor(LLMProcessor):
+    """Answers batch prompts with one entry per numbered feature; 'Garbled' only gets a usable answer alone"""
+
+    def __init__(self):
+        super().__init__(model="fake")
+        self.batches = []
+
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        if breakdown:
+            self.batches.append([prompt])
+            return {'parsed_result': {'atomic_requirement': f"{prompt} requirement"}, 'success': True}
+        features = re.findall(r"^\d+\. (.*)$", prompt.split("\nFeatures:\n")[-1], re.MULTILINE)
+        self.batches.append(features)
+        results = [{'index': i, 'atomic_requirement': "x" if feature == 'Garbled' else f"{feature} measurement"}
+                   for i, feature in enumerate(features, 1)]
+        return {'raw_response': json.dumps({'results': results}),
+                'parsed_result': {'results': results}, 'success': True}
+
+
+def test_breakdown_dedupes_batches_and_retries_only_failed_features(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    engine.llm_processor = BatchingLLMProcessor()
+
+    result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+    assert result['success'], result.get('error')
+
+    batches = engine.llm_processor.batches
+    # 7 distinct features in batches of 3, then only 'Garbled' again (half of 3: the single-feature prompt)
+    sent = [feature for batch in batches[:3] for feature in batch]
+    assert sorted(sent) == sorted(set(sent)) and len(sent) == 7
+    assert [len(batch) for batch in batches[:3]] == [3, 3, 1]
+    assert batches[3:] == [['Garbled']]
+
+    atomic_map = result['pipeline_results']['llm_breakdown_features']
+    assert atomic_map['Current 5A'] == 'Current 5A measurement'
+    assert atomic_map['Garbled'] == 'Garbled requirement'
+    assert len(result['pipeline_results']['report']) == 7
+
+
+def test_parse_breakdown_batch_rejects_out_of_range_and_long_answers():
+    features = ['a', 'b', 'c']
+    result = {'success': True, 'parsed_result': {'results': [
+        {'index': '1', 'atomic_requirement': 'RMS voltage ±0.5%'},
+        {'index': 2, 'atomic_requirement': 'one two three four five six seven eight nine'},
+        {'index': 7, 'atomic_requirement': 'Frequency 50Hz'},
+    ]}}
+    assert LLMProcessor.parse_breakdown_batch(result, features) == {'a': 'RMS voltage ±0.5%', 'b': '', 'c': ''}
+    # Answers without indices are matched by position only when every feature got one
+    positional = {'success': True, 'parsed_result': [{'atomic_requirement': f"{f} phrase"} for f in features]}
+    assert LLMProcessor.parse_breakdown_batch(positional, features) == {f: f"{f} phrase" for f in features}
+    assert LLMProcessor.parse_breakdown_batch({'success': False}, features) == {f: '' for f in features}
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import time
+
+from core.cancellation import CancelToken, RunCancelled
+from core.llm_processor import LLMProcessor
+from core.pipeline_service import PipelineService
+from core.prompt_engine import PromptEngine
+
+PIPELINE = """
+name: "cancel_test"
+processing_steps:
+  - name: "make_items"
+    type: python
+    code: "result = ['a', 'b', 'c', 'd', 'e', 'f']"
+  - name: "fan_out"
+    type: llm
+    dependencies: [make_items]
+    foreach: dep_make_items
+    concurrency: 2
+    input: "{{ item }}"
+  - name: "report"
+    type: python
+    dependencies: [fan_out]
+    code: "result = len(context['dep_fan_out'])"
+outputs:
+  - type: "text"
+    filename: "answers.txt"
+    content: "{{ step_results.fan_out | length }} answers"
+"""
+
+
+class StuckLLMProcessor(LLMProcessor):
+    """Answers 'a' and 'b' at once and never answers anything else"""
+
+    def __init__(self):
+        super().__init__(model="stuck")
+        self.prompts = []
+
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        self.prompts.append(prompt)
+        if prompt not in ('a', 'b'):
+            await asyncio.sleep(60)
+        return {'raw_response': prompt.upper(), 'success': True}
+
+
+class FastLLMProcessor(StuckLLMProcessor):
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        self.prompts.append(prompt)
+        return {'raw_response': prompt.upper(), 'success': True}
+
+
+def _engine(tmp_path, processor):
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    engine.llm_processor = processor
+    return engine
+
+
+def test_deadline_skips_pending_items_and_flushes_partial_outputs(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    engine = _engine(tmp_path, StuckLLMProcessor())
+
+    started = time.perf_counter()
+    result = asyncio.run(engine.run_prompt(str(pipeline), deadline=0.5))
+    assert time.perf_counter() - started < 5
+    assert result['cancelled'] and not result['success']
+    assert 'deadline of 0.5s exceeded' in result['error']
+
+    answers = result['pipeline_results']['fan_out']
+    assert [a.get('raw_response') for a in answers[:2]] == ['A', 'B']
+    assert all(a.get('cancelled') for a in answers[2:])
+    # Items e and f never reached the model
+    assert sorted(engine.llm_processor.prompts) == ['a', 'b', 'c', 'd']
+    metrics = result['metrics']
+    assert metrics['interrupted_steps'] == ['fan_out'] and metrics['skipped_steps'] == ['report']
+
+    files = {path.split('/')[-1].split('\\')[-1]: path for path in result['output_files']}
+    assert 'answers.txt' in files
+    partial_name = next(name for name in files if name.startswith('partial_results_'))
+    with open(files[partial_name], encoding='utf-8') as f:
+        assert len(json.load(f)['step_results']['fan_out']) == 6
+
+    # Resuming runs only the items that did not finish
+    engine.llm_processor = FastLLMProcessor()
+    resumed = asyncio.run(engine.run_prompt(resume=result['run_id']))
+    assert resumed['success'], resumed.get('error')
+    assert sorted(engine.llm_processor.prompts) == ['c', 'd', 'e', 'f']
+    assert resumed['pipeline_results']['report'] == 6
+
+
+def test_step_timeout_returns_error_instead_of_hanging(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE.replace("concurrency: 2", "concurrency: 6\n    timeout: 0.2"), encoding='utf-8')
+    engine = _engine(tmp_path, StuckLLMProcessor())
+    result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+    assert result['success'], result.get('error')
+    answers = result['pipeline_results']['fan_out']
+    assert [a['success'] for a in answers] == [True, True, False, False, False, False]
+    assert 'timed out after 0.2s' in answers[2]['error']
+
+
+def test_guard_raises_on_cancel_from_another_thread():
+    async def scenario():
+        token = CancelToken()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, lambda: loop.run_in_executor(None, token.cancel, "stop"))
+        try:
+            await token.guard(asyncio.sleep(30))
+        except RunCancelled as e:
+            return e.reason
+    assert asyncio.run(scenario()) == "stop"
+
+
+def test_service_cancels_running_and_queued_jobs(tmp_path):
+    prompts = tmp_path / "prompts"
+    prompts.mkdir()
+    (prompts / "fan.yaml").write_text(PIPELINE, encoding='utf-8')
+    service = PipelineService(_engine(tmp_path, StuckLLMProcessor()), workers=1, prompts_dir=str(prompts))
+    service.start()
+    try:
+        running = service.submit('fan')
+        queued = service.submit('fan')
+        for _ in range(100):
+            if running.status == 'running':
+                break
+            time.sleep(0.02)
+        assert service.cancel(queued.job_id).status == 'cancelled'
+        service.cancel(running.job_id)
+        for _ in range(100):
+            if running.status != 'running':
+                break
+            time.sleep(0.05)
+        assert running.status == 'cancelled'
+        assert running.to_dict()['error'] == f"job {running.job_id} cancelled"
+        assert any('partial_results_' in name for name in running.to_dict()['output_files'])
+        assert queued.started is None
+    finally:
+        service.stop()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from core.prompt_engine import PromptEngine
+
+
+class FakeLLMProcessor:
+    """Stand-in for LLMProcessor that sleeps instead of calling ollama"""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+
+    async def process_prompt(self, prompt, timeout=120, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if 'boom' in prompt:
+                raise RuntimeError("model crashed")
+            return {'raw_response': prompt, 'success': True}
+        finally:
+            self.in_flight -= 1
+
+
+def _steps(concurrency):
+    return [
+        {'name': 'make_items', 'type': 'python', 'code': "result = ['a', 'boom', 'c', 'd', 'e', 'f']"},
+        {
+            'name': 'fan_out',
+            'type': 'llm',
+            'dependencies': ['make_items'],
+            'foreach': "dep_make_items",
+            'input': 'Process: {{item}}',
+            'concurrency': concurrency,
+        },
+    ]
+
+
+def test_foreach_keeps_order_and_isolates_failures():
+    engine = PromptEngine(max_foreach_concurrency=8)
+    engine.llm_processor = FakeLLMProcessor()
+    started = time.perf_counter()
+    results = asyncio.run(engine._execute_pipeline(_steps(6), {}))
+    elapsed = time.perf_counter() - started
+
+    fan_out = results['fan_out']
+    assert [r.get('raw_response') for r in fan_out] == [
+        'Process: a', None, 'Process: c', 'Process: d', 'Process: e', 'Process: f'
+    ]
+    assert fan_out[1] == {'error': 'model crashed', 'success': False}
+    assert elapsed < 0.4
+
+
+def test_step_concurrency_is_clamped_to_global_cap():
+    engine = PromptEngine(max_foreach_concurrency=2)
+    engine.llm_processor = FakeLLMProcessor(delay=0.05)
+    asyncio.run(engine._execute_pipeline(_steps(6), {}))
+    assert engine.llm_processor.peak == 2
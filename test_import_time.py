@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+import core
+from bench_import_time import ROOT, measure
+
+
+def test_engine_import_leaves_heavy_dependencies_unloaded():
+    for module in ('core.prompt_engine', 'main'):
+        assert measure(module, runs=1)['heavy_modules'] == []
+
+
+def test_core_package_imports_lazily():
+    probe = ("import sys, core\n"
+             "assert 'core.prompt_engine' not in sys.modules\n"
+             "core.PromptEngine\n"
+             "assert 'core.prompt_engine' in sys.modules\n")
+    subprocess.run([sys.executable, '-c', probe], cwd=ROOT, check=True)
+    assert core.LLMProcessor.__name__ == 'LLMProcessor'
+    assert set(core.__all__) <= set(dir(core))
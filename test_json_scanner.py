@@ -0,0 +1,82 @@
+from bench_json_extract import measure, scaling
+from core.json_scanner import JSONStreamScanner, extract_all_json, extract_json
+from core.llm_processor import LLMProcessor
+from core.prompt_engine import PromptEngine
+
+
+def _feed(text, size, expect=None):
+    scanner = JSONStreamScanner(expect)
+    for i in range(0, len(text), size):
+        if scanner.feed(text[i:i + size]):
+            break
+    return scanner
+
+
+def test_stream_scanner_finds_the_first_value_however_the_text_is_split():
+    text = 'Sure! ```json\n{"a": "x}]\\"{", "b": [1, {"c": null}]}\n``` and then more {"d": 1}'
+    for size in (1, 3, 7, len(text)):
+        scanner = _feed(text, size)
+        assert scanner.complete
+        assert scanner.value == {"a": 'x}]"{', "b": [1, {"c": None}]}
+        assert text[scanner.start:scanner.end].endswith('}]}')
+
+
+def test_stream_scanner_skips_candidates_that_do_not_parse():
+    scanner = _feed('see {section 2} or [a, b]: ["ok", 2]', 4)
+    assert scanner.value == ["ok", 2]
+    assert not _feed('{"open": [1, 2}', 1).complete
+
+
+def test_stream_scanner_filters_candidates_like_iter_json_and_can_expect_an_object():
+    text = 'Per {section 2} and see [1] below:\n{"relevant": true, "refs": [1, {"a": []}]} trailing [2]'
+    for size in (1, 2, 5, len(text)):
+        # "{section 2}" is not a candidate even when "{" and "s" arrive in different pieces
+        assert _feed(text, size).value == [1]
+        scanner = _feed(text, size, expect='object')
+        assert scanner.value == {"relevant": True, "refs": [1, {"a": []}]} == extract_json(text)
+        assert text[scanner.start] == '{' and text[scanner.end - 1] == '}'
+    assert _feed('{ "a": {"b": 1}}', 1).value == {"a": {"b": 1}}
+
+
+def test_extract_json_repairs_fences_trailing_commas_and_truncation():
+    assert extract_json('```json\n{"a": [1, 2,], "b": {"c": "x",},}\n```') == {"a": [1, 2], "b": {"c": "x"}}
+    assert extract_json('{"a": "q\\"}", "b": [1, {"c": "x\ny"}, "cut') == {"a": 'q"}', "b": [1, {"c": "x\ny"}]}
+    assert extract_json('{"a": 1, "b": tr') == {"a": 1}
+    assert extract_json('{"k": 12') == {"k": 12}
+    assert extract_json('no json here, {just prose}') is None
+    assert extract_json('42') is None
+
+
+def test_extract_all_json_returns_every_value_and_extract_json_the_largest():
+    text = 'First {"a": 1}, see [1] and {section 2}, then ```\n{"big": {"x": [1, 2, 3]}}\n```'
+    assert extract_all_json(text) == [{"a": 1}, [1], {"big": {"x": [1, 2, 3]}}]
+    assert extract_json(text) == {"big": {"x": [1, 2, 3]}}
+
+
+def test_broken_candidates_are_skipped_without_rescanning_and_deep_nesting_does_not_raise():
+    # Complete values inside a broken one are still found; the broken part is not scanned again
+    assert extract_all_json('[1, {"a": 1}, {"b": [2}, {"c": 3}]') == [{"a": 1}, {"c": 3}]
+    assert extract_json('{"a": [1, 2, 3}, ' * 50 + '{"ok": [1,]}') == {"ok": [1]}
+    assert extract_json('[' * 5000) is None
+    assert extract_json('{"a": ' * 5000 + '1' + '}' * 5000) is None
+    assert str(extract_json('x ' + '{"a": ' * 100 + '1, ' + '}' * 100)).count('{') == 100
+
+
+def test_engine_and_processor_use_the_shared_extractor(tmp_path):
+    engine = PromptEngine(outputs_dir=str(tmp_path), interactive=False)
+    assert engine._extract_and_fix_json_from_raw_response('```json\n[{"row": 1},]\n```') == [{"row": 1}]
+    processor = LLMProcessor(model="fake")
+    assert processor._extract_json_from_response('Answer: {"relevant": true,}') == {"relevant": True}
+    assert processor._extract_json_from_response('nothing') == {"message": "nothing"}
+
+
+def test_benchmark_recovers_every_record_of_a_truncated_response():
+    result = measure(200, runs=1)
+    assert result['results']['extract_json']['records'] == 200
+    assert measure(200, runs=1, well_formed=True)['results']['extract_json']['records'] == 200
+
+
+def test_benchmark_scan_time_grows_linearly_on_broken_input():
+    # Four times the input: about 4x the time when linear, 16x when quadratic
+    for name, stats in scaling(repeats=2000, factor=4).items():
+        assert stats['ratio'] < 9, (name, stats)
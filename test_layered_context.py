@@ -0,0 +1,32 @@
+import asyncio
+
+from core.layered_context import LayeredContext
+from core.prompt_engine import PromptEngine
+
+
+def test_writes_stay_in_top_layer_and_are_tracked():
+    shared = {'inputs': {'name': 'tender'}, 'big': list(range(1000))}
+    view = LayeredContext({}, {'dep_a': 1}, shared)
+    view['faiss_processor_db'] = 'processor'
+    view.setdefault('counter', 0)
+
+    assert view['big'] is shared['big']
+    assert view['dep_a'] == 1
+    assert 'faiss_processor_db' not in shared
+    assert view.writes() == {'faiss_processor_db': 'processor', 'counter': 0}
+
+
+def test_python_step_merges_only_written_keys():
+    engine = PromptEngine()
+    marker = object()
+    context = {'inputs': {}, 'untouched': marker}
+    steps = [
+        {'name': 'writer', 'type': 'python', 'code': "context['rag_path'] = 'index.idx'\nresult = 1"},
+        {'name': 'reader', 'type': 'python', 'code': "result = context['rag_path'] + '!'"},
+    ]
+    results = asyncio.run(engine._execute_pipeline(steps, context))
+    assert results == {'writer': 1, 'reader': 'index.idx!'}
+    assert context['rag_path'] == 'index.idx'
+    assert context['untouched'] is marker
+    # Step-local keys never leak into the shared context
+    assert 'step_results' not in context and not any(k.startswith('dep_') for k in context)
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from core.llm_cache import LLMResponseCache, normalize_prompt
+from core.llm_processor import LLMProcessor
+from core.prompt_engine import PromptEngine
+
+
+class CountingLLMProcessor(LLMProcessor):
+    def __init__(self, cache):
+        super().__init__(model="counting")
+        self.response_cache = cache
+        self.calls = []
+
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        self.calls.append(prompt)
+        return {'raw_response': prompt.upper(), 'success': not prompt.startswith('fail')}
+
+
+PIPELINE = """
+name: "llm_cache_test"
+processing_steps:
+  - name: "make_items"
+    type: python
+    code: "result = ['pump', 'valve', 'pump']"
+  - name: "describe"
+    type: llm
+    dependencies: [make_items]
+    foreach: dep_make_items
+    input: "Describe {{ item }}"
+  - name: "fresh"
+    type: llm
+    cache: false
+    dependencies: [make_items]
+    input: "Count {{ dep_make_items | length }}"
+"""
+
+
+def test_repeated_prompts_are_answered_from_the_cache(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite"))
+    processor = CountingLLMProcessor(cache)
+
+    async def scenario():
+        first = await processor.process_prompt("Describe  pump\n")
+        again = await processor.process_prompt("Describe pump")
+        other_mode = await processor.process_prompt("Describe pump", breakdown=True)
+        failed = [await processor.process_prompt("fail"), await processor.process_prompt("fail")]
+        return first, again, other_mode, failed
+
+    first, again, other_mode, failed = asyncio.run(scenario())
+    # A cache hit makes no request, so it carries no request metrics
+    assert again == {**{k: v for k, v in first.items() if k != 'metrics'}, 'cached': True}
+    assert not other_mode.get('cached')
+    assert processor.calls == ["Describe  pump\n", "Describe pump", "fail", "fail"]
+    assert cache.stats()['hits'] == 1 and cache.stats()['entries'] == 2
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite"), ttl=0.05)
+    key = cache.key("m", "prompt", {})
+    cache.put(key, {'raw_response': 'x', 'success': True})
+    assert cache.get(key) is not None
+    time.sleep(0.1)
+    assert cache.get(key) is None and len(cache.store) == 0
+
+
+def test_normalize_prompt_ignores_layout_only():
+    assert normalize_prompt("  a  b \n\n\n\nc\t\td  ") == "a b\n\nc d"
+    assert normalize_prompt("A b") != normalize_prompt("a b")
+
+
+def test_pipeline_steps_share_cache_unless_cache_false(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    engine.llm_processor = CountingLLMProcessor(LLMResponseCache(str(tmp_path / "llm.sqlite")))
+
+    for _ in range(2):
+        result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+        assert result['success'], result.get('error')
+    calls = engine.llm_processor.calls
+    # 'Describe pump' is asked once ever; the cache: false step is asked on every run
+    assert sorted(calls) == ['Count 3', 'Count 3', 'Describe pump', 'Describe valve']
+    assert result['metrics']['llm_cache']['hits'] == 4
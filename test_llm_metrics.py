@@ -0,0 +1,81 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from core.llm_metrics import LLMUsage, call_metrics
+from core.llm_processor import LLMProcessor
+from core.perf_history import PerfHistory
+from core.prompt_engine import PromptEngine
+
+
+def test_call_metrics_and_usage_rates():
+    usage = {'prompt_tokens': 800, 'completion_tokens': 100, 'prompt_seconds': 0.4, 'decode_seconds': 2.0,
+             'load_seconds': 3.0, 'total_seconds': 5.5}
+    metrics = call_metrics("m", usage, request_seconds=6.0, slot_wait_seconds=1.0)
+    # Half a second of the request is unaccounted for by the server, plus a second waiting for a slot
+    assert metrics['queue_seconds'] == 1.5 and metrics['load_seconds'] == 3.0
+
+    totals = LLMUsage()
+    totals.add(metrics)
+    # A stream closed early has no server timings: counted, but not in the rates
+    totals.add(call_metrics("m", {'completion_tokens': 40}, request_seconds=1.0))
+    other = LLMUsage()
+    other.add(call_metrics("m", {**usage, 'load_seconds': 0.001}, request_seconds=5.5))
+    totals.merge(other)
+    summary = totals.as_dict()
+    assert summary['calls'] == 3 and summary['completion_tokens'] == 240
+    assert summary['prompt_tps'] == 2000.0 and summary['generation_tps'] == 50.0
+    assert summary['model_loads'] == 1 and summary['queue_seconds'] == 1.5
+
+
+PIPELINE = """
+name: "metrics_test"
+processing_steps:
+  - name: "make_items"
+    type: python
+    code: |
+      result = ['a', 'b', 'c']
+  - name: "ask"
+    type: llm
+    dependencies: [make_items]
+    foreach: dep_make_items
+    concurrency: 3
+    input: "{{ item }}"
+"""
+
+
+def test_run_metrics_trace_and_history_carry_ollama_timings(tmp_path):
+    pytest.importorskip("ollama")
+    from test_llm_processor import FakeOllama
+    fake = FakeOllama()
+    try:
+        pipeline = tmp_path / "pipeline.yaml"
+        pipeline.write_text(PIPELINE, encoding='utf-8')
+        engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+        engine.llm_processor = LLMProcessor(model="fake", host=fake.url)
+        engine.llm_processor.response_cache = None
+        engine.perf_history = PerfHistory(str(tmp_path / "perf.json"))
+
+        async def scenario():
+            try:
+                return await engine.run_prompt(str(pipeline), checkpoint=False, trace=True)
+            finally:
+                await engine.aclose()
+        result = asyncio.run(scenario())
+    finally:
+        fake.stop()
+    assert result['success'], result.get('error')
+    first = result['pipeline_results']['ask'][0]
+    assert first['metrics']['prompt_tokens'] == 10 and first['metrics']['decode_seconds'] > 0
+
+    step_usage = result['metrics']['steps']['ask']['llm']['fake']
+    assert step_usage == result['metrics']['llm_usage']['fake']
+    assert step_usage['calls'] == 3 and step_usage['prompt_tokens'] == 30
+    assert step_usage['prompt_tps'] == 1000.0 and step_usage['generation_tps'] == 100.0
+
+    summary = Path(result['trace_files'][1]).read_text(encoding='utf-8')
+    assert "Gen t/s" in summary and "1000.0" in summary
+    history = engine.perf_history.data['models']['fake']
+    assert history['prompt_tokens'] == 30 and history['timed_prefill_calls'] == 3
+    assert history['prompt_seconds'] == pytest.approx(0.03)
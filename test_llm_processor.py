@@ -0,0 +1,222 @@
+import asyncio
+import base64
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from core.llm_processor import LLMProcessor
+
+pytest.importorskip("ollama")
+
+
+class FakeOllama:
+    """Local stand-in for the Ollama /api/chat endpoint; answers after `delay` seconds.
+
+    Streamed requests get one word-sized token every `token_delay` seconds; `tokens_sent`
+    and `aborted` show whether the client hung up before the end. Final responses report 10
+    prompt tokens in 10ms and generated tokens at 100 tokens/s, like Ollama's timing fields. /api/tags lists `models`
+    and /api/ps `loaded`; when `models` is given, other models get a 404. Load and unload
+    requests (/api/generate without a prompt) are recorded in `loads`.
+    """
+
+    def __init__(self, delay=0.0, reply=lambda prompt: json.dumps({"answer": prompt.upper()}), token_delay=0.0,
+                 models=None, loaded=()):
+        self.models = models
+        self.loaded = list(loaded)
+        self.delay = delay
+        self.reply = reply
+        self.token_delay = token_delay
+        self.tokens_sent = 0
+        self.aborted = 0
+        self.requests = []
+        self.loads = []
+        self.client_ports = set()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                names = {'/api/tags': fake.models or [], '/api/ps': fake.loaded}.get(self.path)
+                if names is None:
+                    return self.reply_json(404, {"error": "not found"})
+                self.reply_json(200, {"models": [{"name": f"{name}:latest", "model": f"{name}:latest"}
+                                                 for name in names]})
+
+            def reply_json(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if fake.models is not None and body['model'] not in fake.models:
+                    return self.reply_json(404, {"error": f"model '{body['model']}' not found"})
+                if self.path == '/api/generate':
+                    fake.loads.append(body)
+                    return self.reply_json(200, {"model": body['model'], "created_at": "2024-01-01T00:00:00Z",
+                                                 "response": "", "done": True})
+                with fake._lock:
+                    fake.requests.append(body)
+                    fake.client_ports.add(self.client_address[1])
+                    fake.in_flight += 1
+                    fake.peak_in_flight = max(fake.peak_in_flight, fake.in_flight)
+                try:
+                    time.sleep(fake.delay)
+                    content = fake.reply(body['messages'][-1]['content'])
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+                if body.get('stream'):
+                    return self.stream(body, content)
+                payload = json.dumps({
+                    "model": body['model'], "created_at": "2024-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": content}, "done": True,
+                    **fake.timings(5),
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def stream(self, body, content):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                tokens = re.findall(r"\s*\S+", content)
+                chunks = [{"message": {"role": "assistant", "content": token}, "done": False} for token in tokens]
+                chunks.append({"message": {"role": "assistant", "content": ""}, "done": True,
+                               **fake.timings(len(tokens))})
+                try:
+                    for chunk in chunks:
+                        line = (json.dumps({"model": body['model'], "created_at": "2024-01-01T00:00:00Z", **chunk})
+                                + "\n").encode()
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                        self.wfile.flush()
+                        fake.tokens_sent += 1
+                        time.sleep(fake.token_delay)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    fake.aborted += 1
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def timings(self, eval_count):
+        """Ollama's counters and durations (ns) for an answer of eval_count tokens"""
+        prompt_ns, eval_ns, load_ns = 10_000_000, eval_count * 10_000_000, 1_000_000
+        return {"prompt_eval_count": 10, "prompt_eval_duration": prompt_ns, "eval_count": eval_count,
+                "eval_duration": eval_ns, "load_duration": load_ns,
+                "total_duration": int(self.delay * 1e9) + prompt_ns + eval_ns + load_ns}
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_ollama():
+    server = FakeOllama(delay=0.3)
+    yield server
+    server.stop()
+
+
+def test_concurrent_prompts_overlap_on_a_shared_connection_pool(fake_ollama):
+    processor = LLMProcessor(model="fake", host=fake_ollama.url)
+
+    async def scenario():
+        started = time.perf_counter()
+        first = await asyncio.gather(*(processor.process_prompt(f"item {i}", 5) for i in range(4)))
+        elapsed = time.perf_counter() - started
+        second = await asyncio.gather(*(processor.process_prompt(f"again {i}", 5) for i in range(4)))
+        await processor.aclose()
+        return first + second, elapsed
+
+    results, elapsed = asyncio.run(scenario())
+    assert all(r['success'] for r in results)
+    assert results[0]['parsed_result'] == {"answer": "ITEM 0"}
+    # Four 0.3s requests in flight together, not one after another
+    assert fake_ollama.peak_in_flight == 4 and elapsed < 0.9
+    # The second round reuses the kept-alive connections of the first
+    assert len(fake_ollama.client_ports) == 4
+
+
+def test_images_are_sent_with_the_message(fake_ollama):
+    fake_ollama.delay = 0
+    processor = LLMProcessor(model="vision", host=fake_ollama.url)
+    result = asyncio.run(processor.process_prompt("describe", 5, images=[b"\x89PNG"]))
+    assert result['success'], result.get('error')
+    message = fake_ollama.requests[0]['messages'][0]
+    assert base64.b64decode(message['images'][0]) == b"\x89PNG"
+    # Short prompt with the default 4096-token answer allowance: the 8192 bucket, not 32k
+    assert fake_ollama.requests[0]['options']['num_ctx'] == 8192
+
+
+def test_slow_server_times_out_at_the_step_timeout(fake_ollama):
+    fake_ollama.delay = 2
+    processor = LLMProcessor(model="fake", host=fake_ollama.url)
+    started = time.perf_counter()
+    result = asyncio.run(processor.process_prompt("slow", 0.2))
+    assert not result['success'] and 'timed out after 0.2s' in result['error']
+    assert time.perf_counter() - started < 1.5
+
+
+def test_streaming_stops_generation_once_the_json_answer_is_complete(fake_ollama):
+    rambling = " ".join(["Explanation"] * 100)
+    fake_ollama.delay = 0
+    fake_ollama.token_delay = 0.02
+    fake_ollama.reply = lambda prompt: '```json\n{"relevant": true, "why": "has {braces}"}\n```\n' + rambling
+    processor = LLMProcessor(model="fake", host=fake_ollama.url)
+
+    async def scenario():
+        started = time.perf_counter()
+        result = await processor.process_prompt("chunk", 10, stream=True)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.3)
+        await processor.aclose()
+        return result, elapsed
+
+    result, elapsed = asyncio.run(scenario())
+    assert result['success'], result.get('error')
+    assert result['parsed_result'] == {"relevant": True, "why": "has {braces}"}
+    # 100 rambling tokens would take 2s more
+    assert elapsed < 1.0 and fake_ollama.aborted == 1 and fake_ollama.tokens_sent < 30
+    usage = result['usage']
+    assert usage['stopped_early'] and usage['completion_tokens'] == 6
+    assert 0 < usage['ttft_seconds'] <= usage['json_seconds'] < 1.0
+
+
+def test_streaming_without_json_reads_the_whole_answer(fake_ollama):
+    fake_ollama.delay = 0
+    fake_ollama.reply = lambda prompt: "No structured answer [for] this one"
+    processor = LLMProcessor(model="fake", host=fake_ollama.url)
+    result = asyncio.run(processor.process_prompt("chunk", 10, stream=True))
+    assert result['raw_response'] == "No structured answer [for] this one"
+    assert not result['usage']['stopped_early'] and result['usage']['completion_tokens'] == 6
+    assert result['usage']['json_seconds'] is None
+
+
+def test_streaming_an_object_answer_passes_over_arrays_before_it(fake_ollama):
+    fake_ollama.delay = 0
+    fake_ollama.reply = lambda prompt: 'As in [1] and [2, 3]: {"relevant": true, "refs": [1]} Done. ' + "x " * 50
+    processor = LLMProcessor(model="fake", host=fake_ollama.url)
+    result = asyncio.run(processor.process_prompt("chunk", 10, stream='object'))
+    assert result['parsed_result'] == {"relevant": True, "refs": [1]}
+    assert result['usage']['stopped_early']
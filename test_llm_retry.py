@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+import pytest
+
+from core.llm_processor import LLMProcessor
+from core.llm_metrics import track_llm_calls
+from core.llm_retry import LatencyWindow, RetryPolicy
+from core.prompt_engine import PromptEngine
+
+
+def test_policy_from_step_keys_and_jittered_backoff():
+    policy = RetryPolicy.from_step({'name': 's', 'retry': {'attempts': 4, 'backoff': 2, 'max_backoff': 5,
+                                                           'on': ['timeout', 'invalid_json']},
+                                    'hedge': {'quantile': 0.9, 'min_samples': 3}})
+    assert policy.max_attempts == 4 and policy.retry_on == {'timeout', 'invalid_json'}
+    assert policy.hedge and policy.hedge_quantile == 0.9 and policy.name == 's'
+    for attempt, ceiling in ((1, 2), (2, 4), (3, 5), (6, 5)):
+        assert ceiling * (1 - policy.jitter) <= policy.delay(attempt) <= ceiling
+    assert RetryPolicy.from_step({'retry': False}).max_attempts == 1
+    assert RetryPolicy.from_step({'retry': 3}).max_attempts == 3
+    with pytest.raises(ValueError):
+        RetryPolicy.from_step({'retry': {'on': ['flaky']}})
+
+    window = LatencyWindow(size=20)
+    for i in range(40):
+        window.add(float(i))
+    assert len(window) == 20 and window.quantile(0.95) == 39.0
+    assert policy.hedge_after(window) == 38.0
+
+
+class ScriptedLLMProcessor(LLMProcessor):
+    """Answers each prompt from a script of outcomes: 'ok', an error class, or ('slow', seconds)"""
+
+    def __init__(self, script):
+        super().__init__(model="fake")
+        self.response_cache = None
+        self.script = script
+        self.calls = []
+
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        outcomes = self.script[prompt]
+        outcome = outcomes[min(len([p for p in self.calls if p == prompt]), len(outcomes) - 1)]
+        self.calls.append(prompt)
+        if isinstance(outcome, tuple):
+            await asyncio.sleep(outcome[1])
+            outcome = 'ok'
+        if outcome == 'ok':
+            return {'raw_response': '{"ok": true}', 'parsed_result': {"ok": True}, 'success': True}
+        return {'error': f"{outcome} failure", 'error_type': outcome, 'success': False}
+
+
+def _run(processor, prompt, policy, stats):
+    async def scenario():
+        with track_llm_calls(stats):
+            return await processor.process_prompt(prompt, 5, retry=policy)
+    return asyncio.run(scenario())
+
+
+def test_retryable_errors_are_retried_and_others_are_not():
+    processor = ScriptedLLMProcessor({'flaky': ['server', 'connection', 'ok'], 'bad': ['client', 'ok']})
+    policy = RetryPolicy(max_attempts=3, backoff=0.01, retry_on=('connection', 'server'))
+    stats = {}
+    result = _run(processor, 'flaky', policy, stats)
+    assert result['success'] and result['attempts'] == 3 and stats['llm_retries'] == 2
+    # Only the request that answered has usage to count
+    assert stats['llm_usage']['fake'].calls == 1
+
+    result = _run(processor, 'bad', policy, stats)
+    assert not result['success'] and result['error_type'] == 'client' and 'attempts' not in result
+    assert processor.calls.count('bad') == 1
+
+
+def test_a_call_slower_than_the_step_p95_is_hedged_and_the_first_answer_wins():
+    processor = ScriptedLLMProcessor({'hung': [('slow', 3), ('slow', 0.05)], 'quick': ['ok']})
+    policy = RetryPolicy(hedge=True, hedge_min_samples=5, name='step')
+    window = processor.latencies['step'] = LatencyWindow()
+    for _ in range(10):
+        window.add(0.1)
+    stats = {}
+    assert 'hedged' not in _run(processor, 'quick', policy, stats) and 'llm_hedges' not in stats
+
+    started = time.perf_counter()
+    result = _run(processor, 'hung', policy, stats)
+    assert result['success'] and result['hedged']
+    assert time.perf_counter() - started < 1
+    assert stats['llm_hedges'] == 1 and stats['llm_hedge_wins'] == 1
+    # The losing request was cancelled and gave its concurrency slot back
+    assert processor.limiter is None or processor.limiter.in_flight == 0
+
+
+PIPELINE = """
+name: "retry_test"
+processing_steps:
+  - name: "make_items"
+    type: python
+    code: |
+      result = ['a', 'b', 'c']
+  - name: "ask"
+    type: llm
+    dependencies: [make_items]
+    foreach: dep_make_items
+    concurrency: 3
+    retry:
+      attempts: 2
+      backoff: 0
+    input: "{{ item }}"
+"""
+
+
+def test_step_retry_policy_and_counts_in_run_metrics(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    engine.llm_processor = ScriptedLLMProcessor({'a': ['ok'], 'b': ['server', 'ok'], 'c': ['timeout', 'ok']})
+
+    result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+    assert result['success'], result.get('error')
+    a, b, c = result['pipeline_results']['ask']
+    assert a['success'] and b['success'] and b['attempts'] == 2
+    # Timeouts are not retried by default
+    assert not c['success'] and c['error_type'] == 'timeout'
+    assert result['metrics']['steps']['ask']['llm_retries'] == 1
+    assert result['metrics']['llm_retries'] == 1 and result['metrics']['llm_hedges'] == 0
+
+
+def test_hedged_request_goes_to_another_endpoint():
+    pytest.importorskip("ollama")
+    from core.llm_router import LLMRouter
+    from test_llm_processor import FakeOllama
+    slow, fast = FakeOllama(delay=3), FakeOllama(delay=0.05)
+    try:
+        router = LLMRouter([slow.url, fast.url], health_interval=0)
+        processor = LLMProcessor(model="fake", router=router)
+        processor.response_cache = None
+        window = processor.latencies['step'] = LatencyWindow()
+        for _ in range(10):
+            window.add(0.2)
+
+        async def scenario():
+            try:
+                return await processor.process_prompt("x", 10, retry=RetryPolicy(hedge=True, name='step'))
+            finally:
+                await processor.aclose()
+        started = time.perf_counter()
+        result = asyncio.run(scenario())
+        assert result['success'] and result['hedged']
+        assert time.perf_counter() - started < 1.5
+        assert len(slow.requests) == 1 and len(fast.requests) == 1
+        assert [e['outstanding'] for e in router.stats()] == [0, 0]
+    finally:
+        slow.stop()
+        fast.stop()
@@ -0,0 +1,174 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+from core.llm_processor import LLMProcessor
+from core.llm_retry import RetryPolicy, error_class
+from core.llm_router import LLMRouter, NoEndpointAvailable
+
+
+def test_least_outstanding_prefers_endpoints_with_the_model_loaded():
+    router = LLMRouter(["http://a", "http://b", "http://c"], health_interval=0)
+    a, b, c = router.endpoints
+    a.loaded = {"m"}
+    c.models = {"other"}
+    picked = [router.acquire("m") for _ in range(4)]
+    # b counts 2 extra until it has the model; c does not serve it at all
+    assert [e.url for e in picked] == ["http://a", "http://a", "http://a", "http://b"]
+    router.release(b, "m")
+    assert "m" in b.loaded and b.outstanding == 0
+
+
+def test_circuit_opens_after_repeated_failures_and_half_opens_after_cooldown():
+    router = LLMRouter(["http://a", "http://b"], failure_threshold=2, cooldown=0.1, health_interval=0)
+    a, b = router.endpoints
+    for _ in range(2):
+        router.release(router.acquire("m", exclude=[b]), "m", ok=False)
+    assert a.stats()['circuit'] == 'open'
+    assert router.acquire("m") is b
+    with pytest.raises(NoEndpointAvailable):
+        router.acquire("m", exclude=[b])
+    time.sleep(0.15)
+    trial = router.acquire("m", exclude=[b])
+    assert trial is a
+    # Only one trial request while half-open
+    with pytest.raises(NoEndpointAvailable):
+        router.acquire("m", exclude=[b])
+    router.release(trial, "m", ok=True)
+    assert a.stats()['circuit'] == 'closed'
+
+
+def _dead_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+@pytest.fixture
+def servers():
+    pytest.importorskip("ollama")
+    from test_llm_processor import FakeOllama
+    started = []
+
+    def start(**kwargs):
+        server = FakeOllama(**kwargs)
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.stop()
+
+
+def _processor(router):
+    processor = LLMProcessor(model="fake", router=router)
+    # Let the test decide how many requests are in flight
+    processor.limiter = None
+    return processor
+
+
+def _run(processor, prompts, timeout=5):
+    async def scenario():
+        try:
+            return await asyncio.gather(*(processor.process_prompt(prompt, timeout) for prompt in prompts))
+        finally:
+            await processor.aclose()
+    return asyncio.run(scenario())
+
+
+def test_fan_out_spreads_across_endpoints(servers):
+    fakes = [servers(delay=0.3, models=["fake"]) for _ in range(3)]
+    router = LLMRouter([fake.url for fake in fakes], health_interval=0)
+    started = time.perf_counter()
+    results = _run(_processor(router), [f"item {i}" for i in range(12)])
+    assert all(r['success'] for r in results)
+    assert [len(fake.requests) for fake in fakes] == [4, 4, 4]
+    assert time.perf_counter() - started < 0.9
+
+
+def test_dead_endpoint_fails_over_and_opens_its_circuit(servers):
+    live = servers(models=["fake"])
+    router = LLMRouter([_dead_url(), live.url], failure_threshold=1, cooldown=60, health_interval=0)
+    processor = _processor(router)
+    results = [_run(processor, [f"item {i}"])[0] for i in range(5)]
+    assert all(r['success'] for r in results)
+    dead, alive = router.stats()
+    assert dead['errors'] == 1 and dead['circuit'] == 'open'
+    assert alive['completed'] == 5 and len(live.requests) == 5
+
+
+def test_health_checks_route_a_model_to_endpoints_serving_it(servers):
+    without = servers(models=["other"])
+    with_model = servers(models=["fake", "other"], loaded=["fake"])
+    router = LLMRouter([without.url, with_model.url], health_interval=0)
+    asyncio.run(router.check_health())
+    assert router.endpoints[1].loaded == {"fake", "fake:latest"}
+    _run(_processor(router), ["a", "b", "c"])
+    assert len(with_model.requests) == 3 and not without.requests
+
+
+def test_endpoint_answering_404_is_dropped_for_the_model(servers):
+    without = servers(models=["other"])
+    with_model = servers(models=["fake"])
+    router = LLMRouter([without.url, with_model.url], health_interval=0)
+    processor = _processor(router)
+    assert all(r['success'] for r in _run(processor, ["a"]) + _run(processor, ["b"]))
+    assert router.endpoints[0].models == set() and router.endpoints[0].errors == 0
+    assert len(with_model.requests) == 2
+
+
+def test_running_out_of_endpoints_is_a_retryable_connection_error():
+    pytest.importorskip("ollama")
+    assert error_class(NoEndpointAvailable("all down")) == 'connection'
+    router = LLMRouter([_dead_url()], failure_threshold=1, cooldown=60, health_interval=0)
+    processor = _processor(router)
+    policy = RetryPolicy(max_attempts=2, backoff=0)
+
+    async def scenario():
+        try:
+            return await processor.process_prompt("x", 5, retry=policy)
+        finally:
+            await processor.aclose()
+    result = asyncio.run(scenario())
+    # The endpoint's own error, not "no endpoint available", and retried once its circuit was open
+    assert result['error_type'] == 'connection' and result['attempts'] == 2
+    assert router.endpoints[0].errors == 1
+
+
+def test_a_cancelled_request_is_neither_a_success_nor_a_failure(servers):
+    slow = servers(delay=2, models=["fake"])
+    router = LLMRouter([slow.url], health_interval=0)
+    endpoint = router.endpoints[0]
+    endpoint.open_until = time.monotonic() - 1  # half-open: the next request is its trial
+    result = _run(_processor(router), ["x"], timeout=0.2)[0]
+    assert result['error_type'] == 'timeout'
+    assert endpoint.outstanding == 0 and endpoint.completed == 0 and endpoint.errors == 0
+    assert "fake" not in endpoint.loaded and endpoint.stats()['circuit'] == 'open'
+    assert not endpoint.trial_in_flight
+
+
+def test_health_checks_run_again_on_a_later_event_loop(servers):
+    fake = servers(models=["fake"])
+    router = LLMRouter([fake.url], health_interval=0.01)
+
+    async def reserve():
+        router.release(router.acquire("fake"), "fake")
+
+    # The first loop stops before its health check gets to run
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(reserve())
+    stale = router._health_task
+    time.sleep(0.02)
+
+    async def later():
+        await reserve()
+        await router._health_task
+
+    try:
+        asyncio.run(later())
+        assert router._health_task is not stale and router.endpoints[0].models == {"fake", "fake:latest"}
+    finally:
+        loop.run_until_complete(stale)
+        loop.close()
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from core.llm_processor import LLMProcessor
+from core.prompt_engine import PromptEngine
+
+
+class LoggingLLMProcessor(LLMProcessor):
+    """Records loads, unloads and prompts (with the keep-alive they were sent with) in a shared log"""
+
+    def __init__(self, model, log):
+        super().__init__(model=model)
+        self.response_cache = None
+        self.log = log
+
+    async def load(self, keep_alive=None):
+        self.log.append(('unload' if keep_alive == 0 else 'load', self.model, keep_alive))
+        return {'model': self.model, 'success': True, 'seconds': 0.0}
+
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        self.log.append(('prompt', self.model, self.keep_alive))
+        await asyncio.sleep(0.05)
+        return {'raw_response': '{"ok": true}', 'parsed_result': {"ok": True}, 'success': True}
+
+
+PIPELINE = """
+name: "models_test"
+processing_steps:
+  - name: "describe"
+    type: llm
+    input: "describe"
+  - name: "look"
+    type: llm
+    model: "vision"
+    input: "look"
+  - name: "summarise"
+    type: llm
+    input: "summarise"
+"""
+
+
+def test_run_preloads_its_models_and_groups_steps_by_model(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    log = []
+    engine.llm_processor = LoggingLLMProcessor("text", log)
+    engine._llm_processors['vision'] = vision = LoggingLLMProcessor("vision", log)
+
+    result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+    assert result['success'], result.get('error')
+    # Both models load in parallel before any prompt, kept loaded while the run needs them
+    assert set(log[:2]) == {('load', 'text', '30m'), ('load', 'vision', '30m')}
+    # Both text steps run before the vision step; text is unloaded once it has no steps left
+    assert log[2:] == [('prompt', 'text', '30m'), ('prompt', 'text', '30m'), ('unload', 'text', 0),
+                       ('prompt', 'vision', '30m')]
+    assert vision.keep_alive is None and engine.llm_processor.keep_alive is None
+    metrics = result['metrics']
+    assert metrics['model_switches'] == 1
+    assert metrics['models']['text']['steps'] == 2 and metrics['models']['vision']['preload']['success']
+
+
+def test_load_and_keep_alive_reach_the_server():
+    pytest.importorskip("ollama")
+    from test_llm_processor import FakeOllama
+    fake = FakeOllama()
+    try:
+        processor = LLMProcessor(model="fake", host=fake.url)
+        processor.keep_alive = "30m"
+
+        async def scenario():
+            try:
+                loaded = await processor.load("30m")
+                answer = await processor.process_prompt("hi", 5)
+                return loaded, answer, await processor.unload()
+            finally:
+                await processor.aclose()
+        loaded, answer, unloaded = asyncio.run(scenario())
+        assert loaded['success'] and answer['success'] and unloaded['success']
+        assert [(load['model'], load['keep_alive']) for load in fake.loads] == [("fake", "30m"), ("fake", 0)]
+        assert fake.requests[0]['keep_alive'] == "30m"
+    finally:
+        fake.stop()
@@ -0,0 +1,84 @@
+import asyncio
+from pathlib import Path
+
+import yaml
+
+from core.pipeline_scheduler import PipelineScheduler
+
+
+def test_oneshot_graph_frees_independent_steps():
+    config = yaml.safe_load(Path("prompts/oneshot.yaml").read_text(encoding="utf-8"))
+    graph = PipelineScheduler(config['processing_steps']).graph
+    # Neither injection step waits behind the LLM fan-outs
+    assert graph['inject_pdf_faiss_index'] == set()
+    # ...but the FAISS processor still sees the PDF paths written by the injection step
+    assert graph['inject_faiss_processor'] == {'inject_pdf_faiss_index'}
+    assert 'inject_faiss_processor' in graph['faiss_semantic_search_by_clause']
+
+
+def test_ready_steps_run_concurrently_and_report_critical_path():
+    steps = [
+        {'name': 'a', 'type': 'llm'},
+        {'name': 'b', 'type': 'llm'},
+        {'name': 'c', 'type': 'python', 'dependencies': ['a'], 'code': "result = 1"},
+    ]
+    delays = {'a': 0.2, 'b': 0.2, 'c': 0.1}
+
+    async def run_step(step):
+        await asyncio.sleep(delays[step['name']])
+        return step['name'].upper()
+
+    scheduler = PipelineScheduler(steps)
+    results = asyncio.run(scheduler.run(run_step))
+
+    assert list(results) == ['a', 'b', 'c']
+    assert results == {'a': 'A', 'b': 'B', 'c': 'C'}
+    a, b, c = (scheduler.metrics[name] for name in 'abc')
+    # a and b ran at the same time; c waited for a
+    assert b['start'] < a['end'] and a['start'] < b['end']
+    assert c['start'] >= a['end']
+    path, path_time = scheduler.critical_path()
+    assert path == ['a', 'c']
+    assert path_time >= 0.3
+
+
+def test_sequential_mode_and_cycle_detection():
+    steps = [{'name': 'a'}, {'name': 'b'}]
+    assert PipelineScheduler(steps, mode="sequential").graph['b'] == {'a'}
+
+    cyclic = [{'name': 'a', 'dependencies': ['b']}, {'name': 'b', 'dependencies': ['a']}]
+    try:
+        PipelineScheduler(cyclic)
+    except ValueError as e:
+        assert "Cyclic" in str(e)
+    else:
+        raise AssertionError("cycle was not detected")
+
+
+def test_model_affinity_groups_ready_steps_by_model():
+    steps = [
+        {'name': 'a', 'type': 'llm'},
+        {'name': 'b', 'type': 'llm'},
+        {'name': 'c', 'type': 'llm'},
+        {'name': 'd', 'type': 'python', 'code': "result = 1"},
+    ]
+    models = {'a': 'text', 'b': 'vision', 'c': 'text'}
+    running, batches = set(), []
+
+    async def run_step(step):
+        running.add(step['name'])
+        batches.append(set(running))
+        await asyncio.sleep(0.05)
+        running.discard(step['name'])
+
+    scheduler = PipelineScheduler(steps, step_models=models)
+    asyncio.run(scheduler.run(run_step))
+    # The text steps and the model-free step run together; the vision step waits for them
+    assert batches[:3] == [{'a'}, {'a', 'c'}, {'a', 'c', 'd'}] and batches[3] == {'b'}
+    assert scheduler.model_switches == 1 and scheduler.summary()['model_switches'] == 1
+
+    unordered = PipelineScheduler(steps)
+    running.clear()
+    batches.clear()
+    asyncio.run(unordered.run(run_step))
+    assert batches[-1] == {'a', 'b', 'c', 'd'}
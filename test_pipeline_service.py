@@ -0,0 +1,86 @@
+import base64
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from core.pipeline_service import PipelineService, create_server
+from core.prompt_engine import PromptEngine
+from test_batch_runner import PIPELINE, EchoLLMProcessor
+
+
+def _request(url, payload=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        body = response.read()
+        return response.status, json.loads(body) if response.headers['Content-Type'] == 'application/json' else body
+
+
+@pytest.fixture
+def service_url(tmp_path):
+    prompts = tmp_path / "prompts"
+    prompts.mkdir()
+    (prompts / "summary.yaml").write_text(PIPELINE, encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"))
+    engine.llm_processor = EchoLLMProcessor()
+    service = PipelineService(engine, workers=2, prompts_dir=str(prompts))
+    service.start()
+    server = create_server(service, '127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+    service.stop()
+
+
+def _wait_for(url, job_id):
+    for _ in range(100):
+        _, job = _request(f"{url}/jobs/{job_id}")
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_submit_poll_and_fetch_outputs(service_url):
+    status, job = _request(f"{service_url}/jobs", {
+        'prompt': 'summary',
+        'inputs': {'label': 'switchgear'},
+        'files': {'tender': {'filename': 'tender.txt',
+                             'content_base64': base64.b64encode(b'tender text').decode()}},
+    })
+    assert status == 202 and job['status'] in ('queued', 'running')
+
+    job = _wait_for(service_url, job['job_id'])
+    assert job['status'] == 'succeeded', job['error']
+    _, outputs = _request(f"{service_url}/jobs/{job['job_id']}/outputs")
+    assert len(outputs) == 1
+    _, content = _request(f"{service_url}/jobs/{job['job_id']}/outputs/{outputs[0]}")
+    assert content == b"Summarize switchgear: tender text"
+
+    _, health = _request(f"{service_url}/health")
+    assert health['status'] == 'ok' and health['workers'] == 2
+
+
+def test_failed_job_and_unknown_prompt(service_url):
+    _, job = _request(f"{service_url}/jobs", {'prompt': 'summary'})
+    job = _wait_for(service_url, job['job_id'])
+    assert job['status'] == 'failed' and 'tender' in job['error']
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _request(f"{service_url}/jobs", {'prompt': '../secrets'})
+    assert error.value.code == 404
+
+
+@pytest.mark.parametrize("inputs", [{'checkpoint': False}, {'output_dir': '/tmp'}, {'nope': 'x'},
+                                    {'tender': '/etc/passwd'}])
+def test_undeclared_reserved_and_file_path_inputs_are_rejected(service_url, inputs):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _request(f"{service_url}/jobs", {'prompt': 'summary', 'inputs': inputs})
+    assert error.value.code == 400
+    _, jobs = _request(f"{service_url}/jobs")
+    assert jobs == []
@@ -0,0 +1,71 @@
+import asyncio
+import textwrap
+
+from core.prompt_engine import PromptEngine
+
+PIPELINE = textwrap.dedent("""
+    name: "Checkpoint test"
+    inputs:
+      - name: "analysis_file"
+        type: "file"
+    processing_steps:
+      - name: "chunk"
+        type: python
+        code: |
+          result = context['inputs']['analysis_file']['content'].split()
+      - name: "classify"
+        type: llm
+        dependencies: [chunk]
+        foreach: dep_chunk
+        input: "Classify {{item}}"
+      - name: "collect"
+        type: python
+        dependencies: [classify]
+        code: |
+          result = [r.get('raw_response') for r in context['dep_classify']]
+    outputs: []
+""")
+
+
+class FlakyLLMProcessor:
+    """Fails every prompt containing one of the given words"""
+
+    model = "fake-model"
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.prompts = []
+
+    async def process_prompt(self, prompt, timeout=120, **kwargs):
+        self.prompts.append(prompt)
+        if any(word in prompt for word in self.failing):
+            return {'error': 'connection refused', 'success': False}
+        return {'raw_response': prompt.lower(), 'success': True}
+
+
+def test_resume_reruns_only_unfinished_items(tmp_path):
+    config_path = tmp_path / "pipeline.yaml"
+    config_path.write_text(PIPELINE, encoding="utf-8")
+    input_path = tmp_path / "tender.txt"
+    input_path.write_text("alpha beta gamma", encoding="utf-8")
+
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"))
+    engine.llm_processor = FlakyLLMProcessor(failing={'gamma'})
+    first = asyncio.run(engine.run_prompt(str(config_path), analysis_file=str(input_path)))
+    run_id = first['run_id']
+    assert (tmp_path / "outputs" / "runs" / run_id / "manifest.json").exists()
+    assert first['pipeline_results']['collect'] == ['classify alpha', 'classify beta', None]
+
+    engine.llm_processor = FlakyLLMProcessor()
+    resumed = asyncio.run(engine.run_prompt(resume=run_id))
+    assert resumed['success']
+    assert engine.llm_processor.prompts == ['Classify gamma']
+    assert resumed['metrics']['resumed_steps'] == ['chunk']
+    assert resumed['pipeline_results']['collect'] == ['classify alpha', 'classify beta', 'classify gamma']
+
+
+def test_resume_unknown_run_fails_cleanly(tmp_path):
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"))
+    result = asyncio.run(engine.run_prompt(resume="does_not_exist"))
+    assert not result['success']
+    assert "does_not_exist" in result['error']
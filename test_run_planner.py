@@ -0,0 +1,136 @@
+import asyncio
+
+from core.perf_history import PerfHistory
+from core.prompt_engine import PromptEngine
+from core.run_planner import RunPlanner
+from core.token_budget import TokenBudget
+
+PIPELINE = """
+name: "plan_test"
+inputs:
+  - name: "tender"
+    type: "file"
+    required: true
+processing_steps:
+  - name: "chunk_tender"
+    type: python
+    code: |
+      text = context['inputs']['tender']['content']
+      chunks = []
+      for start in range(0, len(text), 400):
+          chunks.append(text[start:start + 400])
+      result = {'chunks': chunks}
+  - name: "select_chunks"
+    type: llm
+    dependencies: [chunk_tender]
+    foreach: dep_chunk_tender['chunks']
+    concurrency: 2
+    input: "Is this relevant? {{ item }}"
+  - name: "keep_relevant"
+    type: python
+    dependencies: [select_chunks]
+    code: |
+      result = []
+      for answer in context['dep_select_chunks']:
+          if answer.get('relevant'):
+              result.append(answer)
+  - name: "extract"
+    type: llm
+    dependencies: [keep_relevant]
+    foreach: dep_keep_relevant
+    input: "Extract requirements: {{ item }}"
+"""
+
+
+class ForbiddenLLMProcessor:
+    model = "planner-test-model"
+
+    async def process_prompt(self, *args, **kwargs):
+        raise AssertionError("a dry run must not call the model")
+
+
+def _engine(tmp_path, history):
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    engine.llm_processor = ForbiddenLLMProcessor()
+    engine.perf_history = history
+    return engine
+
+
+def test_plan_dry_runs_cheap_steps_and_estimates_llm_steps(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    tender = tmp_path / "tender.txt"
+    tender.write_text("x" * 2000, encoding='utf-8')
+    history = PerfHistory(str(tmp_path / "history.json"))
+    engine = _engine(tmp_path, history)
+
+    plan = asyncio.run(engine.plan_run(str(pipeline), tender=str(tender)))
+    steps = {est['name']: est for est in plan['steps']}
+
+    assert plan['inputs'] == {'tender': {'estimated_tokens': 500}}
+    assert steps['chunk_tender']['basis'] == 'dry run'
+    select = steps['select_chunks']
+    assert select['calls'] == 5 and select['basis'] == 'dry run' and select['concurrency'] == 2
+    assert select['prompt_tokens'] >= 5 * 100
+    extract = steps['extract']
+    assert extract['calls'] == 5 and extract['basis'] == 'upper bound from keep_relevant'
+    assert steps['keep_relevant']['seconds'] is None
+    assert plan['llm_calls'] == 10
+    assert plan['critical_path'] == ['chunk_tender', 'select_chunks', 'keep_relevant', 'extract']
+    assert plan['throughput']['source'] == 'defaults'
+    assert "Expected wall time" in RunPlanner.format_plan(plan)
+
+
+def test_plan_uses_recorded_throughput(tmp_path):
+    history = PerfHistory(str(tmp_path / "history.json"))
+    for _ in range(4):
+        # 400 prompt tokens at the default 400 tok/s prefill leave 2s of decoding for 100 tokens
+        history.record_call("planner-test-model", "select_chunks", "pipeline", 400, 100, 3.0)
+    history.record_step("pipeline", "keep_relevant", 0.5)
+    history.save()
+
+    reloaded = PerfHistory(str(tmp_path / "history.json"))
+    rates = reloaded.model_rates("planner-test-model", 400, 20)
+    assert rates['calls'] == 4 and round(rates['decode_tps']) == 50
+    assert reloaded.step_stats("pipeline", "keep_relevant")['seconds'] == 0.5
+    assert reloaded.step_stats("pipeline", "select_chunks")['completion_tokens_per_call'] == 100
+
+
+OVERFLOW_PIPELINE = """
+name: "overflow_test"
+processing_steps:
+  - name: "make_items"
+    type: python
+    code: |
+      result = ['short item', 'word ' * 1500]
+  - name: "ask"
+    type: llm
+    dependencies: [make_items]
+    foreach: dep_make_items
+    max_tokens: 200
+    input: "Answer: {{ item }}"
+  - name: "ask_split"
+    type: llm
+    dependencies: [make_items]
+    foreach: dep_make_items
+    max_tokens: 200
+    overflow: split
+    input: "Answer: {{ item }}"
+"""
+
+
+def test_plan_counts_and_sizes_prompts_with_the_processor_budget(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(OVERFLOW_PIPELINE, encoding='utf-8')
+    engine = _engine(tmp_path, PerfHistory(str(tmp_path / "history.json")))
+    budget = engine.llm_processor.budget = TokenBudget(buckets=(512, 2048), template_tokens=10)
+
+    plan = asyncio.run(engine.plan_run(str(pipeline)))
+    steps = {est['name']: est for est in plan['steps']}
+    ask, split = steps['ask'], steps['ask_split']
+    # The long item does not fit 2048 tokens: refused, as the run would refuse it
+    assert ask['calls'] == 1 and ask['too_large'] == 1 and ask['num_ctx'] == 512
+    assert ask['prompt_tokens'] == budget.count("Answer: short item") + budget.count("Answer: " + 'word ' * 1500)
+    # ... or run in parts that each fit the largest window
+    assert split['calls'] >= 3 and split['too_large'] == 0 and split['num_ctx'] == 2048
+    assert "Prompts too large for the context window: ask (1)" in RunPlanner.format_plan(plan)
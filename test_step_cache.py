@@ -0,0 +1,95 @@
+import asyncio
+
+from core.prompt_engine import PromptEngine
+from core.step_cache import StepResultCache, SQLiteLRUStore
+
+
+class CountingLLMProcessor:
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def process_prompt(self, prompt, timeout=120, **kwargs):
+        self.calls += 1
+        return {'raw_response': prompt.upper(), 'success': True}
+
+
+def _steps(report_code):
+    return [
+        {'name': 'chunk', 'type': 'python', 'code': "context['chunk_count'] = 2\nresult = ['x', 'y']"},
+        {'name': 'classify', 'type': 'llm', 'dependencies': ['chunk'], 'foreach': "dep_chunk", 'input': '{{item}}'},
+        {'name': 'report', 'type': 'python', 'dependencies': ['classify'], 'code': report_code},
+    ]
+
+
+def _run(engine, steps, cache):
+    context = {'inputs': {'analysis_file': {'content': 'tender text'}}}
+    results = asyncio.run(engine._execute_pipeline(steps, context, step_cache=cache))
+    return results, context
+
+
+def test_rerun_after_editing_last_step_replays_upstream(tmp_path):
+    cache = StepResultCache(str(tmp_path / "steps.sqlite"))
+    engine = PromptEngine()
+    engine.llm_processor = CountingLLMProcessor()
+
+    first, _ = _run(engine, _steps("result = len(context['dep_classify'])"), cache)
+    assert engine.llm_processor.calls == 2
+
+    second, context = _run(engine, _steps("result = context['chunk_count'] * 10"), cache)
+    assert engine.llm_processor.calls == 2
+    assert second['classify'] == first['classify']
+    assert second['report'] == 20
+    assert context['pipeline_metrics']['cached_steps'] == ['chunk', 'classify']
+
+
+def test_run_models_do_not_change_the_step_definition_or_its_key(tmp_path):
+    cache = StepResultCache(str(tmp_path / "steps.sqlite"))
+    engine = PromptEngine()
+    engine.llm_processor = CountingLLMProcessor()
+    engine.llm_model = "other-model"
+    engine.embedding_model = "minilm-embedding"
+    # The same step dicts, as when a loaded config is run again
+    steps = _steps("result = len(context['dep_classify'])")
+
+    _run(engine, steps, cache)
+    assert all('llm_model' not in step and 'embedding_model' not in step for step in steps)
+    _, context = _run(engine, steps, cache)
+    assert engine.llm_processor.calls == 2
+    assert context['pipeline_metrics']['cached_steps'] == ['chunk', 'classify', 'report']
+
+
+def test_steps_changing_context_values_in_place_always_run(tmp_path):
+    cache = StepResultCache(str(tmp_path / "steps.sqlite"))
+    engine = PromptEngine()
+    steps = [
+        {'name': 'init', 'type': 'python', 'code': "context['log'] = []\nresult = 'ok'"},
+        {'name': 'record', 'type': 'python', 'dependencies': ['init'],
+         'code': "context['log'].append('seen')\nresult = 'ok'"},
+        {'name': 'report', 'type': 'python', 'dependencies': ['record'], 'cache': False,
+         'code': "result = list(context['log'])"},
+    ]
+
+    _run(engine, steps, cache)
+    second, context = _run(engine, steps, cache)
+    assert second['report'] == ['seen']
+    assert context['pipeline_metrics']['cached_steps'] == ['init']
+
+
+def test_failed_results_are_not_cached(tmp_path):
+    cache = StepResultCache(str(tmp_path / "steps.sqlite"))
+    assert not cache.is_cacheable({'success': False, 'error': 'boom'})
+    assert not cache.is_cacheable([{'success': True}, {'success': False}])
+    assert cache.is_cacheable({'report': 'ok'})
+
+
+def test_lru_eviction_respects_max_bytes(tmp_path):
+    store = SQLiteLRUStore(str(tmp_path / "lru.sqlite"), max_bytes=250)
+    store.put('a', b'a' * 100)
+    store.put('b', b'b' * 100)
+    store.get('a')
+    store.put('c', b'c' * 100)
+    assert store.get('b') is None
+    assert store.get('a') is not None and store.get('c') is not None
+    assert store.total_bytes() <= 250
@@ -0,0 +1,77 @@
+import time
+import asyncio
+
+from core.prompt_engine import PromptEngine
+from core.step_executor import PythonStepExecutor, compile_step_code
+
+
+def test_step_code_is_compiled_once_per_source():
+    executor = PythonStepExecutor()
+    step = {'name': 'double', 'type': 'python', 'code': "result = context['x'] * 2"}
+    compile_step_code.cache_clear()
+    executor.precompile({'processing_steps': [step, {'name': 'bad', 'type': 'python', 'code': 'def ('}]})
+    for x in range(5):
+        assert asyncio.run(executor.run(step, {'x': x})) == x * 2
+    info = compile_step_code.cache_info()
+    assert info.misses == 2 and info.hits == 5
+
+
+def test_process_executor_merges_writes_and_keeps_loop_free():
+    engine = PromptEngine()
+    context = {'inputs': {'n': 200000}, 'processor': lambda: None}
+    steps = [
+        {'name': 'heavy', 'type': 'python', 'executor': 'process', 'timeout': 60,
+         'code': "context['total'] = sum(range(context['inputs']['n']))\nresult = 'processor' in context"},
+        {'name': 'reader', 'type': 'python', 'code': "result = context['total']"},
+    ]
+    try:
+        results = asyncio.run(engine._execute_pipeline(steps, context))
+    finally:
+        engine.step_executor.shutdown()
+    # The unpicklable processor is not sent to the worker
+    assert results == {'heavy': False, 'reader': sum(range(200000))}
+    assert context['total'] == sum(range(200000))
+
+
+def test_process_executor_timeout_does_not_block_loop():
+    executor = PythonStepExecutor(max_workers=1)
+    step = {'name': 'stuck', 'type': 'python', 'executor': 'process', 'timeout': 2,
+            'code': "import time\ntime.sleep(60)"}
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.05)
+
+    async def main():
+        tick_task = asyncio.create_task(ticker())
+        result = await executor.run(step, {})
+        tick_task.cancel()
+        return result
+
+    try:
+        result = asyncio.run(main())
+    finally:
+        executor.shutdown()
+    assert result['success'] is False and 'timed out' in result['error']
+    assert len(ticks) > 10
+
+
+def test_a_timed_out_step_does_not_break_steps_running_in_the_shared_pool():
+    executor = PythonStepExecutor(max_workers=2)
+    stuck = {'name': 'stuck', 'type': 'python', 'executor': 'process', 'timeout': 1,
+             'code': "import time\ntime.sleep(60)"}
+    slow = {'name': 'slow', 'type': 'python', 'executor': 'process',
+            'code': "import time\ntime.sleep(2)\nresult = context['x'] + 1"}
+
+    async def main():
+        return await asyncio.gather(executor.run(stuck, {}), executor.run(slow, {'x': 1}))
+
+    started = time.perf_counter()
+    try:
+        timed_out, finished = asyncio.run(main())
+    finally:
+        executor.shutdown()
+    assert 'timed out' in timed_out['error'] and finished == 2
+    assert time.perf_counter() - started < 30
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+from core.cancellation import CancelToken
+from core.pipeline_scheduler import PipelineScheduler
+from core.prompt_engine import PromptEngine
+from core.step_cache import StepResultCache
+
+
+class TimedLLMProcessor:
+    """Stand-in for LLMProcessor; slow for one upstream chunk, records when each prompt finished"""
+
+    def __init__(self):
+        self.finished = {}
+
+    async def process_prompt(self, prompt, timeout=120, **kwargs):
+        await asyncio.sleep(0.6 if 'chunk-0' in prompt else 0.05)
+        self.finished[prompt] = time.perf_counter()
+        if prompt.startswith('Select'):
+            return {'relevant': 'skip' not in prompt, 'chunk': prompt.split(': ', 1)[1]}
+        return {'raw_response': prompt, 'success': True}
+
+
+STEPS = [
+    {'name': 'chunks', 'type': 'python', 'code': "result = ['chunk-0', 'chunk-1 skip', 'chunk-2', 'chunk-3']"},
+    {
+        'name': 'select_chunks', 'type': 'llm', 'dependencies': ['chunks'],
+        'foreach': 'dep_chunks', 'input': 'Select: {{item}}', 'concurrency': 4,
+    },
+    {
+        'name': 'extract', 'type': 'llm', 'stream_from': 'select_chunks', 'concurrency': 4,
+        'stream_filter': "if result.get('relevant'):\n    item = {'chunk': source}",
+        'input': 'Extract: {{chunk}}',
+    },
+]
+
+
+def test_stream_consumer_overlaps_upstream_and_keeps_order():
+    engine = PromptEngine(max_foreach_concurrency=8)
+    llm = TimedLLMProcessor()
+    engine.llm_processor = llm
+    results = asyncio.run(engine._execute_pipeline(STEPS, {}))
+
+    assert [r['raw_response'] for r in results['extract']] == [
+        'Extract: chunk-0', 'Extract: chunk-2', 'Extract: chunk-3'
+    ]
+    # Downstream work on fast chunks finished while the slow upstream chunk was still running
+    assert llm.finished['Extract: chunk-2'] < llm.finished['Select: chunk-0']
+
+
+def test_stream_consumer_starts_with_upstream_prerequisites():
+    graph = PipelineScheduler(STEPS).graph
+    assert graph['extract'] == {'chunks'}
+
+
+def test_stream_works_in_sequential_mode():
+    engine = PromptEngine(max_foreach_concurrency=8)
+    engine.llm_processor = TimedLLMProcessor()
+    results = asyncio.run(engine._execute_pipeline(STEPS, {'config': {'scheduler': 'sequential'}}))
+    assert len(results['extract']) == 3
+
+
+def test_only_llm_steps_can_stream():
+    steps = STEPS[:2] + [{'name': 'collect', 'type': 'python', 'stream_from': 'select_chunks',
+                          'code': "result = context['dep_select_chunks']"}]
+    with pytest.raises(ValueError, match="only llm steps can stream"):
+        PipelineScheduler(steps)
+
+
+# The uncached step on model "a" holds the model "b" upstream back (model affinity), but not its
+# consumer: the consumer starts first and waits for the upstream
+HELD_BACK_STEPS = ([{'name': 'other', 'type': 'llm', 'model': 'a', 'cache': False, 'input': 'Other chunk-0'}]
+                   + STEPS[:1] + [dict(step, model='b') for step in STEPS[1:]])
+
+
+def _two_model_engine():
+    engine = PromptEngine(max_foreach_concurrency=8)
+    engine.llm_processor = TimedLLMProcessor()
+    engine._llm_processors = {'a': engine.llm_processor, 'b': engine.llm_processor}
+    return engine
+
+
+def test_stream_consumer_started_before_its_upstream_replays_from_the_step_cache(tmp_path):
+    # The consumer must wait for the upstream's hash to look itself up
+    steps = HELD_BACK_STEPS
+    for run in range(2):
+        engine = _two_model_engine()
+        context = {}
+        results = asyncio.run(engine._execute_pipeline(steps, context,
+                                                       step_cache=StepResultCache(str(tmp_path / "cache"), 10**7)))
+        assert len(results['extract']) == 3
+        # On the first run the upstream ran, so there was nothing to key the consumer with yet
+        assert context['pipeline_metrics']['unkeyed_stream_steps'] == ([] if run else ['extract'])
+    assert context['pipeline_metrics']['cached_steps'] == ['chunks', 'select_chunks', 'extract']
+
+
+def test_cancelling_while_a_consumer_waits_for_its_held_back_upstream_ends_the_run():
+    engine = _two_model_engine()
+    token = CancelToken()
+
+    async def scenario():
+        asyncio.get_running_loop().call_later(0.2, token.cancel, "stop")
+        with token.activate():
+            return await asyncio.wait_for(engine._execute_pipeline(HELD_BACK_STEPS, {}), 5)
+
+    # The upstream never starts once the run is cancelled; the consumer must not wait for it forever
+    results = asyncio.run(scenario())
+    assert 'select_chunks' not in results and 'extract' not in results
@@ -0,0 +1,61 @@
+import asyncio
+
+from jinja2 import Environment, BaseLoader
+
+from core.prompt_engine import PromptEngine
+from core.template_cache import TemplateCache
+
+
+class EchoLLMProcessor:
+    model = "fake-model"
+
+    async def process_prompt(self, prompt, timeout=120, **kwargs):
+        return {'raw_response': prompt, 'success': True}
+
+
+def test_template_compiled_once_per_source():
+    cache = TemplateCache(Environment(loader=BaseLoader()))
+    stats = {}
+    with cache.track(stats):
+        rendered = [cache.render("Chunk: {{ item }}", {'item': i}) for i in range(50)]
+    assert rendered[3] == "Chunk: 3"
+    assert cache.misses == 1 and cache.hits == 49
+    assert stats['template_compiles'] == 1
+    assert stats['template_renders'] == 50
+    assert stats['template_compile_time'] > 0
+
+
+def test_foreach_step_metrics_report_template_times():
+    engine = PromptEngine()
+    engine.llm_processor = EchoLLMProcessor()
+    steps = [
+        {'name': 'items', 'type': 'python', 'code': "result = list(range(20))"},
+        {'name': 'fan_out', 'type': 'llm', 'dependencies': ['items'], 'foreach': "dep_items",
+         'input': 'Item {{ item }} of {{ dep_items | length }}', 'concurrency': 4},
+    ]
+    context = {}
+    results = asyncio.run(engine._execute_pipeline(steps, context))
+    assert results['fan_out'][5]['raw_response'] == 'Item 5 of 20'
+    step_metrics = context['pipeline_metrics']['steps']['fan_out']
+    assert step_metrics['template_compiles'] == 1
+    assert step_metrics['template_renders'] == 20
+
+
+def test_collect_templates_covers_steps_and_outputs():
+    config = {
+        'processing_steps': [
+            {'name': 'code', 'type': 'python', 'code': "result = '{{ not a template }}'"},
+            {'name': 'ask', 'type': 'llm', 'input': 'Q: {{ inputs.question }}'},
+        ],
+        'outputs': [
+            {'type': 'json', 'filename': 'out_{{ timestamp }}.json', 'condition': 'step_results.ask',
+             'data': {'answer': '{{ step_results.ask.raw_response }}'}},
+        ],
+    }
+    sources = TemplateCache.collect_templates(config)
+    assert sources == [
+        'Q: {{ inputs.question }}',
+        '{{ step_results.ask }}',
+        'out_{{ timestamp }}.json',
+        '{{ step_results.ask.raw_response }}',
+    ]
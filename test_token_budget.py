@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from core.llm_processor import LLMProcessor
+from core.prompt_engine import PromptEngine
+from core.token_budget import PromptTooLarge, TokenBudget, TokenCounter
+
+
+class WordCounter(TokenCounter):
+    """One token per word, so budgets in the tests are easy to reason about"""
+
+    def count(self, text):
+        return len(text.split())
+
+
+def test_plan_rounds_up_to_the_smallest_bucket_that_fits():
+    budget = TokenBudget((2048, 8192, 32768), WordCounter(), template_tokens=0)
+    assert budget.plan("is this relevant", 256) == {'num_ctx': 2048, 'num_predict': 256, 'prompt_tokens': 3}
+    assert budget.plan("word " * 3000, 4096)['num_ctx'] == 8192
+    # Only room for part of the expected answer: the answer is capped
+    assert budget.plan("word " * 32000, 4096) == {'num_ctx': 32768, 'num_predict': 768, 'prompt_tokens': 32000}
+    with pytest.raises(PromptTooLarge) as error:
+        budget.plan("word " * 32600, 4096)
+    assert error.value.prompt_tokens == 32600 and error.value.max_prompt_tokens == 32768 - 256
+
+
+def test_plan_joins_a_larger_bucket_that_is_already_busy():
+    budget = TokenBudget((2048, 8192, 32768), WordCounter(), template_tokens=0)
+    budget.begin(8192)
+    assert budget.plan("short", 256)['num_ctx'] == 8192
+    budget.end(8192)
+    assert budget.plan("short", 256)['num_ctx'] == 2048
+
+
+def test_split_text_keeps_every_piece_within_budget():
+    budget = TokenBudget((64,), WordCounter())
+    paragraphs = ["\n".join(" ".join(f"w{p}{l}{w}" for w in range(6)) for l in range(5)) for p in range(4)]
+    pieces = budget.split_text("\n\n".join(paragraphs) + "\n\n" + "x" * 10, 12)
+    assert all(WordCounter().count(piece) <= 12 for piece in pieces)
+    assert " ".join(" ".join(pieces).split()) == " ".join(" ".join(paragraphs + ["x" * 10]).split())
+
+
+class RecordingLLMProcessor(LLMProcessor):
+    def __init__(self, buckets=(2048, 8192, 32768)):
+        super().__init__(model="fake")
+        self.budget = TokenBudget(buckets, WordCounter(), template_tokens=0)
+        self.calls = []
+
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        self.calls.append((prompt, options))
+        return {'raw_response': f"{len(prompt.split())} words", 'success': True}
+
+
+def test_small_prompts_get_small_windows_and_oversized_ones_fail_fast():
+    processor = RecordingLLMProcessor()
+    result = asyncio.run(processor.process_prompt("is this relevant?", 5, max_tokens=100))
+    assert result['success']
+    assert processor.calls[0][1] == {'temperature': 0.1, 'num_ctx': 2048, 'num_predict': 100}
+
+    result = asyncio.run(processor.process_prompt("word " * 40000, 5))
+    assert not result['success'] and result['too_large'] and result['prompt_tokens'] == 40000
+    assert len(processor.calls) == 1
+
+
+PIPELINE = """
+name: "overflow_test"
+processing_steps:
+  - name: "make_items"
+    type: python
+    code: |
+      result = ['short item', '\\n'.join(' '.join('w' for _ in range(100)) for _ in range(5))]
+  - name: "summarise"
+    type: llm
+    dependencies: [make_items]
+    foreach: dep_make_items
+    overflow: split
+    max_tokens: 100
+    input: "Summarise: {{ item }}"
+"""
+
+
+def test_foreach_overflow_split_runs_an_oversized_item_in_parts(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    engine.llm_processor = RecordingLLMProcessor(buckets=(320,))
+
+    result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+    assert result['success'], result.get('error')
+    short, long = result['pipeline_results']['summarise']
+    assert short['raw_response'] == "3 words"
+    # 500 words with 220 tokens of room per prompt: lines of 100 are packed two to a part
+    assert long['success'] and long['split'] == 3
+    assert [part['raw_response'] for part in long['parts']] == ["201 words", "201 words", "101 words"]
+
+
+class InFlightLLMProcessor(RecordingLLMProcessor):
+    def __init__(self, buckets):
+        super().__init__(buckets)
+        self.in_flight = self.peak = 0
+
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.02)
+        self.in_flight -= 1
+        return await super()._process_prompt(prompt, timeout, breakdown, images, stream, options)
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_split_parts_stay_within_the_step_concurrency(tmp_path, concurrency):
+    long_item = "'\\\\n'.join(' '.join('w' for _ in range(100)) for _ in range(5))"
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE.replace("['short item', ", f"[{long_item}, ")
+                        .replace("overflow: split", f"overflow: split\n    concurrency: {concurrency}"),
+                        encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    engine.llm_processor = InFlightLLMProcessor(buckets=(320,))
+
+    result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+    assert result['success'], result.get('error')
+    assert [r['split'] for r in result['pipeline_results']['summarise']] == [3, 3]
+    assert engine.llm_processor.peak == concurrency
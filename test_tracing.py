@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from core.llm_processor import LLMProcessor
+from core.prompt_engine import PromptEngine
+from core.tracing import Tracer, span
+
+PIPELINE = """
+name: "trace_test"
+inputs:
+  - name: "topic"
+    type: "text"
+    default: "meters"
+processing_steps:
+  - name: "make_items"
+    type: python
+    code: "result = ['a', 'b', 'c']"
+  - name: "fan_out"
+    type: llm
+    dependencies: [make_items]
+    foreach: dep_make_items
+    concurrency: 3
+    input: "Describe {{ item }} for {{ inputs.topic }}"
+outputs:
+  - type: "text"
+    filename: "trace_report.txt"
+    content: "{{ step_results.fan_out | length }}"
+"""
+
+
+class SleepyLLMProcessor(LLMProcessor):
+    """LLMProcessor with the ollama call replaced by a short sleep"""
+
+    async def _process_prompt(self, prompt, timeout, breakdown, images=None, stream=False, options=None):
+        await asyncio.sleep(0.05)
+        return {'raw_response': prompt.upper(), 'success': True}
+
+
+def test_run_writes_chrome_trace_and_summary(tmp_path):
+    pipeline = tmp_path / "pipeline.yaml"
+    pipeline.write_text(PIPELINE, encoding='utf-8')
+    engine = PromptEngine(outputs_dir=str(tmp_path / "outputs"), interactive=False)
+    engine.llm_processor = SleepyLLMProcessor(model="tiny")
+    result = asyncio.run(engine.run_prompt(str(pipeline), checkpoint=False))
+    assert result['success'], result.get('error')
+
+    trace_path, summary_path = result['trace_files']
+    with open(trace_path, encoding='utf-8') as f:
+        events = [e for e in json.load(f)['traceEvents'] if e['ph'] == 'X']
+    by_category = {}
+    for event in events:
+        by_category.setdefault(event['cat'], []).append(event)
+    assert {e['name'] for e in by_category['step']} == {'make_items', 'fan_out'}
+    assert sorted(e['args']['foreach_index'] for e in by_category['foreach_item']) == [0, 1, 2]
+    llm_calls = by_category['llm']
+    assert len(llm_calls) == 3
+    assert all(e['args']['step'] == 'fan_out' and e['args']['model'] == 'tiny' for e in llm_calls)
+    assert {e['args']['foreach_index'] for e in llm_calls} == {0, 1, 2}
+    # Concurrent items are drawn on separate lanes so their spans do not overlap within a lane
+    assert len({e['tid'] for e in by_category['foreach_item']}) == 3
+    assert 'outputs' in by_category and 'python' in by_category
+
+    with open(summary_path, encoding='utf-8') as f:
+        summary = f.read()
+    assert 'llm_call' in summary and 'Critical path' in summary
+
+
+def test_span_is_noop_without_active_tracer():
+    with span('anything', 'llm', model='x') as attrs:
+        attrs['extra'] = 1
+    tracer = Tracer('run')
+    with tracer.activate():
+        with span('outer', 'step', step='s1'):
+            with span('inner', 'llm'):
+                pass
+    inner = next(s for s in tracer.spans if s['name'] == 'inner')
+    assert inner['args'] == {'step': 's1'}